@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import sys
+import time
+import random
+import string
+import platform
+import multiprocessing
+from .cap import Cap
+from .leet import Leet
+from .pend import Pend
+from .perm import Perm
+from .mangler import Mangler
+from .stats import Stats
+from .output import OutputWriter
+from .policy import PasswordPolicy
+from .errors import PasswordStretcherError
+from .utils import int_to_human, bytes_to_human
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# synthetic wordlists: (shortest word, longest word, characters)
+distributions = {
+    'short': (4, 6, string.ascii_lowercase),
+    'mixed': (4, 16, string.ascii_letters + string.digits),
+    'long': (12, 24, string.ascii_lowercase + string.digits),
+}
+
+
+def synthetic_wordlist(distribution, size, seed=0):
+    '''
+    returns a reproducible list of random words, sorted by length like Mangler does
+    '''
+
+    shortest, longest, chars = distributions[distribution]
+    rng = random.Random(f'{distribution}:{seed}')
+
+    words = dict()
+    while len(words) < size:
+        length = rng.randint(shortest, longest)
+        words[''.join(rng.choices(chars, k=length)).encode()] = None
+
+    words = list(words)
+    words.sort(key=len)
+    return words
+
+
+def peak_rss():
+    '''
+    peak memory usage of this process in bytes, or None if it can't be measured
+    this only ever goes up, so each benchmark runs in its own process (see isolated())
+    '''
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def isolated(benchmark):
+    '''
+    runs a benchmark in a forked child process and returns its result
+    so the peak RSS is the benchmark's own, not the biggest one before it
+
+    the child starts out with a copy of our memory, which is reported as 'baseline_rss'
+    without fork the benchmark runs here and the peaks can only be compared with the ones before it
+    '''
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        result = benchmark()
+        result['baseline_rss'] = None
+        return result
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    child = context.Process(target=_isolated_child, args=(benchmark, sender))
+    child.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    finally:
+        receiver.close()
+        child.join()
+
+    if result is None:
+        raise PasswordStretcherError(f'Benchmark process exited with code {child.exitcode}')
+    return result
+
+
+def _isolated_child(benchmark, sender):
+
+    baseline = peak_rss()
+    result = benchmark()
+    result['baseline_rss'] = baseline
+    sender.send(result)
+    sender.close()
+
+
+def measure(name, distribution, words_in, candidates):
+    '''
+    consumes an iterable of candidates and times it
+    '''
+
+    count = 0
+    total_bytes = 0
+    start = time.perf_counter()
+    for candidate in candidates:
+        count += 1
+        total_bytes += len(candidate) + 1
+    seconds = max(time.perf_counter() - start, 1e-9)
+
+    return {
+        'name': name,
+        'distribution': distribution,
+        'words_in': words_in,
+        'candidates': count,
+        'bytes': total_bytes,
+        'seconds': seconds,
+        'candidates_per_sec': count / seconds,
+        'bytes_per_sec': total_bytes / seconds,
+        'peak_rss': peak_rss(),
+    }
+
+
+def benchmark_policy(name, distribution, policy, candidates):
+    '''
+    candidates are counted as they're checked, whether or not they pass
+    '''
+
+    meets_policy = policy.meets_policy
+    start = time.perf_counter()
+    passed = sum([1 for candidate in candidates if meets_policy(candidate)])
+    seconds = max(time.perf_counter() - start, 1e-9)
+    total_bytes = sum([len(c) + 1 for c in candidates])
+
+    return {
+        'name': name,
+        'distribution': distribution,
+        'words_in': len(candidates),
+        'candidates': len(candidates),
+        'passed': passed,
+        'bytes': total_bytes,
+        'seconds': seconds,
+        'candidates_per_sec': len(candidates) / seconds,
+        'bytes_per_sec': total_bytes / seconds,
+        'peak_rss': peak_rss(),
+    }
+
+
+def benchmark_writer(name, distribution, candidates, batch_size=65536):
+
+    with open(os.devnull, 'wb') as f:
+        writer = OutputWriter(f, batch_size=batch_size)
+        start = time.perf_counter()
+        writer.write(candidates)
+        writer.close()
+        seconds = max(time.perf_counter() - start, 1e-9)
+
+    return {
+        'name': name,
+        'distribution': distribution,
+        'words_in': len(candidates),
+        'candidates': writer.written_count,
+        'bytes': writer.bytes_written,
+        'seconds': seconds,
+        'candidates_per_sec': writer.written_count / seconds,
+        'bytes_per_sec': writer.bytes_written / seconds,
+        'peak_rss': peak_rss(),
+    }
+
+
+def benchmark_chain(name, distribution, words, **options):
+    '''
+    the whole chain, written to /dev/null like a real run
+    the time is broken down into each stage with the same counters as --profile (see Stats)
+    '''
+
+    mangler = Mangler(words, **options)
+    with open(os.devnull, 'wb') as f:
+        writer = OutputWriter(f)
+        stats = Stats(mangler, writer, status=False)
+        start = time.perf_counter()
+        writer.write(mangler)
+        writer.close()
+        seconds = max(time.perf_counter() - start, 1e-9)
+    report = stats.report(writer)
+
+    stages = report['stages']
+    stages.append({'name': 'output', 'seconds': report['writer_seconds'] + report['output_blocked_seconds']})
+
+    return {
+        'name': name,
+        'distribution': distribution,
+        'words_in': len(words),
+        'candidates': writer.written_count,
+        'bytes': writer.bytes_written,
+        'seconds': seconds,
+        'candidates_per_sec': writer.written_count / seconds,
+        'bytes_per_sec': writer.bytes_written / seconds,
+        'peak_rss': peak_rss(),
+        'stages': stages,
+    }
+
+
+def run_benchmarks(size=2000, chain_size=1000000, progress=None):
+    '''
+    runs every benchmark over every synthetic wordlist
+    returns a JSON-serializable report
+    '''
+
+    results = []
+
+    def record(benchmark):
+        result = isolated(benchmark)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+
+    for distribution in distributions:
+        words = synthetic_wordlist(distribution, size)
+
+        # each mutator on its own, with its default limit
+        record(lambda: measure('perm', distribution, len(words), Perm(words)))
+        subset = words[:max(1, int(size ** .5) * 10)]
+        record(lambda: measure('perm (depth 2)', distribution, len(subset), Perm(subset, perm_depth=2)))
+        record(lambda: measure('leet', distribution, len(words), Leet(words)))
+        record(lambda: measure('cap', distribution, len(words), Cap(words)))
+        record(lambda: measure('capswap', distribution, len(words), Cap(words, capswap=True)))
+        record(lambda: measure('append/prepend', distribution, len(words), Pend(words[:max(1, size // 4)])))
+
+        # policy checks and the output loop, on a realistic set of candidates
+        candidates = list(Pend(Cap(words[:max(1, size // 10)]), limit=256))
+        record(lambda: benchmark_policy('policy (length)', distribution, PasswordPolicy(minlength=8, maxlength=16), candidates))
+        record(lambda: benchmark_policy('policy (charsets)', distribution, PasswordPolicy(minlength=8, mincharsets=3), candidates))
+        record(lambda: benchmark_writer('write', distribution, candidates))
+        del candidates
+
+        # everything together
+        record(lambda: benchmark_chain('leet+capswap+pend', distribution, words, output_size=chain_size, leet=True, capswap=True, pend=True))
+        policy = PasswordPolicy(minlength=10, mincharsets=3)
+        record(lambda: benchmark_chain('leet+capswap+pend (policy)', distribution, words, output_size=chain_size, leet=True, capswap=True, pend=True, policy=policy))
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'size': size,
+        'chain_size': chain_size,
+        'results': results,
+    }
+
+
+def print_result(result, stream=None):
+
+    if stream is None:
+        stream = sys.stderr
+    rss = '' if result['peak_rss'] is None else bytes_to_human(result['peak_rss'])
+    stream.write(
+        f'    {result["distribution"]:<8}{result["name"]:<30}{int_to_human(int(result["candidates_per_sec"])):>10}/s'
+        f'{bytes_to_human(int(result["bytes_per_sec"])):>12}/s{result["seconds"]:>10.3f}s{rss:>12}\n'
+    )
+    for stage in result.get('stages', []):
+        share = stage['seconds'] / max(result['seconds'], 1e-9)
+        stream.write(f'    {"":<8}  {stage["name"]:<28}{"":>26}{stage["seconds"]:>10.3f}s{share:>11.0%}\n')
+
+
+def print_header(stream=None):
+
+    if stream is None:
+        stream = sys.stderr
+    stream.write(f'    {"words":<8}{"benchmark":<30}{"candidates":>12}{"bytes":>14}{"time":>11}{"peak RSS":>12}\n')
@@ -2,7 +2,9 @@
 
 # by TheTechromancer
 
-from .mutator import Mutator
+import string
+from .policy import PasswordPolicy
+from .mutator import Mutator, likelihood_to_cost, ranked_product
 
 
 class Cap(Mutator):
@@ -12,6 +14,14 @@ class Cap(Mutator):
     scale = 2
     fname = 'capitalization'
 
+    # rough likelihood that a person would swap the case of a letter, by position
+    # the first letter is by far the most common, followed by the last
+    swap_cost_first = likelihood_to_cost(.4)
+    swap_cost_last = likelihood_to_cost(.15)
+    swap_cost_middle = likelihood_to_cost(.08)
+
+    letters = string.ascii_letters.encode()
+
     def __init__(self, _input, limit=256, capswap=False):
 
         self.capswap = capswap
@@ -19,6 +29,9 @@ class Cap(Mutator):
 
         super().__init__(_input, limit)
 
+        # returns the bytes allowed at each position of a result (see MaskChoices)
+        self.mask_choices = None
+
 
     def __len__(self):
 
@@ -30,30 +43,73 @@ class Cap(Mutator):
 
     def mutate(self, word):
 
+        allowed = None
+        if self.mask_choices is not None:
+            allowed = self.mask_choices(word)
+
         # always yield the most likely candidates first
         results = []
         for r in [word, word.lower(), word.upper(), word.swapcase(), word.capitalize(), word.title()]:
             if r not in results:
                 results.append(r)
-                yield r
+                if allowed is None or all([b in a for b, a in zip(r, allowed)]):
+                    yield r
 
         # then move on to full cap mutations if requested
         if self.capswap:
-            for r in self._capswap(word):
+            for r in self._capswap(word, allowed):
                 if not r in results:
                     yield r
 
 
-    def _capswap(self, word):
-
-         # many recursions make light work
-        if len(word) == 1:
-            yield word
-            if word.isalpha():
-                yield word.swapcase()
+    def count(self, word):
 
+        if self.capswap:
+            # every case combination of the letters
+            return 2 ** (len(word) - len(word.translate(None, self.letters)))
         else:
-            mid_point = int(len(word)/2)
-            for right_half in self._capswap(word[mid_point:]):
-                for left_half in self._capswap(word[:mid_point]):
-                    yield left_half + right_half
+            return len(set([word, word.lower(), word.upper(), word.swapcase(), word.capitalize(), word.title()]))
+
+
+    def byte_changes(self):
+
+        return {b: {bytes([b]).swapcase()[0]} for b in self.letters}
+
+
+    def reachable_charsets(self, charset):
+
+        # any letter can end up as either case
+        alpha = PasswordPolicy.charset_flags['loweralpha'] | PasswordPolicy.charset_flags['upperalpha']
+        if charset & alpha:
+            charset |= alpha
+        return charset
+
+
+    def _capswap(self, word, allowed=None):
+        '''
+        yields every case combination of the word, most probable first
+        optionally only the ones with an allowed byte at each position
+        '''
+
+        last = len(word) - 1
+        options = []
+        for i in range(len(word)):
+            char = word[i:i+1]
+            if char.isalpha():
+                if i == 0:
+                    cost = self.swap_cost_first
+                elif i == last:
+                    cost = self.swap_cost_last
+                else:
+                    cost = self.swap_cost_middle
+                options.append([(0, char), (cost, char.swapcase())])
+            else:
+                options.append([(0, char)])
+
+        if allowed is not None:
+            for i, a in enumerate(allowed):
+                options[i] = [(cost, char) for cost, char in options[i] if char[0] in a]
+                if not options[i]:
+                    return
+
+        yield from ranked_product(options)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import json
+import time
+from pathlib import Path
+from .errors import CheckpointError
+
+
+class Checkpoint():
+    '''
+    periodically saves how far the mangler has gotten, so an interrupted run can be resumed
+    the position is only saved after all the output before it has been flushed
+    '''
+
+    # bump this whenever the format of the checkpoint file changes
+    version = 2
+
+    def __init__(self, filename, mangler, interval=60):
+
+        self.filename = Path(filename)
+        self.mangler = mangler
+        # minimum number of seconds between saves
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+        if mangler.workers > 1 and not mangler.ordered:
+            raise CheckpointError('Checkpoints need ordered output, please don\'t use --unordered')
+        mangler.track_position = True
+
+
+    def update(self, writer):
+        '''
+        called by OutputWriter after each batch
+        '''
+
+        if time.monotonic() - self.last_save >= self.interval:
+            writer.stream.flush()
+            self.save(writer)
+
+
+    def save(self, writer, finished=False):
+
+        state = self.mangler.checkpoint()
+        state.update({
+            'version': self.version,
+            'fingerprint': self.mangler.fingerprint(),
+            'written': writer.written_count,
+            # where the output file ends (see OutputFile)
+            'output_offset': getattr(writer.stream, 'offset', None),
+            'finished': finished,
+        })
+
+        # write to a temporary file first so a crash can't leave us with half a checkpoint
+        tmp_file = self.filename.with_name(f'.{self.filename.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.filename)
+        except OSError as e:
+            raise CheckpointError(f'Failed to save checkpoint to {self.filename}: {e}')
+
+        self.last_save = time.monotonic()
+
+
+    @classmethod
+    def load(cls, filename, mangler):
+        '''
+        reads a checkpoint and makes sure it belongs to the same run
+        '''
+
+        try:
+            with open(filename) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CheckpointError(f'Failed to read checkpoint from {filename}: {e}')
+
+        if not isinstance(state, dict) or state.get('version', None) != cls.version:
+            raise CheckpointError(f'Unsupported checkpoint format in {filename}')
+        if state['fingerprint'] != mangler.fingerprint():
+            raise CheckpointError('Checkpoint is for a different input or different options')
+        if state['workers'] != mangler.workers:
+            raise CheckpointError(f'Checkpoint was made with --workers {state["workers"]}, please use the same number')
+
+        return state
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import math
+import sqlite3
+import tempfile
+from hashlib import blake2b
+from .errors import DedupError
+from .utils import bytes_to_human
+
+
+class BloomFilter():
+    '''
+    fixed-size probabilistic set
+    may report a word as seen when it isn't (at roughly fp_rate), but never the opposite
+    '''
+
+    def __init__(self, capacity, fp_rate=0.001):
+
+        self.capacity = max(1, int(capacity))
+        self.fp_rate = fp_rate
+
+        # optimal number of bits and hash functions for the given capacity and error rate
+        self.num_bits = max(8, int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        size = (self.num_bits + 7) // 8
+        try:
+            self.bits = bytearray(size)
+        except (MemoryError, OverflowError):
+            raise DedupError(f'Not enough memory for a bloom filter of {bytes_to_human(size)} ({self.capacity:,} words), try a smaller --limit or a higher --dedup-fp-rate')
+
+
+    def add(self, word):
+        '''
+        adds a word to the filter
+        returns True if it was (probably) already there
+        '''
+
+        digest = int.from_bytes(blake2b(word, digest_size=16).digest(), 'little')
+        h1 = digest & 0xffffffffffffffff
+        h2 = (digest >> 64) | 1
+
+        seen = True
+        bits = self.bits
+        num_bits = self.num_bits
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % num_bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not bits[byte] & mask:
+                seen = False
+                bits[byte] |= mask
+
+        return seen
+
+
+    def __contains__(self, word):
+
+        digest = int.from_bytes(blake2b(word, digest_size=16).digest(), 'little')
+        h1 = digest & 0xffffffffffffffff
+        h2 = (digest >> 64) | 1
+
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % self.num_bits
+            if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+
+    def __len__(self):
+        '''
+        size of the filter in bytes
+        '''
+
+        return len(self.bits)
+
+
+
+class Dedup():
+    '''
+    base class for output deduplication backends
+    '''
+
+    # friendly name to describe backend
+    fname = 'dedup'
+
+    def __init__(self):
+
+        # number of duplicate words suppressed
+        self.duplicates = 0
+
+
+    def __str__(self):
+
+        return self.fname
+
+
+    def wrap(self, words):
+
+        for word in words:
+            if self.add(word):
+                self.duplicates += 1
+            else:
+                yield word
+
+
+    def add(self, word):
+        '''
+        override in child class
+        returns True if the word has already been seen
+        '''
+
+        return False
+
+
+    def close(self):
+
+        pass
+
+
+    @staticmethod
+    def create(backend, capacity, fp_rate=0.001, memory_limit=10000000):
+        '''
+        backend can be "exact", "bloom", or "disk"
+        capacity is the maximum number of words expected
+        '''
+
+        if backend == 'exact':
+            return ExactDedup()
+        elif backend == 'bloom':
+            return BloomDedup(capacity, fp_rate=fp_rate)
+        elif backend == 'disk':
+            return DiskDedup(capacity, memory_limit=memory_limit, fp_rate=fp_rate)
+        raise ValueError(f'Invalid dedup backend: "{backend}"')
+
+
+class ExactDedup(Dedup):
+    '''
+    in-memory hash set
+    '''
+
+    fname = 'exact'
+
+    def __init__(self):
+
+        super().__init__()
+        self.seen = set()
+
+
+    def add(self, word):
+
+        num_seen = len(self.seen)
+        self.seen.add(word)
+        return len(self.seen) == num_seen
+
+
+class BloomDedup(Dedup):
+    '''
+    fixed-size bloom filter
+    a small fraction of unique words (fp_rate) will be wrongly suppressed
+    '''
+
+    fname = 'bloom'
+
+    def __init__(self, capacity, fp_rate=0.001):
+
+        super().__init__()
+        self.seen = BloomFilter(capacity, fp_rate=fp_rate)
+
+
+    def add(self, word):
+
+        return self.seen.add(word)
+
+
+class DiskDedup(Dedup):
+    '''
+    exact deduplication for very large runs
+    words are kept in memory until there are <memory_limit> of them, then spilled to an sqlite database
+    a bloom filter over the spilled words means most new words never touch the disk
+    '''
+
+    fname = 'disk'
+
+    # the bloom filter is sized for at most this many times <memory_limit> words
+    # past that, its false-positive rate goes up, which only means more lookups on disk
+    max_filter_spills = 10
+
+    def __init__(self, capacity, memory_limit=10000000, fp_rate=0.001):
+
+        super().__init__()
+        self.memory_limit = max(1, memory_limit)
+        self.capacity = min(capacity, self.memory_limit * self.max_filter_spills)
+        self.fp_rate = fp_rate
+        self.seen = set()
+        # created on the first spill (see spill())
+        self.spilled = None
+        self.num_spilled = 0
+
+        fd, self.db_file = tempfile.mkstemp(prefix='password-stretcher-', suffix='.db')
+        os.close(fd)
+        self.db = sqlite3.connect(self.db_file)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE IF NOT EXISTS words (word BLOB PRIMARY KEY) WITHOUT ROWID')
+
+
+    def add(self, word):
+
+        if word in self.seen:
+            return True
+
+        if self.num_spilled and word in self.spilled:
+            if self.db.execute('SELECT 1 FROM words WHERE word = ?', (word,)).fetchone() is not None:
+                return True
+
+        self.seen.add(word)
+        if len(self.seen) >= self.memory_limit:
+            self.spill()
+        return False
+
+
+    def spill(self):
+
+        if self.spilled is None:
+            self.spilled = BloomFilter(self.capacity, fp_rate=self.fp_rate)
+        for word in self.seen:
+            self.spilled.add(word)
+        self.db.executemany('INSERT OR IGNORE INTO words VALUES (?)', ((word,) for word in self.seen))
+        self.db.commit()
+        self.num_spilled += len(self.seen)
+        self.seen.clear()
+
+
+    def close(self):
+
+        self.db.close()
+        try:
+            os.remove(self.db_file)
+        except OSError:
+            pass
@@ -12,4 +12,16 @@ class InputListError(PasswordStretcherError):
     pass
 
 class PasswordAnalyzerError(PasswordStretcherError):
-    pass
\ No newline at end of file
+    pass
+
+class CheckpointError(PasswordStretcherError):
+    pass
+
+class RuleError(PasswordStretcherError):
+    pass
+
+class MaskError(PasswordStretcherError):
+    pass
+
+class DedupError(PasswordStretcherError):
+    pass
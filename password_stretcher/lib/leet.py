@@ -2,7 +2,8 @@
 
 # by TheTechromancer
 
-from .mutator import Mutator
+from .policy import PasswordPolicy
+from .mutator import Mutator, likelihood_to_cost, ranked_product
 
 
 class Leet(Mutator):
@@ -14,42 +15,55 @@ class Leet(Mutator):
 
         super().__init__(_input, limit)
 
+        # returns the bytes allowed at each position of a result (see MaskChoices)
+        self.mask_choices = None
+
         # "leet" character swaps - modify as needed.
-        # Keys are replaceable characters; values are their leet replacements
+        # Keys are replaceable characters; values are their leet replacements,
+        # along with a rough likelihood that a person would make that swap
         self.leet_common = self._dict_str_to_bytes({
-            'a': ['@'],
-            'A': ['@'],
-            'e': ['3'],
-            'E': ['3'],
-            'i': ['1'],
-            'I': ['1'],
-            'o': ['0'],
-            'O': ['0'],
-            's': ['5', '$'],
-            'S': ['5', '$'],
-            't': ['7'],
-            'T': ['7']
+            'a': [('@', .3)],
+            'A': [('@', .3)],
+            'e': [('3', .3)],
+            'E': [('3', .3)],
+            'i': [('1', .25)],
+            'I': [('1', .25)],
+            'o': [('0', .35)],
+            'O': [('0', .35)],
+            's': [('5', .2), ('$', .2)],
+            'S': [('5', .2), ('$', .2)],
+            't': [('7', .1)],
+            'T': [('7', .1)]
         })
 
         self.leet_all = self._dict_str_to_bytes({
-            'a': ['4', '@'],
-            'A': ['4', '@'],
-            'b': ['8'],
-            'B': ['8'],
-            'e': ['3'],
-            'E': ['3'],
-            'i': ['1'],
-            'I': ['1'],
-            'l': ['1'],
-            'L': ['1'],
-            'o': ['0'],
-            'O': ['0'],
-            's': ['5', '$'],
-            'S': ['5', '$'],
-            't': ['7'],
-            'T': ['7']
+            'a': [('4', .15), ('@', .3)],
+            'A': [('4', .15), ('@', .3)],
+            'b': [('8', .05)],
+            'B': [('8', .05)],
+            'e': [('3', .3)],
+            'E': [('3', .3)],
+            'i': [('1', .25)],
+            'I': [('1', .25)],
+            'l': [('1', .1)],
+            'L': [('1', .1)],
+            'o': [('0', .35)],
+            'O': [('0', .35)],
+            's': [('5', .2), ('$', .2)],
+            'S': [('5', .2), ('$', .2)],
+            't': [('7', .1)],
+            'T': [('7', .1)]
         })
 
+        # maps each byte to its number of leet replacements, for counting without enumerating
+        self.leet_common_counts = bytes([len(self.leet_common.get(bytes([b]), [])) for b in range(256)])
+
+        # character sets of the leet replacements
+        self.leet_common_charset = 0
+        for swaps in self.leet_common.values():
+            for _, swap in swaps:
+                self.leet_common_charset |= PasswordPolicy().charset(swap)
+
 
     def mutate(self, word):
 
@@ -57,36 +71,64 @@ class Leet(Mutator):
             yield r
 
 
+    def count(self, word):
+
+        counts = word.translate(self.leet_common_counts)
+        # each character contributes a factor of (1 + its number of replacements)
+        total = 1
+        for n in set(counts):
+            total *= (n + 1) ** counts.count(n)
+        return total
+
+
+
+    def byte_changes(self):
 
-    def _leet(self, word, swap_values=None, end=0):
+        changes = dict()
+        for char, swaps in self.leet_common.items():
+            changes[char[0]] = {swap[0] for _, swap in swaps}
+        return changes
+
+
+    def reachable_charsets(self, charset):
+
+        # only letters get swapped
+        if charset & (PasswordPolicy.charset_flags['loweralpha'] | PasswordPolicy.charset_flags['upperalpha']):
+            charset |= self.leet_common_charset
+        return charset
+
+
+
+    def _leet(self, word, swap_values=None):
+        '''
+        yields every leet variation of the word, most probable first
+        '''
 
         if not swap_values:
             swap_values = self.leet_all
 
-        if len(word) == 1:
-            yield word
-            try:
-                for leet_char in swap_values[word]:
-                    yield leet_char
-            except KeyError:
-                pass
+        options = []
+        for i in range(len(word)):
+            char = word[i:i+1]
+            options.append([(0, char)] + swap_values.get(char, []))
+
+        # only swaps that can still match a mask
+        if self.mask_choices is not None:
+            for i, allowed in enumerate(self.mask_choices(word)):
+                options[i] = [(cost, swap) for cost, swap in options[i] if swap[0] in allowed]
+                if not options[i]:
+                    return
 
-        else:
-            mid_point = int(len(word)/2)
-            if end == 0:
-                for right_half in self._leet(word[mid_point:], swap_values=swap_values, end=end^1):
-                    for left_half in self._leet(word[:mid_point], swap_values=swap_values, end=end^1):
-                        yield left_half + right_half
-            else:
-                for left_half in self._leet(word[:mid_point], swap_values=swap_values, end=end^1):
-                    for right_half in self._leet(word[mid_point:], swap_values=swap_values, end=end^1):
-                        yield left_half + right_half
+        yield from ranked_product(options)
 
 
 
     def _dict_str_to_bytes(self, d):
+        '''
+        converts {'a': [('@', .3)]} into {b'a': [(cost, b'@')]}, sorted by cost
+        '''
 
         new_dict = {}
         for key in d:
-            new_dict[key.encode('utf-8')] = [v.encode('utf-8') for v in d[key]]
-        return new_dict
\ No newline at end of file
+            new_dict[key.encode('utf-8')] = sorted([(likelihood_to_cost(p), v.encode('utf-8')) for v, p in d[key]])
+        return new_dict
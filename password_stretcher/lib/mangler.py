@@ -2,24 +2,56 @@
 
 # by TheTechromancer
 
+import math
+import hashlib
+from bisect import bisect_right
 from .cap import Cap
 from .leet import Leet
 from .pend import Pend
 from .perm import Perm
-from functools import reduce
+from .rules import Rules
+from .mutator import expansion_cache
+from .dedup import Dedup
+from .policy import PolicyConstraint
+from .planner import LengthPlan
+from .utils import is_ascii
+from .mask import MaskSet, MaskConstraint, MaskChoices
+from itertools import islice, chain
+from functools import reduce, partial
+from .errors import InputListError, CheckpointError
 
 class Mangler():
 
-    def __init__(self, _input, output_size=None, double=False, perm=0, leet=False, cap=False, capswap=False, pend=False, key=lambda x: x):
+    def __init__(self, _input, output_size=None, double=False, perm=0, leet=False, cap=False, capswap=False, pend=False, pend_model=None, rules=None, policy=None, masks=None, workers=1, ordered=True, shard=None, stream=False, stream_sort=False, stream_estimate=None, dedup=None, dedup_fp_rate=0.001, dedup_memory=10000000, weights=None, key=lambda x: x):
 
-        # load input list into memory and deduplicate
-        if cap and not capswap:
-            self.input = set(Cap(_input))
-        else:
-            self.input = set(_input)
+        # read the input as we go instead of loading it into memory
+        self.stream = stream
+
+        if stream:
+            if perm > 1:
+                raise InputListError('Permutations need the whole wordlist in memory and can\'t be used while streaming')
+            if shard is not None and shard[1] > 1:
+                raise InputListError('Sharding needs the whole wordlist in memory and can\'t be used while streaming')
+            if weights is not None:
+                raise InputListError('Weighted mutations need the whole wordlist in memory and can\'t be used while streaming')
+            from .stream import StreamInput
+            self.input = StreamInput(_input, cap=(cap and not capswap), sort=stream_sort, estimate=stream_estimate)
 
-        self.input = list(self.input)
-        self.input.sort(key=lambda x: len(x))
+        else:
+            # load input list into memory and deduplicate
+            # unlike a set, a dict keeps the words in their original order, so it's the same on every run (see resume())
+            if cap and not capswap:
+                self.input = dict.fromkeys(Cap(_input))
+            else:
+                # files are read in big batches instead of line by line
+                try:
+                    words = chain.from_iterable(_input.batches())
+                except AttributeError:
+                    words = _input
+                self.input = dict.fromkeys(words)
+
+            self.input = list(self.input)
+            self.input.sort(key=len)
 
         self.perm_depth = perm
         self.leet       = leet
@@ -27,6 +59,24 @@ class Mangler():
         self.cap        = cap or capswap
         self.double     = double
         self.pend       = pend
+        # hashcat rule files
+        self.rules      = rules
+        self.policy     = policy
+        # only generate words which match one of these hashcat masks
+        self.masks      = None if not masks else MaskSet(masks)
+        # number of processes to mangle with, and whether to preserve word order
+        self.workers    = max(1, workers)
+        self.ordered    = ordered
+        if self.workers > 1:
+            # fail now rather than after the output has been opened
+            from .parallel import fork_context
+            fork_context()
+        # generate only the Kth of N slices of the output: (K, N)
+        if shard is None:
+            shard = (1, 1)
+        self.shard, self.shards = shard[0] - 1, shard[1]
+        if not 0 <= self.shard < self.shards:
+            raise InputListError(f'Invalid shard: {shard[0]}/{shard[1]}')
 
         self.mutators = [Perm(self.input, double=double, perm_depth=perm)]
 
@@ -35,13 +85,61 @@ class Mangler():
         if self.capswap:
             self.mutators.append(Cap(self.mutators[-1], capswap=True))
         if self.pend:
-            self.mutators.append(Pend(self.mutators[-1]))
+            self.mutators.append(Pend(self.mutators[-1], model=pend_model))
+        if self.rules:
+            self.mutators.append(Rules(self.mutators[-1], self.rules))
+
+        # see block_variants()
+        self._variants = None
+
+        self.push_down_policy()
+        self.push_down_masks()
+
+        # perm credits the ranges its length window skips all at once, instead of generating them
+        perm = self.mutators[0]
+        if perm.length_window is not None and perm.on_prune is not None:
+            perm.on_skip = partial(self.credit_skipped, self.mutators[1:])
+
+        # each input word's share of the mutation budget (see set_weights())
+        self.weights = None
+        self.weight = 1.
+        if weights is not None:
+            self.set_weights(weights)
 
         if output_size:
             self.set_output_size(output_size)
         else:
             self.set_output_size(max(len(self.input)*1000, 100000000))
 
+        # optionally suppress duplicate output ("exact", "bloom", or "disk")
+        self.dedup = None
+        if dedup:
+            # the limit is often far more than we'll ever produce
+            # estimate() counts the words perm skips too, since their budget goes to the words that fit
+            # (so it's still a bound with a length window, see credit_pruned())
+            capacity = self.output_size
+            if dedup != 'exact' and not self.stream:
+                capacity = min(capacity, self.estimate()['words'])
+            self.dedup = Dedup.create(dedup, capacity, fp_rate=dedup_fp_rate, memory_limit=dedup_memory)
+
+        # for checkpointing (see checkpoint())
+        self.track_position = False
+        # number of words yielded so far, before deduplication
+        self.produced = 0
+        # number of words to throw away after resuming
+        self.skip = 0
+        # first chunk and carry-over for each worker process, when resuming
+        self.start_chunk = 0
+        self.carry = None
+        # (permutation index, chunk index, carry-over per worker, words produced) at the last word boundary
+        self.position = (0, 0, None, 0)
+        self._fingerprint = None
+
+        # per-stage counters, if enabled (see instrument())
+        self.meters = None
+        # the latest counters from each worker process
+        self.worker_meters = dict()
+
 
     def __iter__(self):
         '''
@@ -50,8 +148,37 @@ class Mangler():
         yields each mutated word
         '''
 
-        for word in self.mutators[-1]:
-            yield word
+        # words that were already produced before resuming
+        resumed = self.produced + self.skip
+
+        if self.workers > 1:
+            from .parallel import mangle_parallel
+            words = self.metered('workers', mangle_parallel(self))
+        elif self.shards > 1:
+            words = self.mangle_shard()
+        else:
+            if self.track_position:
+                self.mutators[0].on_word = self.mark
+            words = self.filter(self.metered(str(self.mutators[-1]), self.mutators[-1]))
+
+        if self.track_position:
+            words = self.count_produced(words)
+        if self.skip:
+            words = islice(words, self.skip, None)
+
+        # when streaming, the size of the input is only an estimate, so enforce the limit here
+        # (same with weights, since every mutation budget is at least 1 no matter how rare the word)
+        if self.stream or self.weights is not None:
+            words = islice(words, max(0, self.output_size - resumed))
+
+        if self.dedup is not None:
+            try:
+                yield from self.metered('dedup', self.dedup.wrap(words))
+            finally:
+                self.dedup.close()
+
+        else:
+            yield from words
 
 
     def __len__(self):
@@ -59,25 +186,601 @@ class Mangler():
         Estimates the total output length based on requested mangling parameters
         '''
 
-        for m in self.mutators:
-            length *= len(m)
+        return self.estimate()['words']
+
+
+    def estimate(self):
+        '''
+        calculates output size without generating any words
+        each mutator's limit and carry-over are simulated using its per-word variant count
+        exact, unless capswap follows leet (leet swaps out letters, so this is an upper bound)
+        or hashcat rules are used (they can reject words or produce duplicates)
+        policy and mask filtering and deduplication are not taken into account
+        (perm's length window isn't either: words that are skipped give their budget to the words that fit,
+        so with a policy or mask this is only an upper bound)
+
+        permutations of several words aren't generated, just counted (see count_permutations())
+        they're counted out of order, so the carry-over is only approximated if some hit a limit and others don't
+        '''
+
+        mutators = self.mutators[1:]
+        carry = [0] * len(mutators)
+        stage_in = [0] * len(mutators)
+        stage_out = [0] * len(mutators)
+        total_words = 0
+        total_bytes = 0
+        # if some words have more variants than a mutator's limit and others have fewer,
+        # the carry-over depends on the order of the words
+        above = [False] * len(mutators)
+        below = [False] * len(mutators)
+
+        weights = self.weights
+        perm = self.mutators[0]
+
+        if perm.perm_depth > 1:
+            words = self.count_permutations()
+        else:
+            # straight from the input, since iterating perm itself would credit pruned words (see credit_pruned())
+            if self.shards > 1:
+                from .parallel import chunk_size
+                words = chain.from_iterable(chunk for _, chunk in perm.chunks(chunk_size, first=self.shard, step=self.shards))
+            else:
+                words = perm.permutations()
+            words = ((1, len(word), [m.count(word) for m in mutators], (1 if weights is None else weights.get(word, 1.))) for word in words)
+
+        # (number of words, length of each, variants per mutator, weight)
+        for num_words, length, counts, scale in words:
+            # each stage produces a few groups of identical results: (number of inputs, results per input)
+            groups = [(num_words, 1)]
+            for i, mutator in enumerate(mutators):
+                stage_in[i] += num_words
+                limit = mutator.limit if weights is None else max(1, mutator.limit * scale)
+                above[i] = above[i] or counts[i] > limit
+                below[i] = below[i] or counts[i] < limit
+                groups, carry[i] = self.simulate_limit(num_words, counts[i], limit, carry[i])
+                num_words = sum([inputs * results for inputs, results in groups])
+                stage_out[i] += num_words
+
+            total_words += num_words
+            total_bytes += num_words * (length + 1)
+            if mutators:
+                total_bytes += sum([inputs * mutators[-1].added_length(int(results)) for inputs, results in groups])
+
+        exact = not (self.leet and self.capswap) and weights is None and not self.rules and not self.policy and self.masks is None
+        if perm.perm_depth > 1:
+            # permutations are counted out of order
+            exact = exact and self.shards == 1 and not any([a and b for a, b in zip(above, below)])
+
+        return {
+            'words': int(total_words),
+            'bytes': int(total_bytes),
+            # fractional budgets are only approximated
+            'exact': exact,
+            'stages': [(str(m), int(stage_in[i]), int(stage_out[i])) for i, m in enumerate(mutators)],
+        }
+
+
+    def count_permutations(self):
+        '''
+        yields (number of permutations, length of each, variants per mutator, weight), in the same order perm yields them
+        (within each block of perm, permutations with the same number of variants are lumped together)
+        '''
+
+        perm = self.mutators[0]
+        variants = self.block_variants()
+
+        from .parallel import chunk_size
+        for b, block in enumerate(perm.blocks):
+            # the share of this block that ends up in our shard
+            share = 1
+            if self.shards > 1:
+                start, stop = perm.block_offsets[b], perm.block_offsets[b+1]
+                share = (self.shard_size(stop, chunk_size) - self.shard_size(start, chunk_size)) / (stop - start)
+            for counts, scale, n in variants[block]:
+                yield n * share, block[0], counts, scale
+
+
+    def block_variants(self):
+        '''
+        groups the permutations in each block of perm by their number of variants per mutator
+        returns {(total length, number of words): [(variants per mutator, weight, number of permutations), ...]}
+
+        every mutator's variant count either multiplies when words are joined (leet, capitalization) or doesn't depend on the word at all
+        so the counts for all the permutations in a block can be built up from the counts for single words,
+        by joining one representative word from each group
+        '''
+
+        if self._variants is not None:
+            return self._variants
+
+        mutators = self.mutators[1:]
+        weights = self.weights
+        perm = self.mutators[0]
+        perm.build_index()
+
+        # {length: {(variants, weight): [number of words, representative word]}}
+        singles = dict()
+        for word in perm.words:
+            key = (tuple([mutator.count(word) for mutator in mutators]), (1 if weights is None else weights.get(word, 1.)))
+            group = singles.setdefault(len(word), dict()).setdefault(key, [0, word])
+            group[0] += 1
+
+        # permutations of several words aren't weighted (see set_weights())
+        # combos[m] = {variants: [representative word, {total length: number of permutations}]}
+        combos = [None, dict()]
+        for length, groups in singles.items():
+            for (counts, scale), (n, word) in groups.items():
+                lengths = combos[1].setdefault(counts, [word, dict()])[1]
+                lengths[length] = lengths.get(length, 0) + n
+        for m in range(2, perm.perm_depth+1):
+            level = dict()
+            for first, first_lengths in combos[m-1].values():
+                for second, second_lengths in combos[1].values():
+                    word = first + second
+                    counts = tuple([mutator.count(word) for mutator in mutators])
+                    lengths = level.setdefault(counts, [word, dict()])[1]
+                    for length1, n1 in first_lengths.items():
+                        for length2, n2 in second_lengths.items():
+                            lengths[length1 + length2] = lengths.get(length1 + length2, 0) + n1 * n2
+            combos.append(level)
+
+        variants = dict()
+        for length, groups in singles.items():
+            variants[(length, 1)] = sorted([(counts, scale, n) for (counts, scale), (n, _) in groups.items()])
+        for m, level in enumerate(combos[2:], 2):
+            for counts, (_, lengths) in level.items():
+                for total_length, n in lengths.items():
+                    variants.setdefault((total_length, m), []).append((counts, 1., n))
+        for block in variants.values():
+            block.sort()
+
+        self._variants = variants
+        return variants
+
+
+    def shard_size(self, stop, chunk_size):
+        '''
+        how many of the first <stop> permutations are in our shard (see mangle_shard())
+        '''
+
+        cycle = chunk_size * self.shards
+        full, rest = divmod(stop, cycle)
+        return full * chunk_size + min(chunk_size, max(0, rest - self.shard * chunk_size))
+
+
+    @staticmethod
+    def simulate_limit(inputs, results, limit, carry):
+        '''
+        replicates Mutator.__iter__() for <inputs> words which each have <results> mutations
+        returns [(number of inputs, results yielded per input), ...] and the leftover carry-over
+        '''
+
+        if results <= limit:
+            return [(inputs, results)], carry + inputs * (limit - results)
+
+        # each word dips into the carry-over until it runs dry
+        deficit = results - limit
+        full = min(inputs, max(0, carry // deficit))
+        carry -= full * deficit
+        groups = [(full, results)]
+        if full < inputs:
+            # this one gets whatever's left
+            groups.append((1, carry + limit))
+            carry = 0
+            if inputs - full - 1 > 0:
+                groups.append((inputs - full - 1, limit))
+
+        return groups, carry
+
+
+    def set_weights(self, counts):
+        '''
+        gives each input word a share of the mutation budget proportional to its count (e.g. from the spider)
+        so frequent words get lots of mutations and rare words get a few
+        each of the k mutators multiplies its limit by the kth root of the word's count relative to the mean,
+        so the product of the limits is proportional to the count and averages out to 1 (the total stays the same)
+        words that aren't in counts (like permutations of several words) are counted once
+        '''
+
+        mutators = self.mutators[1:]
+        if not mutators:
+            return
+
+        # basic cap mutations change the case of the input
+        lowercase = dict()
+        for word, count in counts.items():
+            lowercase[word.lower()] = lowercase.get(word.lower(), 0) + count
+
+        root = 1 / len(mutators)
+        weights = [counts.get(word, None) or lowercase.get(word.lower(), 1) for word in self.input]
+        # the product of the mutators' limits needs to average out to 1, not each one on its own
+        mean = sum(weights) / max(1, len(weights))
+        self.weights = {word: (weight / mean) ** root for word, weight in zip(self.input, weights)}
+        self._variants = None
+
+        # the first mutator sees each permutated word, and the ones after it inherit its weight
+        mutators[0].scale_limit = self.weigh
+        for mutator in mutators[1:]:
+            mutator.scale_limit = self.current_weight
+
+
+    def weigh(self, word):
+
+        self.weight = self.weights.get(word, 1.)
+        return self.weight
+
+
+    def current_weight(self, word):
+
+        return self.weight
+
+
+    def mangle_shard(self):
+        '''
+        mangles every Nth chunk of permutations, starting with chunk K
+        this is exactly what worker K of N would do with --workers N
+        so the output of all N shards together is the same as the output of --workers N
+        '''
+
+        from .parallel import chunk_size
+
+        start_chunk = max(self.start_chunk, self.shard)
+        for index, chunk in self.mutators[0].chunks(chunk_size, first=start_chunk, step=self.shards):
+            # the start of each chunk is a safe place to resume from
+            self.position = (index * chunk_size, index, [[m.cur_limit for m in self.mutators[1:]]], self.produced)
+            yield from self.mangle(chunk)
+
+
+    def mangle(self, words):
+        '''
+        runs an iterable of permutated words through the mutator chain
+        used by worker processes and shards to mangle their chunks of the input
+        carry-over budgets persist between calls
+        '''
+
+        perm = self.mutators[0]
+        if perm.output_filter is not None:
+            words = perm.prune(words)
+
+        mutators = self.mutators[1:]
+        if not mutators:
+            yield from self.filter(self.metered(str(perm), words))
+
+        else:
+            mutators[0].input = self.metered(str(perm), words)
+            yield from self.filter(self.metered(str(mutators[-1]), mutators[-1]))
+
+
+    def mark(self, index):
+        '''
+        called by perm right before it yields a new word
+        by then, everything from the previous words has been produced, so this is a safe place to resume from
+        '''
+
+        self.position = (index, 0, [[m.cur_limit for m in self.mutators[1:]]], self.produced)
+
+
+    def count_produced(self, words):
+
+        for word in words:
+            self.produced += 1
+            yield word
+
+
+    def checkpoint(self):
+        '''
+        returns the state needed to resume from the last word boundary
+        along with the number of words produced since then, which will be skipped on resume
+        '''
+
+        perm_index, chunk, carry, produced = self.position
+        if carry is None:
+            carry = self.carry
+        return {
+            'perm_index': perm_index,
+            'chunk': chunk,
+            'workers': self.workers,
+            'carry': carry,
+            'produced': produced,
+            'skip': self.produced - produced,
+        }
 
-        return int(length)
 
+    def resume(self, state):
+        '''
+        picks up where checkpoint() left off
+        the same permutation index, carry-over, and input order mean we produce the exact same words
+        output deduplication starts over, so words from before the checkpoint aren't suppressed
+        '''
 
-    def chain_mutators(self, _input=None, mutators=None):
+        carry = state['carry']
+        if carry is not None:
+            if len(carry) != self.workers or any(len(c) != len(self.mutators[1:]) for c in carry):
+                raise CheckpointError('Checkpoint doesn\'t match the mutators in use')
+            if self.workers == 1:
+                for mutator, cur_limit in zip(self.mutators[1:], carry[0]):
+                    mutator.cur_limit = cur_limit
 
-        if mutators is None:
-            mutators = self.mutators
-        if _input is None:
-            _input = self.perm()
+        self.mutators[0].start = state['perm_index']
+        self.start_chunk = state['chunk']
+        self.carry = carry
+        self.produced = state['produced']
+        self.skip = state['skip']
+        self.position = (state['perm_index'], state['chunk'], carry, state['produced'])
+
+
+    def fingerprint(self):
+        '''
+        identifies the options and input for this run, so a checkpoint isn't resumed with different ones
+        '''
 
-        if len(mutators) == 0:
-            return _input
+        if self._fingerprint is None:
+            key = hashlib.sha1()
+            options = [
+                [(str(m), m.limit) for m in self.mutators],
+                self.perm_depth, self.double, self.cap, self.capswap, self.stream, self.output_size, self.shard, self.shards,
+            ]
+            if self.masks is not None:
+                options.append(self.masks.strings)
+            if self.policy:
+                options.append([
+                    self.policy.minlength, self.policy.maxlength, self.policy.mincharsets, self.policy.required_charset,
+                    (None if self.policy.regex is None else self.policy.regex.pattern),
+                ])
+            key.update(repr(options).encode())
+            # a streamed input can't be hashed up front
+            if not self.stream:
+                key.update(b'\n'.join(self.input))
+            for mutator in self.mutators:
+                if isinstance(mutator, Pend):
+                    key.update(b'\n'.join(mutator.prefixes + mutator.suffixes))
+                    if mutator.model is not None:
+                        key.update(mutator.model.fingerprint().encode())
+                elif isinstance(mutator, Rules):
+                    key.update(b'\n'.join(mutator.rules))
+            if self.weights is not None:
+                key.update(repr(sorted(self.weights.items())).encode())
+            self._fingerprint = key.hexdigest()
+
+        return self._fingerprint
+
+
+    def instrument(self):
+        '''
+        wraps each stage in a Meter which counts and times the words going through it (see stats.py)
+        worker processes send their counters back with each chunk
+        '''
+
+        from .stats import Meter
+
+        self.meters = dict()
+        for mutator in self.mutators:
+            meter = Meter(str(mutator))
+            self.meters[meter.name] = meter
+            if mutator.on_prune is not None:
+                mutator.on_prune = meter.counting(mutator.on_prune)
+        perm = self.mutators[0]
+        if perm.on_skip is not None:
+            perm.on_skip = self.meters[str(perm)].counting_skips(perm.on_skip)
+        for i, mutator in enumerate(self.mutators[1:]):
+            mutator.input = self.metered(str(self.mutators[i]), self.mutators[i])
+
+        for name in ('policy', 'workers', 'dedup'):
+            self.meters[name] = Meter(name)
+
+
+    def metered(self, name, words):
+
+        if self.meters is None:
+            return words
+        meter = self.meters[name]
+        meter.input = words
+        return meter
+
+
+    def snapshot(self):
+        '''
+        current counters for each stage
+        '''
+
+        if self.meters is None:
+            return None
+        snapshot = {name: meter.snapshot() for name, meter in self.meters.items()}
+        snapshot['expansion cache'] = expansion_cache.snapshot()
+        return snapshot
+
+
+    def filter(self, words):
+        '''
+        enforces password policy on mangled words
+        '''
 
-        return self.chain_mutators(mutators[0].gen(_input), mutators[1:])
+        if not self.policy and self.masks is None:
+            return words
+        if self.policy and not self.policy_exact:
+            words = self.apply_policy(words)
+        if self.masks is not None and not self.masks_exact:
+            words = self.apply_masks(words)
+        return self.metered('policy', words)
 
 
+    def apply_policy(self, words):
+
+        for word in words:
+            if self.policy.meets_policy(word):
+                yield word
+            else:
+                # if the word didn't meet requirements, increase the limit by 1
+                self.mutators[-1].cur_limit += 1
+
+
+    def apply_masks(self, words):
+
+        matches = self.masks.matches
+        for word in words:
+            if matches(word):
+                yield word
+            else:
+                # same as apply_policy()
+                self.mutators[-1].cur_limit += 1
+
+
+    def push_down_masks(self):
+        '''
+        like push_down_policy(), but for masks
+        leet and capitalization only enumerate the swaps that can still match a mask,
+        and if pend is last, it only applies rules whose prefix and suffix match the ends of a mask
+        if a mutator's changes can't be predicted (e.g. hashcat rules), everything before it is only filtered at the end
+        '''
+
+        # whether everything that comes out of the last mutator is known to match a mask (see filter())
+        self.masks_exact = False
+
+        if self.masks is None:
+            return
+
+        # constraints[i] is for the input to mutator i
+        constraints = [MaskConstraint(self.masks, self.mutators[i:]) for i in range(1, len(self.mutators) + 1)]
+
+        for i, mutator in enumerate(self.mutators[:-1]):
+            constraint = constraints[i]
+            if constraint:
+                mutator.output_filter = both(mutator.output_filter, constraint)
+                if mutator.on_prune is None:
+                    mutator.on_prune = partial(self.credit_pruned, self.mutators[i+1:])
+
+        for i, mutator in enumerate(self.mutators[1:], 1):
+            if hasattr(mutator, 'mask_choices') and constraints[i-1] and constraints[i]:
+                mutator.mask_choices = MaskChoices(constraints[i-1], constraints[i])
+
+        if isinstance(self.mutators[-1], Pend):
+            self.mutators[-1].set_masks(self.masks)
+            self.masks_exact = True
+
+
+    def push_down_policy(self):
+        '''
+        lets mutators skip words that can never meet the policy, instead of filtering them at the end
+        each mutator's results are checked against the policy, relaxed by whatever the mutators after it might change
+        if pend is last, it only applies rules which can produce a valid word
+        '''
+
+        # whether everything that comes out of the last mutator is known to meet the policy (see filter())
+        self.policy_exact = False
+
+        # perm skips over permutations that can't end up the right length without generating them
+        # (only the minimum is safe for non-ASCII words, since the policy counts characters instead of bytes)
+        # mask lengths are always in bytes
+        if not self.stream and (self.policy or self.masks is not None):
+            lengths = None
+            if self.masks is not None and MaskConstraint(self.masks, self.mutators[1:]):
+                lengths = self.masks.lengths
+            plan = LengthPlan(self.policy, self.mutators[1:], check_max=is_ascii(b''.join(self.input)), lengths=lengths)
+            if plan:
+                self.mutators[0].length_window = plan
+
+        if not self.policy:
+            return
+
+        # the last mutator's output is checked by filter()
+        for i, mutator in enumerate(self.mutators[:-1]):
+            constraint = PolicyConstraint(self.policy, self.mutators[i+1:])
+            # leet and capitalization don't change the length, so once perm has checked it there's no need to again
+            if i > 0 and all([m.length_changes() == {0} for m in self.mutators[1:i+1]]):
+                constraint.check_length = False
+            if constraint:
+                mutator.output_filter = constraint
+                mutator.on_prune = partial(self.credit_pruned, self.mutators[i+1:])
+
+        # with no regex, filter() can trust the last mutator if the results are correct by construction:
+        # pend only applies rules that meet the policy, and leet and capitalization don't change the length
+        if self.policy.regex is None and len(self.mutators) > 1:
+            last = self.mutators[-1]
+            if isinstance(last, Pend):
+                last.set_policy(self.policy)
+                self.policy_exact = last.policy_exact
+            elif all([m.length_changes() == {0} for m in self.mutators[1:]]):
+                self.policy_exact = self.policy.mincharsets is None and self.policy.required_charset is None
+
+        elif isinstance(self.mutators[-1], Pend):
+            self.mutators[-1].set_policy(self.policy)
+
+
+    def credit_pruned(self, mutators, word):
+        '''
+        filter() gives back one mutation for every word that doesn't meet the policy
+        a word that was pruned early gets the same treatment, so the output is the same as if it had gone all the way:
+        each of the remaining mutators but the last uses up its budget on the results it would have produced,
+        and the last one gets back its whole limit for each of its inputs, since it would have yielded them all and had them given back
+        '''
+
+        # the first mutator weighs each permutated word, and the ones after it inherit that weight (see set_weights())
+        if self.weights is not None and mutators[0] is self.mutators[1]:
+            scale = self.weights.get(word, 1.)
+        else:
+            scale = self.weight
+
+        words = [word]
+        num_words = 1
+        for i, mutator in enumerate(mutators[:-1]):
+            limit = self.scaled_limit(mutator, scale)
+            # the results themselves are only needed if another mutator before the last has to count their variants
+            last = i == len(mutators) - 2
+            results = []
+            num_words = 0
+            for w in words:
+                mutator.cur_limit += limit
+                n = min(mutator.count(w), max(0, math.ceil(mutator.cur_limit)))
+                mutator.cur_limit -= n
+                num_words += n
+                if not last:
+                    results.extend(islice(mutator.mutate(w), n))
+            words = results
+
+        mutators[-1].cur_limit += num_words * self.scaled_limit(mutators[-1], scale)
+
+
+    def credit_skipped(self, mutators, start, stop):
+        '''
+        credit_pruned() for every permutation from <start> to <stop>, which perm skipped without generating them
+        permutations of several words are credited a block at a time (see block_variants()),
+        which is only approximate if a mutator before the last has words with more variants than its limit and words with fewer
+        (the same as estimate(), since the order of the words within a block is lost)
+        '''
+
+        perm = self.mutators[0]
+        if perm.perm_depth <= 1:
+            # single words are already in memory
+            for word in perm.permutations(start, stop):
+                self.credit_pruned(mutators, word)
+            return
+
+        variants = self.block_variants()
+        offsets = perm.block_offsets
+        b = bisect_right(offsets, start) - 1
+        while b < len(perm.blocks) and offsets[b] < stop:
+            size = offsets[b+1] - offsets[b]
+            # the length window skips whole blocks, so this is only partial if we resumed partway through one
+            share = min(stop, offsets[b+1]) - max(start, offsets[b])
+            for counts, scale, n in variants[perm.blocks[b]]:
+                num_words = n if share == size else n * share // size
+                for mutator, count in zip(mutators[:-1], counts):
+                    groups, mutator.cur_limit = self.simulate_limit(num_words, count, self.scaled_limit(mutator, scale), mutator.cur_limit)
+                    num_words = sum([inputs * results for inputs, results in groups])
+                mutators[-1].cur_limit += num_words * self.scaled_limit(mutators[-1], scale)
+            b += 1
+
+
+    @staticmethod
+    def scaled_limit(mutator, scale):
+        '''
+        a mutator's limit for a word with the given weight, the same as Mutator.__iter__()
+        '''
+
+        if mutator.scale_limit is None:
+            return mutator.limit
+        return max(1, mutator.limit * scale)
+
 
     def set_output_size(self, target_size):
         '''
@@ -128,4 +831,14 @@ class Mangler():
 
         elif self.leet:
             self.max_leet = max(1, int(multiplier))
-        '''
\ No newline at end of file
+        '''
+
+
+def both(first, second):
+    '''
+    combines two output filters
+    '''
+
+    if first is None:
+        return second
+    return lambda word: first(word) and second(word)
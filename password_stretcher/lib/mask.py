@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import re
+from pathlib import Path
+from .errors import MaskError
+
+
+# hashcat's built-in charsets
+charsets = {
+    'l': b'abcdefghijklmnopqrstuvwxyz',
+    'u': b'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    'd': b'0123456789',
+    'h': b'0123456789abcdef',
+    'H': b'0123456789ABCDEF',
+    's': b' !"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~',
+    'b': bytes(range(256)),
+}
+charsets['a'] = charsets['l'] + charsets['u'] + charsets['d'] + charsets['s']
+
+
+class MaskSet():
+    '''
+    one or more hashcat masks (e.g. "?u?l?l?l?l?l?d?d?s"), like the advanced masks from PasswordPolicy.analyze_password()
+    each mask is compiled into the set of bytes allowed at each position
+    lines from a .hcmask file can define custom charsets first: "?l?d,?u?1?1?1?1"
+    '''
+
+    def __init__(self, masks):
+
+        self.strings = list(masks)
+        # one tuple of allowed bytes per position, for each mask
+        self.masks = [parse_mask(mask) for mask in self.strings]
+        if not self.masks:
+            raise MaskError('No masks given')
+        self.lengths = {len(mask) for mask in self.masks}
+        self.regex = re.compile(b'|'.join([positions_regex(mask) for mask in self.masks]))
+
+
+    def matches(self, word):
+
+        return self.regex.fullmatch(word) is not None
+
+
+    def __len__(self):
+
+        return len(self.masks)
+
+
+
+class MaskConstraint():
+    '''
+    the masks, relaxed to allow for anything the given (later) mutators might still change
+    called on a word, returns False if it can never match a mask
+
+    for each way the later mutators might place a word inside a mask (a "slice": mask, prefix length, suffix length)
+    we work out which bytes at each position could still turn into an allowed byte
+    if a mutator's changes can't be predicted (e.g. hashcat rules), it's disabled
+    '''
+
+    def __init__(self, masks, mutators=()):
+
+        self.masks = masks
+        self.enabled = True
+
+        # every byte each byte might turn into
+        reach = [{b} for b in range(256)]
+        # every (prefix length, suffix length) that might be added
+        affixes = {(0, 0)}
+        for mutator in mutators:
+            changes = mutator.byte_changes()
+            added = mutator.affixes()
+            if changes is None or added is None:
+                self.enabled = False
+                return
+            if changes:
+                reach = [set().union(*[{c} | changes.get(c, set()) for c in r]) for r in reach]
+            affixes = {(p1 + p2, s1 + s2) for p1, s1 in affixes for p2, s2 in added}
+        self.reach = reach
+
+        # {word length: [(mask index, prefix length, suffix length), ...]}
+        self.slices = dict()
+        for k, mask in enumerate(masks.masks):
+            for prefix_length, suffix_length in sorted(affixes):
+                length = len(mask) - prefix_length - suffix_length
+                if length > 0:
+                    self.slices.setdefault(length, []).append((k, prefix_length, suffix_length))
+
+        # see table()
+        self.positions = dict()
+        self.tables = dict()
+        self.slice_regexes = dict()
+        self.length_regexes = dict()
+
+
+    def __call__(self, word):
+
+        if not self.enabled:
+            return True
+        try:
+            regex = self.length_regexes[len(word)]
+        except KeyError:
+            slices = self.slices.get(len(word), [])
+            regex = None
+            if slices:
+                regex = re.compile(b'|'.join([positions_regex(self.table(s)) for s in slices]))
+            self.length_regexes[len(word)] = regex
+        return regex is not None and regex.fullmatch(word) is not None
+
+
+    def __bool__(self):
+
+        return self.enabled
+
+
+    def table(self, s):
+        '''
+        the bytes allowed at each position of a word in this slice
+        '''
+
+        try:
+            return self.tables[s]
+        except KeyError:
+            pass
+
+        k, prefix_length, suffix_length = s
+        mask = self.masks.masks[k]
+        table = tuple([self.position(k, i) for i in range(prefix_length, len(mask) - suffix_length)])
+        self.tables[s] = table
+        return table
+
+
+    def position(self, k, i):
+
+        try:
+            return self.positions[(k, i)]
+        except KeyError:
+            allowed = self.masks.masks[k][i]
+            position = frozenset([b for b in range(256) if not allowed.isdisjoint(self.reach[b])])
+            self.positions[(k, i)] = position
+            return position
+
+
+    def viable(self, word):
+        '''
+        the slices this word could end up matching
+        '''
+
+        viable = []
+        for s in self.slices.get(len(word), []):
+            try:
+                regex = self.slice_regexes[s]
+            except KeyError:
+                regex = re.compile(positions_regex(self.table(s)))
+                self.slice_regexes[s] = regex
+            if regex.fullmatch(word) is not None:
+                viable.append(s)
+        return viable
+
+
+
+class MaskChoices():
+    '''
+    the bytes a mutator is allowed to produce at each position of a word
+    so leet and capitalization never enumerate a variation that can't match a mask
+    takes the constraint on the mutator's input (including its own changes) and on its output
+    called with a word, returns a set of allowed bytes for each position
+    '''
+
+    def __init__(self, constraint_in, constraint_out):
+
+        self.constraint_in = constraint_in
+        self.constraint_out = constraint_out
+
+
+    def __call__(self, word):
+
+        allowed = [set() for _ in range(len(word))]
+        for s in self.constraint_in.viable(word):
+            for position, table in zip(allowed, self.constraint_out.table(s)):
+                position.update(table)
+        return allowed
+
+
+
+def parse_mask(mask):
+    '''
+    "?u?l?l?d" --> (frozenset(b'A'...b'Z'), frozenset(b'a'...b'z'), ...)
+    '''
+
+    # custom charsets come first, separated by commas (escaped with a backslash)
+    fields = [f.replace('\\,', ',') for f in re.split(r'(?<!\\),', mask)]
+    custom = dict()
+    for i, charset in enumerate(fields[:-1]):
+        if i >= 4:
+            raise MaskError(f'Too many custom charsets in mask "{mask}"')
+        custom[str(i+1)] = b''.join(parse_positions(charset, custom, mask))
+
+    return tuple([frozenset(p) for p in parse_positions(fields[-1], custom, mask)])
+
+
+def parse_positions(mask, custom, original):
+
+    encoded = mask.encode()
+    positions = []
+    i = 0
+    while i < len(encoded):
+        char = encoded[i:i+1]
+        if char == b'?':
+            key = encoded[i+1:i+2].decode(errors='replace')
+            if key == '?':
+                positions.append(b'?')
+            elif key in charsets:
+                positions.append(charsets[key])
+            elif key in custom:
+                positions.append(custom[key])
+            else:
+                raise MaskError(f'Invalid charset "?{key}" in mask "{original}"')
+            i += 2
+        else:
+            positions.append(char)
+            i += 1
+
+    return positions
+
+
+def positions_regex(positions):
+
+    regex = []
+    for allowed in positions:
+        if not allowed:
+            # nothing can match
+            return b'(?!)'
+        regex.append(b'[' + b''.join([re.escape(bytes([b])) for b in sorted(allowed)]) + b']')
+    return b'(?:' + b''.join(regex) + b')'
+
+
+def read_masks(masks):
+    '''
+    each argument is either a mask or a file of masks (e.g. .hcmask), one per line
+    '''
+
+    results = []
+    for mask in masks:
+        path = Path(mask)
+        if path.is_file():
+            try:
+                lines = path.read_text(errors='replace').splitlines()
+            except OSError as e:
+                raise MaskError(f'Failed to read masks from {mask}: {e}')
+            results += [line for line in lines if line and not line.startswith('#')]
+        else:
+            results.append(mask)
+
+    return results
@@ -2,6 +2,12 @@
 
 # by TheTechromancer
 
+import sys
+import math
+import heapq
+from itertools import count, islice
+from collections import OrderedDict
+
 
 class Mutator():
     '''
@@ -23,6 +29,12 @@ class Mutator():
         self.limit = limit
         # carry over unused mutations into the next word
         self.cur_limit = 0
+        # skips results that can never meet the password policy (see Mangler.push_down_policy())
+        self.output_filter = None
+        # called with each skipped result
+        self.on_prune = None
+        # returns a multiplier for the limit of each input word (see Mangler.set_weights())
+        self.scale_limit = None
 
 
     def __len__(self):
@@ -32,16 +44,36 @@ class Mutator():
 
     def __iter__(self):
 
+        scale_limit = self.scale_limit
         for word in self.input:
-            self.cur_limit += self.limit
+            if scale_limit is None:
+                self.cur_limit += self.limit
+            else:
+                # at least one, so that every word still makes it through
+                self.cur_limit += max(1, self.limit * scale_limit(word))
+            output_filter = self.output_filter
             for r in self.mutate(word):
                 if self.cur_limit > 0:
-                    yield r
+                    # pruned results count against the limit, same as if they'd been filtered at the end
+                    # (their downstream budget is given back by on_prune, see Mangler.credit_pruned())
+                    if output_filter is None or output_filter(r):
+                        yield r
+                    elif self.on_prune is not None:
+                        self.on_prune(r)
                     self.cur_limit -= 1
                 else:
                     break
 
 
+    def prune(self, results):
+
+        for r in results:
+            if self.output_filter(r):
+                yield r
+            elif self.on_prune is not None:
+                self.on_prune(r)
+
+
     def __str__(self):
 
         return self.fname
@@ -51,4 +83,285 @@ class Mutator():
         '''
         override in child class
         '''
-        yield word
\ No newline at end of file
+        yield word
+
+
+    def count(self, word):
+        '''
+        number of results mutate() would yield for this word, without running it
+        override in child class
+        '''
+        return 1
+
+
+    def added_length(self, n):
+        '''
+        number of bytes the first n results of mutate() add to the word's length
+        override in child class if the mutator changes length
+        '''
+        return 0
+
+
+    def added_length_range(self):
+        '''
+        (min, max) number of bytes any result of mutate() might add to a word
+        override in child class if the mutator changes length
+        '''
+        return (0, 0)
+
+
+    def length_changes(self):
+        '''
+        the set of every number of bytes mutate() might add to a word, or None if it can't be listed
+        used to plan which input lengths can end up inside the policy's length window (see LengthPlan)
+        override in child class if not every length in added_length_range() is possible
+        '''
+        lo, hi = self.added_length_range()
+        if math.isinf(lo) or math.isinf(hi) or hi - lo > 4096:
+            return None
+        return set(range(lo, hi + 1))
+
+
+    def byte_changes(self):
+        '''
+        {byte: set of bytes it might turn into} for every byte mutate() might change in place
+        or None if that can't be predicted
+        used to push masks down into the mutators (see MaskConstraint)
+        override in child class
+        '''
+        return None
+
+
+    def affixes(self):
+        '''
+        every (prefix length, suffix length) mutate() might add to a word, or None if it doesn't just add them
+        override in child class if the mutator changes length
+        '''
+        return {(0, 0)} if self.length_changes() == {0} else None
+
+
+    def reachable_charsets(self, charset):
+        '''
+        every character set a word might contain after mutating a word with the given charset
+        used for policy pruning, so it's fine to overestimate but never underestimate
+        override in child class
+        '''
+        return charset
+
+
+def likelihood_to_cost(p):
+    '''
+    converts a probability into an additive integer cost
+    so that the most probable combination has the lowest total
+    '''
+
+    return int(round(-math.log(p) * 1000))
+
+
+def ranked_product(options, cache=None):
+    '''
+    best-first cartesian product
+    takes a list of choices for each position, each one a list of (cost, value) sorted by cost
+    yields every combination (joined together) in order of total cost, lowest first,
+    without materializing the whole product
+
+    the order only depends on the costs, so it's looked up in the expansion cache (see ExpansionCache)
+    '''
+
+    if cache is None:
+        cache = expansion_cache
+
+    base = [choices[0][1] for choices in options]
+    # only positions with more than one choice are enumerated
+    variable = [(i, [value for _, value in choices]) for i, choices in enumerate(options) if len(choices) > 1]
+    costs = tuple([tuple([cost for cost, _ in choices]) for choices in options if len(choices) > 1])
+
+    for indices in cache.combinations(costs):
+        word = list(base)
+        for (position, values), index in zip(variable, indices):
+            if index:
+                word[position] = values[index]
+        yield b''.join(word)
+
+
+def ranked_indices(costs, heap=None):
+    '''
+    the order behind ranked_product()
+    takes the costs of the choices at each position, and yields tuples of indices into them
+    the priority queue is kept in <heap> if it's given, so the caller can see how big it gets
+
+    each combination's "parent" is the same combination with the last non-zero index decremented,
+    which means every combination has exactly one parent and is only ever queued once
+    '''
+
+    num_positions = len(costs)
+    if heap is None:
+        heap = []
+    tiebreaker = count()
+
+    def push_children(cost, indices, last):
+        for j in range(last, num_positions):
+            choices = costs[j]
+            index = indices[j]
+            if index + 1 < len(choices):
+                child = indices[:j] + (index + 1,) + indices[j+1:]
+                child_cost = cost + choices[index+1] - choices[index]
+                heapq.heappush(heap, (child_cost, next(tiebreaker), child, j))
+
+    indices = (0,) * num_positions
+    yield indices
+    push_children(0, indices, 0)
+
+    while heap:
+        cost, _, indices, last = heapq.heappop(heap)
+        yield indices
+        push_children(cost, indices, last)
+
+
+
+class ExpansionCache():
+    '''
+    remembers the order ranked_product() visits combinations in, for each set of costs
+    leet and capswap give lots of words the same costs (e.g. every 8-letter word for capswap),
+    including permutations which contain the same words, so they can skip the priority queue
+
+    each entry is extended as far as any word has needed it, up to max_combinations
+    the cache as a whole holds at most max_bytes of combinations, and drops the least recently used entries to stay under it
+    costs are only cached the second time they're seen, so a wordlist full of unique words doesn't fill it with entries nobody reuses
+    '''
+
+    def __init__(self, max_bytes=16*1024*1024, max_combinations=65536, max_seen=16384):
+
+        self.max_bytes = max_bytes
+        self.max_combinations = max_combinations
+        self.max_seen = max_seen
+        # {costs: CacheEntry}
+        self.entries = OrderedDict()
+        # hashes of costs that have been seen once but aren't cached yet
+        self.seen = OrderedDict()
+        # estimated bytes held by all the entries
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def combinations(self, costs):
+
+        entries = self.entries
+        try:
+            entry = entries[costs]
+            entries.move_to_end(costs)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            if not self.admit(costs):
+                yield from ranked_indices(costs)
+                return
+            entry = CacheEntry(costs)
+            entries[costs] = entry
+
+        combinations = entry.combinations
+        i = 0
+        while 1:
+            # another word may have extended the entry since we got here
+            if i < len(combinations):
+                yield combinations[i]
+            elif entry.complete:
+                return
+            elif entry.cached and i < self.max_combinations:
+                try:
+                    indices = next(entry.generator)
+                except StopIteration:
+                    entry.complete = True
+                    entry.generator = None
+                    return
+                combinations.append(indices)
+                self.grow(entry)
+                yield indices
+            else:
+                if entry.cached and entry.generator is not None:
+                    # the entry is as big as it gets, so its queue won't be needed again
+                    entry.generator = None
+                    entry.heap.clear()
+                    self.grow(entry)
+                break
+            i += 1
+
+        # too many to keep, so carry on without the cache
+        yield from islice(ranked_indices(costs), i, None)
+
+
+    def admit(self, costs):
+        '''
+        whether costs have been seen before, and should be cached
+        '''
+
+        key = hash(costs)
+        if key in self.seen:
+            del self.seen[key]
+            return True
+        self.seen[key] = None
+        if len(self.seen) > self.max_seen:
+            self.seen.popitem(last=False)
+        return False
+
+
+    def grow(self, entry):
+        '''
+        accounts for a change in the size of <entry>, dropping the least recently used entries if we're over budget
+        '''
+
+        size = entry.estimate_size()
+        self.size += size - entry.size
+        entry.size = size
+        while self.size > self.max_bytes and self.entries:
+            # the entry being extended is the most recently used, so it's only dropped if nothing else is left
+            _, oldest = self.entries.popitem(last=False)
+            oldest.cached = False
+            self.size -= oldest.size
+
+
+    def clear(self):
+
+        self.entries.clear()
+        self.seen.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+    def snapshot(self):
+
+        return (self.hits, self.misses)
+
+
+
+class CacheEntry():
+    '''
+    the combinations generated so far for one set of costs (see ExpansionCache)
+    '''
+
+    def __init__(self, costs):
+
+        self.combinations = []
+        # the generator's priority queue, which is usually bigger than the combinations themselves
+        self.heap = []
+        self.generator = ranked_indices(costs, self.heap)
+        # a tuple of indices, plus its slot in the list
+        self.item_size = sys.getsizeof((0,) * len(costs)) + 8
+        # (cost, tiebreaker, indices, position) in the queue
+        self.queued_size = sys.getsizeof((0, 0, (), 0)) + sys.getsizeof(2**40) * 2 + self.item_size
+        self.size = 0
+        # whether the generator has run out
+        self.complete = False
+        # false once the entry has been dropped from the cache, after which it stops growing
+        self.cached = True
+
+
+    def estimate_size(self):
+
+        return len(self.combinations) * self.item_size + len(self.heap) * self.queued_size
+
+
+# shared by every mutator in the process
+expansion_cache = ExpansionCache()
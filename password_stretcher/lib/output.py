@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import sys
+import time
+import queue
+import threading
+from pathlib import Path
+from itertools import islice
+from .errors import PasswordStretcherError, CheckpointError
+from .utils import bytes_to_human, compression_extensions, open_compressed
+
+
+class OutputWriter():
+    '''
+    writes newline-separated words in large batches
+    instead of paying for a write() and a new bytes object per word
+    '''
+
+    def __init__(self, stream=None, batch_size=65536, progress=False):
+
+        if stream is None:
+            stream = sys.stdout.buffer
+        self.stream = stream
+
+        # number of words per write
+        self.batch_size = max(1, batch_size)
+        # print running word count to stderr after each batch
+        self.progress = progress
+        # called with the writer after each batch (see Checkpoint.update() and Stats.update())
+        self.on_write = []
+
+        self.written_count = 0
+        self.bytes_written = 0
+        # word count on the last status line
+        self.status_count = None
+        # time spent waiting on the output stream, e.g. when whatever is reading it can't keep up
+        self.blocked_seconds = 0.
+
+
+    def write(self, words):
+        '''
+        consumes an iterable of words
+        '''
+
+        words = iter(words)
+        while 1:
+            batch = list(islice(words, self.batch_size))
+            if not batch:
+                break
+            self.written_count += len(batch)
+            # empty word at the end gives us a trailing newline for free
+            batch.append(b'')
+            buf = b'\n'.join(batch)
+            start = time.perf_counter()
+            self.stream.write(buf)
+            self.blocked_seconds += time.perf_counter() - start
+            self.bytes_written += len(buf)
+            if self.progress:
+                self.status()
+            for on_write in self.on_write:
+                on_write(self)
+
+
+    def status(self, end=''):
+
+        self.status_count = self.written_count
+        sys.stderr.write(f'\r[+] {self.written_count:,} words written ({bytes_to_human(self.bytes_written)})    {end}')
+
+
+    def close(self):
+
+        if self.progress:
+            # the last batch already printed the final count
+            if self.status_count == self.written_count:
+                sys.stderr.write('\n')
+            else:
+                self.status(end='\n')
+        start = time.perf_counter()
+        self.stream.flush()
+        self.blocked_seconds += time.perf_counter() - start
+
+
+
+# tells the writer thread to finish the current compressed stream
+_flush = object()
+
+
+class OutputFile():
+    '''
+    file-like object for writing output to a file
+    if the name ends in .gz, .xz, .bz2, or .zst, it's compressed in a background thread while we keep mangling
+
+    flush() finishes the current compressed stream and starts a new one, so everything up to <offset>
+    is a complete file on its own (all of these formats allow streams to be concatenated)
+    resuming truncates the file back to that offset
+    '''
+
+    # number of buffers waiting to be written before write() blocks
+    queue_size = 16
+
+    def __init__(self, filename, offset=None, level=None):
+
+        self.filename = Path(filename)
+        self.compression = compression_extensions.get(self.filename.suffix.lower(), None)
+        self.level = level
+
+        if offset is None:
+            self.file = open(self.filename, 'wb')
+        else:
+            try:
+                self.file = open(self.filename, 'r+b')
+            except FileNotFoundError:
+                raise CheckpointError(f'Output file {self.filename} is missing, can\'t resume writing to it')
+            # truncate() would pad it with zeros
+            if os.fstat(self.file.fileno()).st_size < offset:
+                self.file.close()
+                raise CheckpointError(f'Output file {self.filename} is shorter than when the checkpoint was saved, can\'t resume writing to it')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        self.offset = self.file.tell()
+
+        self.error = None
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+
+    def write(self, data):
+
+        self.check()
+        self.queue.put(data)
+
+
+    def flush(self):
+        '''
+        waits until everything has been written and compressed
+        '''
+
+        self.check()
+        self.queue.put(_flush)
+        self.queue.join()
+        self.check()
+
+
+    def close(self):
+
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.check()
+
+
+    def check(self):
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise PasswordStretcherError(f'Failed to write to {self.filename}: {error}')
+
+
+    def _writer(self):
+
+        stream = None
+        try:
+            while 1:
+                data = self.queue.get()
+                try:
+                    if data is None or data is _flush:
+                        if stream is not None and stream is not self.file:
+                            stream.close()
+                        stream = None
+                        self.file.flush()
+                        self.offset = self.file.tell()
+                        if data is None:
+                            self.file.close()
+                            break
+                    else:
+                        if stream is None:
+                            stream = self.file
+                            if self.compression:
+                                stream = open_compressed(self.file, self.compression, mode='wb', level=self.level)
+                        # gzip, lzma, bz2, and zstandard all release the GIL while compressing
+                        stream.write(data)
+                finally:
+                    self.queue.task_done()
+
+        except Exception as e:
+            self.error = e
+            # keep draining the queue so nobody blocks forever
+            while 1:
+                data = self.queue.get()
+                self.queue.task_done()
+                if data is None:
+                    break
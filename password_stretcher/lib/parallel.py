@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import signal
+import multiprocessing
+from collections import deque
+from .mutator import expansion_cache
+from .errors import InputListError
+
+
+# number of permutated words sent to a worker at a time
+chunk_size = 256
+
+
+def fork_context():
+    '''
+    workers need the fork start method, because they inherit the mangler instead of pickling it
+    the chain can't be pickled: it holds lambdas (e.g. the filters combined by both() in mangler.py) and generators (e.g. LazyBlocks)
+    so there's no falling back to spawn, which is the only start method on windows
+    '''
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise InputListError('Multiple workers need the "fork" start method, which isn\'t available on this platform, please use --workers 1')
+    return multiprocessing.get_context('fork')
+
+
+def _worker(mangler, tasks, results, carry=None):
+    '''
+    mangles chunks from the task queue until it receives None
+    the mutator chain (and its carry-over budget) persists between chunks,
+    so each worker behaves like a single-process run over its own shard
+    the carry-over is sent back along with each chunk so the parent can checkpoint it,
+    and so are the stage counters if they're enabled (see Mangler.instrument())
+    '''
+
+    # the parent process handles ctrl+c
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # start with an empty expansion cache instead of the parent's (its hits are counted in the parent)
+    expansion_cache.clear()
+
+    mutators = mangler.mutators[1:]
+    if carry is not None:
+        for mutator, cur_limit in zip(mutators, carry):
+            mutator.cur_limit = cur_limit
+
+    while 1:
+        task = tasks.get()
+        if task is None:
+            break
+        index, words = task
+        # chunks of in-memory input are generated here instead of being sent over
+        if words is None:
+            words = mangler.mutators[0].permutations(index * chunk_size, (index+1) * chunk_size)
+        try:
+            results.put((index, list(mangler.mangle(words)), [m.cur_limit for m in mutators], mangler.snapshot()))
+        except Exception as e:
+            results.put((index, e, None, None))
+            break
+
+
+def mangle_parallel(mangler):
+    '''
+    shards the permutated input across a pool of processes
+    chunk n goes to worker n % workers, so every shard gets an even spread of word lengths
+    each shard is run through the full mutator chain
+    yields mangled words, in order if mangler.ordered is set
+    only works where the fork start method is available (see fork_context())
+
+    with --shard K/N, only every Nth chunk is mangled, and the chunks are spread across
+    workers as if there were N times as many of them, so that N shards with M workers each
+    produce exactly the same words as one run with N*M workers
+    '''
+
+    num_workers = mangler.workers
+    num_lanes = num_workers * mangler.shards
+    # keep a bounded number of chunks in flight so memory doesn't balloon
+    # when the workers are faster than whatever is reading our output
+    max_pending = num_workers * 4
+
+    def worker_for(index):
+        return (index % num_lanes) // mangler.shards
+
+    # forked workers inherit the mangler instead of pickling it (and its input)
+    context = fork_context()
+
+    # when resuming, each worker picks up with its own carry-over
+    carry = mangler.carry
+    if carry is None:
+        carry = [[m.cur_limit for m in mangler.mutators[1:]] for _ in range(num_workers)]
+    carry = [list(c) for c in carry]
+
+    results = context.Queue()
+    tasks = [context.Queue() for _ in range(num_workers)]
+    workers = [
+        context.Process(target=_worker, args=(mangler, tasks[i], results, carry[i]), daemon=True)
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # chunks that have been sent out, in order
+    pending = deque()
+    # finished chunks waiting for their turn (ordered mode)
+    finished = dict()
+
+    def receive():
+        index, words, worker_carry, meters = results.get()
+        if isinstance(words, Exception):
+            raise words
+        if meters is not None:
+            mangler.worker_meters[worker_for(index)] = meters
+        finished[index] = (words, worker_carry)
+
+    def ready():
+        if mangler.ordered:
+            while pending and pending[0] in finished:
+                index = pending.popleft()
+                words, worker_carry = finished.pop(index)
+                # the start of each chunk is a safe place to resume from
+                if mangler.track_position:
+                    mangler.position = (index * chunk_size, index, [list(c) for c in carry], mangler.produced)
+                yield from words
+                carry[worker_for(index)] = worker_carry
+        else:
+            for index in list(finished):
+                pending.remove(index)
+                yield from finished.pop(index)[0]
+
+    perm = mangler.mutators[0]
+    # chunk numbering carries on from where we left off, so chunks go to the same workers
+    start_chunk = max(mangler.start_chunk, mangler.shard)
+
+    try:
+        if isinstance(perm.input, list):
+            # the workers can generate their own chunks
+            chunks = ((index, None) for index in range(start_chunk, -(-perm.num_permutations() // chunk_size), mangler.shards))
+        else:
+            chunks = perm.chunks(chunk_size, first=start_chunk, step=mangler.shards)
+
+        for index, chunk in chunks:
+            tasks[worker_for(index)].put((index, chunk))
+            pending.append(index)
+            while len(pending) >= max_pending:
+                receive()
+                yield from ready()
+
+        for task_queue in tasks:
+            task_queue.put(None)
+
+        while pending:
+            receive()
+            yield from ready()
+
+        for worker in workers:
+            worker.join()
+
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
@@ -3,8 +3,15 @@
 # by TheTechromancer
 
 import os
+import json
+import hashlib
+from itertools import accumulate, chain, islice
 from pathlib import Path
 from .mutator import Mutator
+from .policy import PasswordPolicy
+from .pend_model import PendModel, word_shape
+from .mask import MaskConstraint
+from .utils import is_ascii
 
 
 class Pend(Mutator):
@@ -12,72 +19,486 @@ class Pend(Mutator):
     scale = 5
     fname = 'append/prepend'
 
-    def __init__(self, _input, limit=2048):
+    # bump this whenever the format of the rule cache changes
+    cache_version = 2
 
-        self.rules = []
+    def __init__(self, _input, limit=2048, model=None):
+
+        # each rule is a prefix and a suffix which are applied to the word
+        self.prefixes = []
+        self.suffixes = []
         self.read_rules()
 
+        # rules are applied in blocks with one bulk join per block
+        # blocks start small and double in size so we don't waste work when limit is low
+        self.blocks = self.compile_blocks(self.prefixes, self.suffixes)
+
+        # running total of the bytes added by each rule, for estimating output size
+        self.added_lengths = list(accumulate([len(p) + len(s) for p, s in zip(self.prefixes, self.suffixes)]))
+
+        # every charset the rules can add (see reachable_charsets())
+        self.rules_charset = None
+
+        # see set_policy()
+        self.policy = None
+        self.policy_exact = False
+        self.rule_groups = dict()
+        self.group_blocks = dict()
+        self.word_blocks = dict()
+
+        # see set_masks()
+        self.masks = None
+        self.mask_constraint = None
+        self.affix_groups = dict()
+        self.slice_rules = dict()
+        self.mask_blocks = dict()
+
+        # see set_model()
+        self.model = None
+        self.shape_blocks = dict()
+        if model is not None:
+            self.set_model(model)
+
         super().__init__(_input, limit)
 
 
     def __len__(self):
 
-        return min(self.limit, len(self.rules))
+        return min(self.limit, len(self.prefixes))
 
 
     def mutate(self, word):
 
-        yield word
+        blocks = self.blocks
+        shape = None if self.model is None else word_shape(word)
+
+        if self.masks is not None:
+            yield from self.mask_mutate(word, shape)
+            return
+
+        if self.policy is None:
+            yield word
+            if shape is not None:
+                blocks = self.model_blocks(shape)
+        else:
+            # only apply rules that can produce a word which meets the policy
+            pass_length = self.policy.length(word)
+            charset = self.policy.charset(word)
+            if self.policy.meets_constraints(pass_length, charset):
+                yield word
+            blocks = self.policy_blocks(pass_length, charset, shape)
+
+        # newlines are used to separate results, so we can't bulk join words that contain them
+        if b'\n' in word:
+            for prefix, suffix in zip(self.prefixes, self.suffixes):
+                result = prefix + word + suffix
+                if self.policy is None or self.policy.meets_constraints(*self.policy.classify(result)[:2]):
+                    yield result
+
+        else:
+            for block in blocks:
+                yield from word.join(block).split(b'\n')
+
+
+    def set_policy(self, policy):
+        '''
+        skip rules that would produce words which don't meet the length or charset requirements
+        only valid when pend is the last mutator
+        '''
+
+        self.policy = policy
+        # every result is guaranteed to meet the length and charset requirements,
+        # as long as the rules add the same number of characters as bytes
+        self.policy_exact = is_ascii(b''.join(self.prefixes + self.suffixes))
+        self.word_blocks.clear()
+        self.group_blocks.clear()
+
+        # group rules by (added length, added charset)
+        # all the rules in a group are either valid or invalid for any given word
+        self.rule_groups = dict()
+        # the group each rule is in
+        self.rule_group = []
+        for i, (prefix, suffix) in enumerate(zip(self.prefixes, self.suffixes)):
+            key = (len(prefix) + len(suffix), policy.charset(prefix + suffix))
+            self.rule_group.append(key)
+            try:
+                self.rule_groups[key].append(i)
+            except KeyError:
+                self.rule_groups[key] = [i]
+
+
+    def policy_blocks(self, pass_length, charset, shape=None):
+        '''
+        compiled blocks of only the rules which can meet the policy
+        for a word of the given length and charset (and shape, with a model)
+        '''
+
+        try:
+            return self.word_blocks[(pass_length, charset, shape)]
+        except KeyError:
+            pass
+
+        groups = self.valid_groups(pass_length, charset)
+
+        # lots of different words share the same set of valid rules
+        try:
+            blocks = self.group_blocks[(groups, shape)]
+        except KeyError:
+            if shape is None:
+                indices = sorted(chain.from_iterable([self.rule_groups[g] for g in groups]))
+                blocks = self.compile_blocks([self.prefixes[i] for i in indices], [self.suffixes[i] for i in indices])
+            else:
+                valid = set(groups)
+                rule_group = self.rule_group
+                blocks = LazyBlocks(self.prefixes, self.suffixes, (i for i in self.model.order(shape) if rule_group[i] in valid))
+            self.group_blocks[(groups, shape)] = blocks
+
+        self.word_blocks[(pass_length, charset, shape)] = blocks
+        return blocks
+
+
+    def valid_groups(self, pass_length, charset):
+        '''
+        the groups of rules (see set_policy()) which meet the policy for a word of the given length and charset
+        '''
+
+        return tuple([
+            (added_length, added_charset) for added_length, added_charset in self.rule_groups
+            if self.policy.meets_constraints(pass_length + added_length, charset | added_charset)
+        ])
+
+
+    def set_masks(self, masks):
+        '''
+        only apply rules that put the word in the right place in a mask, with a matching prefix and suffix
+        only valid when pend is the last mutator
+        '''
+
+        self.masks = masks
+        self.mask_constraint = MaskConstraint(masks, [self])
+        self.slice_rules.clear()
+        self.mask_blocks.clear()
+
+        # group rules by (prefix length, suffix length)
+        self.affix_groups = dict()
+        for i, (prefix, suffix) in enumerate(zip(self.prefixes, self.suffixes)):
+            try:
+                self.affix_groups[(len(prefix), len(suffix))].append(i)
+            except KeyError:
+                self.affix_groups[(len(prefix), len(suffix))] = [i]
+
+
+    def mask_mutate(self, word, shape=None):
+
+        # every way the word could fit into a mask: (mask index, prefix length, suffix length)
+        slices = tuple(self.mask_constraint.viable(word))
+        if not slices:
+            return
+
+        keep = any([not prefix_length and not suffix_length for _, prefix_length, suffix_length in slices])
+        groups = None
+        if self.policy is not None:
+            pass_length = self.policy.length(word)
+            charset = self.policy.charset(word)
+            keep = keep and self.policy.meets_constraints(pass_length, charset)
+            groups = self.valid_groups(pass_length, charset)
+        if keep:
+            yield word
+
+        # lots of different words fit the same slices
+        key = (slices, groups, shape)
+        try:
+            indices, blocks = self.mask_blocks[key]
+        except KeyError:
+            valid = set()
+            for s in slices:
+                valid.update(self.mask_rules(s))
+            if groups is not None:
+                groups = set(groups)
+                valid = {i for i in valid if self.rule_group[i] in groups}
+            indices = sorted(valid)
+            if shape is None:
+                blocks = self.compile_blocks([self.prefixes[i] for i in indices], [self.suffixes[i] for i in indices])
+            else:
+                blocks = LazyBlocks(self.prefixes, self.suffixes, (i for i in self.model.order(shape) if i in valid))
+            self.mask_blocks[key] = (indices, blocks)
+
+        if b'\n' in word:
+            for i in indices:
+                yield self.prefixes[i] + word + self.suffixes[i]
+        else:
+            for block in blocks:
+                yield from word.join(block).split(b'\n')
+
+
+    def mask_rules(self, s):
+        '''
+        indices of the rules whose prefix and suffix match the ends of a mask
+        '''
+
+        try:
+            return self.slice_rules[s]
+        except KeyError:
+            pass
+
+        k, prefix_length, suffix_length = s
+        mask = self.masks.masks[k]
+        prefix_mask = mask[:prefix_length]
+        suffix_mask = mask[len(mask)-suffix_length:]
+        rules = []
+        if prefix_length or suffix_length:
+            for i in self.affix_groups.get((prefix_length, suffix_length), []):
+                if all([b in a for b, a in zip(self.prefixes[i], prefix_mask)]) and \
+                   all([b in a for b, a in zip(self.suffixes[i], suffix_mask)]):
+                    rules.append(i)
+
+        self.slice_rules[s] = rules
+        return rules
+
+
+    def set_model(self, model):
+        '''
+        applies the rules in a different order for each shape of word (see PendModel)
+        takes a PendModel or the filename of one
+        '''
+
+        if not isinstance(model, PendModel):
+            model = PendModel.load(model, self.prefixes, self.suffixes)
+        self.model = model
+        self.shape_blocks.clear()
+        self.mask_blocks.clear()
+        self.word_blocks.clear()
+        self.group_blocks.clear()
+
+        # most words get the most common rules first
+        self.added_lengths = list(accumulate([len(self.prefixes[i]) + len(self.suffixes[i]) for i in model.ranking]))
+
+
+    def model_blocks(self, shape):
+
+        try:
+            return self.shape_blocks[shape]
+        except KeyError:
+            blocks = LazyBlocks(self.prefixes, self.suffixes, self.model.order(shape))
+            self.shape_blocks[shape] = blocks
+            return blocks
+
+
+    def train(self, passwords):
+        '''
+        learns a model from a wordlist of real passwords
+        '''
 
-        for rule in self.rules:
-            yield rule.replace(b'\x00', word)
+        return PendModel.train(passwords, self.prefixes, self.suffixes)
+
+
+    def count(self, word):
+
+        return 1 + len(self.prefixes)
+
+
+    def added_length(self, n):
+
+        # the first result is the unmodified word
+        if n <= 1 or not self.added_lengths:
+            return 0
+        return self.added_lengths[min(n, len(self.added_lengths)+1) - 2]
+
+
+    def added_length_range(self):
+
+        return (0, max([len(p) + len(s) for p, s in zip(self.prefixes, self.suffixes)], default=0))
+
+
+    def length_changes(self):
+
+        return {0} | {len(p) + len(s) for p, s in zip(self.prefixes, self.suffixes)}
+
+
+    def byte_changes(self):
+
+        return dict()
+
+
+    def affixes(self):
+
+        return {(0, 0)} | {(len(p), len(s)) for p, s in zip(self.prefixes, self.suffixes)}
+
+
+    def reachable_charsets(self, charset):
+
+        if self.rules_charset is None:
+            self.rules_charset = PasswordPolicy().charset(b''.join(self.prefixes + self.suffixes))
+        return charset | self.rules_charset
+
+
+    @staticmethod
+    def compile_blocks(prefixes, suffixes, first_block_size=16, max_block_size=4096):
+        '''
+        converts prefixes and suffixes into lists of "separators"
+        joining a word with a block yields each rule applied to the word, separated by newlines:
+            b'pass'.join([b'!', b'1\n@', b'2']) --> b'!pass1\n@pass2'
+        '''
+
+        blocks = []
+        block_size = first_block_size
+        i = 0
+        while i < len(prefixes):
+            block_prefixes = prefixes[i:i+block_size]
+            block_suffixes = suffixes[i:i+block_size]
+            block = [block_prefixes[0]]
+            block += [s + b'\n' + p for s, p in zip(block_suffixes, block_prefixes[1:])]
+            block.append(block_suffixes[-1])
+            blocks.append(block)
+            i += block_size
+            block_size = min(max_block_size, block_size * 2)
+
+        return blocks
 
 
     def read_rules(self, rule_dir=None):
 
         if rule_dir is None:
             rule_dir = Path(__file__).resolve().parent.parent / 'lists'
+        rule_dir = Path(rule_dir)
 
+        rule_files = []
         for _, _, files in os.walk(rule_dir):
-            for file in files:
+            for file in sorted(files):
                 if any(file.lower().endswith(x) for x in ['rule', 'rules']):
-                    with open(rule_dir / file) as f:
-                        lines = [l.strip('\r\n') for l in f.readlines()]
-                        for line in lines:
-                            try:
-                                rule = self.parse_rule(line)
-                                if len(rule) > 1:
-                                    self.rules.append(rule)
-                            except ValueError:
-                                continue
+                    rule_files.append(rule_dir / file)
+
+        # parsing 100K rules on every startup is slow, so we cache them
+        cache_file = self.cache_file(rule_files)
+        try:
+            self.prefixes, self.suffixes = self.load_cache(cache_file)
+            return
+        except (OSError, ValueError):
+            pass
+
+        for file in rule_files:
+            with open(file) as f:
+                lines = [l.strip('\r\n') for l in f.readlines()]
+                for line in lines:
+                    try:
+                        prefix, suffix = self.parse_rule(line)
+                        if prefix or suffix:
+                            self.prefixes.append(prefix)
+                            self.suffixes.append(suffix)
+                    except ValueError:
+                        continue
+
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump({
+                    'prefixes': [p.decode('utf-8') for p in self.prefixes],
+                    'suffixes': [s.decode('utf-8') for s in self.suffixes],
+                }, f, separators=(',', ':'))
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+
+
+    @staticmethod
+    def load_cache(cache_file):
+        '''
+        reads the prefixes and suffixes saved by read_rules()
+        raises ValueError if the cache is malformed
+        '''
+
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+        try:
+            prefixes = [p.encode('utf-8') for p in cache['prefixes']]
+            suffixes = [s.encode('utf-8') for s in cache['suffixes']]
+        except (TypeError, KeyError, AttributeError):
+            raise ValueError(f'Malformed rule cache: {cache_file}')
+        if len(prefixes) != len(suffixes):
+            raise ValueError(f'Malformed rule cache: {cache_file}')
+
+        return prefixes, suffixes
+
+
+    @classmethod
+    def cache_file(cls, rule_files):
+        '''
+        cache is keyed by the path, size, and mtime of every rule file
+        '''
+
+        cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'password-stretcher'
+
+        key = hashlib.sha1(str(cls.cache_version).encode())
+        for file in rule_files:
+            stat = file.stat()
+            key.update(f'{file.resolve()}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+
+        return cache_dir / f'pend-{key.hexdigest()}.json'
 
 
     @staticmethod
     def parse_rule(rule):
+        '''
+        parses a hashcat-style append/prepend rule
+        returns (prefix, suffix)
+        '''
 
-        parsed_rule = []
+        prefix = []
+        suffix = []
 
         rule_chars = rule.split(' ')
         for char in rule_chars:
             if char.startswith('^'):
                 if len(char) == 1:
-                    parsed_rule.append(b' ')
+                    prefix.append(b' ')
                 elif len(char) > 1:
-                    parsed_rule.append(char[-1].encode('utf-8'))
+                    prefix.append(char[-1].encode('utf-8'))
                 else:
                     raise ValueError
 
-        # the word goes here
-        parsed_rule.append(b'\x00')
-
         for char in rule_chars:
             if char.startswith('$'):
                 if len(char) == 1:
-                    parsed_rule.append(b' ')
+                    suffix.append(b' ')
                 elif len(char) > 1:
-                    parsed_rule.append(char[-1].encode('utf-8'))
+                    suffix.append(char[-1].encode('utf-8'))
                 else:
                     raise ValueError
 
-        return b''.join(parsed_rule)
+        return (b''.join(prefix), b''.join(suffix))
+
+
+
+class LazyBlocks():
+    '''
+    compiled blocks (see Pend.compile_blocks()) of rules in a custom order
+    blocks are only compiled when a word gets that far, since most words never get past the first few
+    '''
+
+    def __init__(self, prefixes, suffixes, indices, first_block_size=16, max_block_size=4096):
+
+        self.prefixes = prefixes
+        self.suffixes = suffixes
+        # iterator of rule indices, in order
+        self.indices = indices
+        self.blocks = []
+        self.block_size = first_block_size
+        self.max_block_size = max_block_size
+
+
+    def __iter__(self):
 
+        i = 0
+        while True:
+            if i == len(self.blocks):
+                indices = list(islice(self.indices, self.block_size))
+                if not indices:
+                    return
+                self.blocks += Pend.compile_blocks(
+                    [self.prefixes[j] for j in indices], [self.suffixes[j] for j in indices], first_block_size=len(indices)
+                )
+                self.block_size = min(self.max_block_size, self.block_size * 2)
+            yield self.blocks[i]
+            i += 1
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from .errors import RuleError
+
+
+class PendModel():
+    '''
+    learns which append/prepend rules real passwords use, depending on the shape of the base word
+    e.g. capitalized words are more likely to end in "1!", and words ending in a digit less likely to end in "123"
+
+    trained offline on a wordlist of real passwords (see train())
+    each password is split into every (prefix, base word, suffix) where the prefix and suffix are one of the rules,
+    and the rule is counted against the shape of the base word
+    the overall ranking only counts the longest rule in each password (e.g. "123" but not "23" in "pass123")
+
+    the model is a table of rule indices: for each shape, the rules seen most often with it
+    followed by the most common rules overall, and then the rest of the rules in their original order
+    '''
+
+    # bump this whenever the format of the model file changes
+    version = 1
+    # max rules to remember for each shape
+    top = 1024
+    # shapes seen fewer times than this fall back to the overall ranking
+    min_samples = 100
+
+    def __init__(self, prefixes, suffixes, shapes=None, ranking=None):
+
+        self.prefixes = prefixes
+        self.suffixes = suffixes
+        # {shape: [rule index, ...]}
+        self.shapes = dict() if shapes is None else shapes
+        # every rule index, most common first
+        self.ranking = self.complete_ranking([] if ranking is None else ranking)
+
+
+    def order(self, shape):
+        '''
+        yields every rule index, in the order they should be applied to a word with this shape
+        '''
+
+        head = self.shapes.get(shape, ())
+        yield from head
+        head = set(head)
+        for i in self.ranking:
+            if i not in head:
+                yield i
+
+
+    def complete_ranking(self, ranking):
+
+        ranked = set(ranking)
+        return list(ranking) + [i for i in range(len(self.prefixes)) if i not in ranked]
+
+
+    @classmethod
+    def train(cls, passwords, prefixes, suffixes):
+
+        rules = {rule: i for i, rule in reversed(list(enumerate(zip(prefixes, suffixes))))}
+        max_prefix = max([len(p) for p in prefixes], default=0)
+        max_suffix = max([len(s) for s in suffixes], default=0)
+        # rules don't contain letters, so most passwords only have a few ways to split
+        leading = re.compile(rb'[^a-zA-Z]*')
+        trailing = re.compile(rb'[^a-zA-Z]*$')
+
+        counts = Counter()
+        overall = Counter()
+        for password in passwords:
+            length = len(password)
+            max_p = min(max_prefix, leading.match(password).end())
+            max_s = min(max_suffix, length - trailing.search(password).start())
+            longest = (0, None)
+            for p in range(max_p + 1):
+                for s in range(max_s + 1):
+                    # the base word can't be empty, and the unmodified word isn't a rule
+                    if p + s >= length or not (p or s):
+                        continue
+                    rule = rules.get((password[:p], password[length-s:]), None)
+                    if rule is not None:
+                        counts[(word_shape(password[p:length-s]), rule)] += 1
+                        longest = max(longest, (p + s, rule))
+            if longest[1] is not None:
+                overall[longest[1]] += 1
+
+        samples = Counter()
+        for (shape, rule), count in counts.items():
+            samples[shape] += count
+        ranking = [rule for rule, _ in sorted(overall.items(), key=lambda x: (-x[1], x[0]))]
+        rank = {rule: i for i, rule in enumerate(ranking)}
+
+        # ties go to the rule which is more common overall
+        shapes = dict()
+        for (shape, rule), count in counts.items():
+            if samples[shape] >= cls.min_samples:
+                key = (-count, rank.get(rule, len(rank)), rule)
+                try:
+                    shapes[shape].append(key)
+                except KeyError:
+                    shapes[shape] = [key]
+        for shape, rules in shapes.items():
+            shapes[shape] = [rule for _, _, rule in sorted(rules)[:cls.top]]
+
+        return cls(prefixes, suffixes, shapes=shapes, ranking=ranking)
+
+
+    def save(self, filename):
+
+        model = {
+            'version': self.version,
+            'rules': rules_fingerprint(self.prefixes, self.suffixes),
+            'ranking': self.ranking,
+            'shapes': {':'.join([str(x) for x in shape]): rules for shape, rules in self.shapes.items()},
+        }
+
+        tmp_file = f'{filename}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(model, f, separators=(',', ':'))
+            os.replace(tmp_file, filename)
+        except OSError as e:
+            raise RuleError(f'Failed to save append/prepend model to {filename}: {e}')
+
+
+    @classmethod
+    def load(cls, filename, prefixes, suffixes):
+
+        try:
+            with open(filename) as f:
+                model = json.load(f)
+        except (OSError, ValueError) as e:
+            raise RuleError(f'Failed to read append/prepend model from {filename}: {e}')
+
+        if not isinstance(model, dict) or model.get('version', None) != cls.version:
+            raise RuleError(f'Unsupported append/prepend model format in {filename}')
+        if model['rules'] != rules_fingerprint(prefixes, suffixes):
+            raise RuleError(f'Append/prepend model in {filename} was trained with different rules, please train it again')
+
+        shapes = dict()
+        for shape, rules in model['shapes'].items():
+            length, case, last = shape.split(':')
+            shapes[(int(length), case, last)] = rules
+
+        return cls(prefixes, suffixes, shapes=shapes, ranking=model['ranking'])
+
+
+    def fingerprint(self):
+
+        key = hashlib.sha1(repr(self.ranking).encode())
+        key.update(repr(sorted(self.shapes.items())).encode())
+        return key.hexdigest()
+
+
+
+def word_shape(word):
+    '''
+    (length, case pattern, class of the last character)
+    e.g. b'Summer' --> (6, 'title', 'alpha')
+    '''
+
+    if word.islower():
+        case = 'lower'
+    elif word.isupper():
+        case = 'upper'
+    elif word.istitle():
+        case = 'title'
+    elif word.lower() != word.upper():
+        case = 'mixed'
+    else:
+        case = 'none'
+
+    last = word[-1:]
+    if last.isdigit():
+        last = 'digit'
+    elif last.isalpha():
+        last = 'alpha'
+    else:
+        last = 'special'
+
+    # anything longer is lumped together
+    return (min(len(word), 12), case, last)
+
+
+def rules_fingerprint(prefixes, suffixes):
+
+    return hashlib.sha1(b'\n'.join(prefixes) + b'\0' + b'\n'.join(suffixes)).hexdigest()
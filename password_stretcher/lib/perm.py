@@ -3,6 +3,7 @@
 # by TheTechromancer
 
 import itertools
+from bisect import bisect_right
 from .mutator import Mutator
 
 
@@ -11,6 +12,9 @@ class Perm(Mutator):
     permutates words from iterable
     takes:      iterable containing words
     yields:     word permutations ('pass', 'word' --> 'password', 'wordpass', etc.)
+
+    permutations are ordered by their total length, shortest first, then by number of words
+    each one has an index, and perm[i] looks it up without generating the ones before it
     '''
 
     fname = 'perm'
@@ -21,34 +25,335 @@ class Perm(Mutator):
         self.double = double
         self.input = _input
 
+        # index of the first permutation to yield, for resuming (see Mangler.resume())
+        self.start = 0
+        # index of the permutation most recently yielded
+        self.index = None
+        # called with the index of each permutation, right before it's yielded
+        self.on_word = None
+        # skip ranges of permutations that are all too short or too long
+        # called with a length in bytes, returns whether it fits (see LengthPlan)
+        # it's up to the caller to check the rest (see window_ranges())
+        self.length_window = None
+        # called with (start, stop) for each range of permutations the length window skips
+        self.on_skip = None
+
+        # see build_index()
+        self.words = None
+        self.lengths = []
+        self.ranges = dict()
+        self.combos = []
+        self.blocks = []
+        self.block_offsets = []
+        self.splits = dict()
+
         super().__init__(_input, limit=None)
 
 
     def __len__(self):
 
-        length = len(self.input)
+        # prevent division by zero
+        return max(1, self.num_permutations())
+
+
+    def num_permutations(self):
+
+        n = len(self.input)
 
         if self.perm_depth > 1:
-            initial_length = len(self.input)
-            for i in range(2, self.perm_depth+1):
-                length += initial_length ** i
+            # n + n^2 + ... + n^depth
+            if n == 1:
+                return self.perm_depth
+            return (n ** (self.perm_depth + 1) - n) // (n - 1)
 
         elif self.double:
-            length *= 2
+            return n * 2
 
-        # prevent division by zero
-        return max(1, length)
+        return n
+
+
+    def __getitem__(self, index):
+        '''
+        looks up a single permutation by its index
+        '''
+
+        if index < 0:
+            index += self.num_permutations()
+        if not 0 <= index < self.num_permutations():
+            raise IndexError('permutation index out of range')
+
+        if self.perm_depth > 1:
+            self.build_index()
+            b = bisect_right(self.block_offsets, index) - 1
+            total_length, depth = self.blocks[b]
+            return b''.join(self.decode(depth, total_length, index - self.block_offsets[b]))
+
+        if self.double:
+            index, double = divmod(index, 2)
+            return self.input[index] * (2 if double else 1)
+
+        return self.input[index]
 
 
     def __iter__(self):
 
+        if self.length_window is None:
+            ranges = [(self.start, None)]
+        else:
+            ranges = [(max(self.start, start), stop) for start, stop in self.window_ranges(fits=self.length_window) if stop > self.start]
+
+        skipped = self.start
+        for start, stop in ranges:
+            # whatever's skipped still needs to be accounted for, as if it was pruned
+            if self.on_skip is not None and start > skipped:
+                self.on_skip(skipped, start)
+            # (nothing's left to use the credit after the last range, so the rest isn't counted)
+            skipped = stop
+
+            words = self.permutations(start, stop)
+
+            if self.on_word is None:
+                if self.output_filter is None:
+                    yield from words
+                else:
+                    yield from self.prune(words)
+
+            else:
+                for index, word in enumerate(words, start):
+                    if self.output_filter is not None and not self.output_filter(word):
+                        if self.on_prune is not None:
+                            self.on_prune(word)
+                        continue
+                    self.index = index
+                    self.on_word(index)
+                    yield word
+
+
+    def permutations(self, start=0, stop=None):
+        '''
+        returns an iterator over permutations <start> through <stop>, without generating the ones before <start>
+        '''
+
         if self.perm_depth > 1:
-            for d in range(1, self.perm_depth+1):
-                for p in itertools.product(self.input, repeat=d):
-                    yield b''.join(p)
+            self.build_index()
+            b = bisect_right(self.block_offsets, start) - 1
+            skip = start - self.block_offsets[b]
+            results = itertools.chain.from_iterable(
+                self.combinations(b'', depth, total_length, skip if i == b else 0)
+                for i, (total_length, depth) in enumerate(self.blocks[b:], b)
+            )
+
+        else:
+            step = 2 if self.double else 1
+            skip, odd = divmod(start, step)
+            words = self.input
+            if stop is not None and isinstance(words, list):
+                # don't walk the whole list just to get to the start
+                words = words[skip:-(-stop // step)]
+            elif skip:
+                words = itertools.islice(words, skip, None)
+            results = self.singles(words, skip_first=odd)
+
+        if stop is not None:
+            results = itertools.islice(results, max(0, stop - start))
+        return results
+
+
+    def singles(self, words, skip_first=False):
+        '''
+        yields each word (and its double)
+        skip_first starts between the first word and its double
+        '''
+
+        words = iter(words)
+        if skip_first:
+            for word in words:
+                yield word + word
+                break
+
+        for word in words:
+            yield word
+            if self.double:
+                yield word + word
+
+
+    def window_ranges(self, minlength=None, maxlength=None, fits=None):
+        '''
+        ranges of permutation indices which contain every permutation within the length window
+        (or every length for which fits(length) is true)
+        (start, stop), in order
+        a range may also include a few that don't fit, when doubling or if the input isn't sorted by length
+        '''
+
+        if fits is None:
+            if minlength is None:
+                minlength = 0
+            if maxlength is None:
+                maxlength = float('inf')
+            fits = lambda length: minlength <= length <= maxlength
+
+        self.build_index()
+        ranges = []
+
+        if self.perm_depth > 1:
+            for b, (total_length, depth) in enumerate(self.blocks):
+                if fits(total_length):
+                    ranges.append((self.block_offsets[b], self.block_offsets[b+1]))
+
+        elif self.words is not self.input:
+            ranges.append((0, self.num_permutations()))
+
+        else:
+            step = 2 if self.double else 1
+            for length in self.lengths:
+                # a double might fit even if the word doesn't
+                if fits(length) or (self.double and fits(length*2)):
+                    lo, hi = self.ranges[length]
+                    ranges.append((lo * step, hi * step))
+
+        # merge adjacent ranges
+        merged = []
+        for start, stop in ranges:
+            if merged and merged[-1][1] == start:
+                merged[-1] = (merged[-1][0], stop)
+            else:
+                merged.append((start, stop))
+        return merged
+
+
+    def build_index(self):
+        '''
+        indexes the input so that permutations can be looked up and enumerated by length
+
+        words of the same length are contiguous in the (length-sorted) input, so each length is a range
+        combos[m][t] is the number of m-word combinations with a total length of t
+        the permutations are split into blocks of (total length, number of words), shortest first
+        '''
+
+        if self.words is not None:
+            return
+
+        words = self.input
+        if any(len(words[i]) > len(words[i+1]) for i in range(len(words)-1)):
+            words = sorted(words, key=len)
+        self.words = words
+
+        self.ranges = dict()
+        for i, word in enumerate(words):
+            length = len(word)
+            try:
+                self.ranges[length] = (self.ranges[length][0], i+1)
+            except KeyError:
+                self.ranges[length] = (i, i+1)
+        self.lengths = sorted(self.ranges)
+
+        depth = max(1, self.perm_depth)
+        self.combos = [{0: 1}]
+        for m in range(1, depth+1):
+            combos = dict()
+            for total_length, count in self.combos[-1].items():
+                for length in self.lengths:
+                    lo, hi = self.ranges[length]
+                    combos[total_length + length] = combos.get(total_length + length, 0) + count * (hi - lo)
+            self.combos.append(combos)
+
+        self.blocks = sorted([(t, m) for m in range(1, depth+1) for t in self.combos[m]])
+        self.block_offsets = [0] + list(itertools.accumulate([self.combos[m][t] for t, m in self.blocks]))
+
+
+    def split(self, m, total_length):
+        '''
+        the m-word combinations totalling total_length, grouped by the length of their first word
+        returns ([first word lengths], [index where each group starts], [combinations per first word])
+        '''
+
+        try:
+            return self.splits[(m, total_length)]
+        except KeyError:
+            pass
+
+        lengths, starts, sizes = [], [], []
+        offset = 0
+        for length in self.lengths:
+            rest = self.combos[m-1].get(total_length - length, 0)
+            if rest:
+                lo, hi = self.ranges[length]
+                lengths.append(length)
+                starts.append(offset)
+                sizes.append(rest)
+                offset += rest * (hi - lo)
+
+        self.splits[(m, total_length)] = (lengths, starts, sizes)
+        return lengths, starts, sizes
+
+
+    def decode(self, m, total_length, index):
+        '''
+        finds the <index>th m-word combination totalling total_length
+        one bisect per word
+        '''
+
+        results = []
+        for m in range(m, 1, -1):
+            lengths, starts, sizes = self.split(m, total_length)
+            g = bisect_right(starts, index) - 1
+            first, index = divmod(index - starts[g], sizes[g])
+            results.append(self.words[self.ranges[lengths[g]][0] + first])
+            total_length -= lengths[g]
+        results.append(self.words[self.ranges[total_length][0] + index])
+        return results
+
+
+    def combinations(self, prefix, m, total_length, skip=0):
+        '''
+        yields every m-word combination totalling total_length, appended to prefix
+        the first <skip> are skipped without generating them
+        '''
+
+        if m == 1:
+            lo, hi = self.ranges[total_length]
+            yield from [prefix + word for word in self.words[lo+skip:hi]]
+            return
+
+        lengths, starts, sizes = self.split(m, total_length)
+        g = bisect_right(starts, skip) - 1
+        first, skip = divmod(skip - starts[g], sizes[g])
+        for length, rest in zip(lengths[g:], sizes[g:]):
+            lo, hi = self.ranges[length]
+            if m == 2:
+                # the last word is handled here instead of recursing, since this is where most of the time goes
+                last_lo, last_hi = self.ranges[total_length - length]
+                last_words = self.words[last_lo:last_hi]
+                for word in self.words[lo+first:hi]:
+                    word = prefix + word
+                    yield from [word + last_word for last_word in last_words[skip:]]
+                    skip = 0
+            else:
+                for word in self.words[lo+first:hi]:
+                    yield from self.combinations(prefix + word, m-1, total_length - length, skip)
+                    skip = 0
+            first = 0
+
+
+    def chunks(self, size, first=0, step=1):
+        '''
+        splits the permutations into chunks of <size>, numbered by their position
+        yields (chunk number, permutations) for every <step>th chunk, starting with chunk <first>
+        if the input is in memory, the chunks in between are skipped without generating them
+        '''
+
+        if isinstance(self.input, list):
+            num_chunks = -(-self.num_permutations() // size)
+            for c in range(first, num_chunks, step):
+                yield c, list(self.permutations(c*size, (c+1)*size))
 
         else:
-            for word in self.input:
-                yield word
-                if self.double:
-                    yield word + word
\ No newline at end of file
+            words = self.permutations(first*size)
+            c = first
+            while 1:
+                chunk = list(itertools.islice(words, size))
+                if not chunk:
+                    break
+                if (c - first) % step == 0:
+                    yield c, chunk
+                c += 1
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import math
+
+
+class LengthPlan():
+    '''
+    the lengths a word can have and still end up inside the policy's length window after the given mutators
+    leet and capitalization never change the length, and every append/prepend rule adds a known number of characters,
+    so this is worked out once up front instead of for every candidate
+
+    e.g. with --minlength 8 --maxlength 10, if the rules add 0-4 or 6 characters, a 3-character word can never fit
+    optionally, the final length also has to be one of <lengths> (e.g. the lengths of the masks)
+    called with a length, returns False if no word of that length can fit
+    '''
+
+    # beyond this many possible lengths, just use the range
+    max_lengths = 4096
+
+    def __init__(self, policy, mutators=(), check_max=True, lengths=None):
+
+        self.minlength = None if policy is None else policy.minlength
+        # the maximum can't be checked against byte lengths of non-ASCII words (see Mangler.push_down_policy())
+        self.maxlength = policy.maxlength if check_max and policy is not None else None
+        self.final_lengths = None if lengths is None else set(lengths)
+
+        # every number of characters the mutators might add (or None if there are too many to list)
+        self.added = added_lengths(mutators)
+        if self.added is None:
+            self.min_added = sum([m.added_length_range()[0] for m in mutators])
+            self.max_added = sum([m.added_length_range()[1] for m in mutators])
+        else:
+            self.min_added = min(self.added)
+            self.max_added = max(self.added)
+
+        # {length: fits}
+        self.lengths = dict()
+
+
+    def __call__(self, length):
+
+        try:
+            return self.lengths[length]
+        except KeyError:
+            pass
+
+        minlength = -math.inf if self.minlength is None else self.minlength
+        maxlength = math.inf if self.maxlength is None else self.maxlength
+        if self.final_lengths is not None:
+            # only these are possible
+            fits = any([
+                minlength <= final <= maxlength and
+                (self.min_added <= final - length <= self.max_added if self.added is None else final - length in self.added)
+                for final in self.final_lengths
+            ])
+        elif self.added is None:
+            fits = length + self.max_added >= minlength and length + self.min_added <= maxlength
+        else:
+            fits = any([minlength <= length + added <= maxlength for added in self.added])
+
+        self.lengths[length] = fits
+        return fits
+
+
+    def __bool__(self):
+
+        return self.minlength is not None or self.maxlength is not None or self.final_lengths is not None
+
+
+
+def added_lengths(mutators):
+    '''
+    every total number of characters the mutators might add to a word, together
+    None if a mutator can't say, or there are too many
+    '''
+
+    totals = {0}
+    for mutator in mutators:
+        lengths = mutator.length_changes()
+        if lengths is None:
+            return None
+        totals = {total + added for total in totals for added in lengths}
+        if len(totals) > LengthPlan.max_lengths:
+            return None
+
+    return totals
@@ -3,6 +3,10 @@
 # This was adapted from the Password Statistical Analysis tool by Peter Kacherginsky
 # https://github.com/iphelix/pack
 
+from .utils import is_ascii
+from .planner import LengthPlan
+
+
 class PasswordPolicy:
 
     charset_choices = ['numeric', 'loweralpha', 'upperalpha', 'special']
@@ -29,6 +33,15 @@ class PasswordPolicy:
         'special': 0b1000
     }
 
+    # maps each ASCII byte to its charset flag, for classifying with bytes.translate()
+    charset_table = bytes([
+        0b0001 if chr(b).isdigit() else 0b0010 if chr(b).islower() else 0b0100 if chr(b).isupper() else 0b1000
+        for b in range(128)
+    ] + [0b1000] * 128)
+
+    # number of charsets in each combination of flags
+    charset_counts = [bin(c).count('1') for c in range(16)]
+
     def __init__(self, minlength=None, maxlength=None, mincharsets=None, required_charsets=None, regex=None):
 
         self.minlength = minlength
@@ -45,27 +58,121 @@ class PasswordPolicy:
 
     def meets_policy(self, password, pass_length=None, charset=None):
 
-        if type(password) == bytes:
-            try:
-                password = password.decode()
-            except UnicodeError:
-                password = str(password)[2:-1]
+        # fast path: ASCII bytes, and only calculate the charset if we need it
+        if type(password) == bytes and is_ascii(password):
+            if pass_length is None:
+                pass_length = len(password)
+            if (self.maxlength is not None and pass_length > self.maxlength) or \
+               (self.minlength is not None and pass_length < self.minlength):
+                return False
+            if self.mincharsets is not None or self.required_charset is not None:
+                if charset is None:
+                    classes = password.translate(self.charset_table)
+                    charset = (0b0001 in classes) | ((0b0010 in classes) << 1) | ((0b0100 in classes) << 2) | ((0b1000 in classes) << 3)
+                if (self.mincharsets is not None and self.charset_counts[charset] < self.mincharsets) or \
+                   (self.required_charset is not None and self.required_charset & charset != self.required_charset):
+                    return False
+            return self.regex is None or self.regex.match(password.decode()) is not None
 
-        #if pass_length is None or charset is None:
-        meets_policy, pass_length, charset, num_charsets, simplemask, advancedmask = self.analyze_password(password, calc_policy=False)
+        if pass_length is None or charset is None:
+            pass_length, charset, num_charsets = self.classify(password)
 
         meets_policy = False
-        if (self.maxlength is None          or pass_length <= self.maxlength) and \
-           (self.minlength is None          or pass_length >= self.minlength) and \
-           (self.regex is None              or self.regex.match(password)) and \
-           (self.mincharsets is None        or num_charsets >= self.mincharsets) and \
-           (self.required_charset is None   or self.required_charset & charset == self.required_charset):
+        if self.meets_constraints(pass_length, charset) and \
+           (self.regex is None              or self.regex.match(self.decode(password))):
            meets_policy = True
         return meets_policy
 
 
+    def classify(self, password):
+        '''
+        returns (length, charset, number of charsets)
+        ASCII bytes are classified without decoding, using a lookup table
+        '''
+
+        if type(password) == bytes and is_ascii(password):
+            classes = password.translate(self.charset_table)
+            charset = (0b0001 in classes) | ((0b0010 in classes) << 1) | ((0b0100 in classes) << 2) | ((0b1000 in classes) << 3)
+            return (len(password), charset, self.charset_counts[charset])
+
+        meets_policy, pass_length, charset, num_charsets, simplemask, advancedmask = self.analyze_password(self.decode(password), calc_policy=False)
+        return (pass_length, charset, num_charsets)
+
+
+    def classify_many(self, passwords):
+        '''
+        classifies a list of passwords at once
+        returns a list of (length, charset, number of charsets)
+        '''
+
+        table = self.charset_table
+        counts = self.charset_counts
+        results = []
+        for password in passwords:
+            if type(password) == bytes and is_ascii(password):
+                classes = password.translate(table)
+                charset = (0b0001 in classes) | ((0b0010 in classes) << 1) | ((0b0100 in classes) << 2) | ((0b1000 in classes) << 3)
+                results.append((len(password), charset, counts[charset]))
+            else:
+                results.append(self.classify(password))
+        return results
+
+
+    def filter_many(self, passwords):
+        '''
+        returns only the passwords from a list which meet the policy
+        '''
+
+        return [p for p, (pass_length, charset, _) in zip(passwords, self.classify_many(passwords)) if self.meets_policy(p, pass_length, charset)]
+
+
+    def meets_constraints(self, pass_length, charset):
+        '''
+        checks the length and charset parts of the policy (everything except regex)
+        '''
+
+        return (self.maxlength is None          or pass_length <= self.maxlength) and \
+               (self.minlength is None          or pass_length >= self.minlength) and \
+               (self.mincharsets is None        or self.charset_counts[charset] >= self.mincharsets) and \
+               (self.required_charset is None   or self.required_charset & charset == self.required_charset)
+
+
+    def meets_charsets(self, charset):
+
+        return (self.mincharsets is None        or self.charset_counts[charset] >= self.mincharsets) and \
+               (self.required_charset is None   or self.required_charset & charset == self.required_charset)
+
+
+    def length(self, password):
+
+        if type(password) == bytes and is_ascii(password):
+            return len(password)
+        return len(self.decode(password))
+
+
+    def charset(self, password):
+
+        return self.classify(password)[1]
+
+
+    @staticmethod
+    def decode(password):
+
+        if type(password) == bytes:
+            try:
+                password = password.decode()
+            except UnicodeError:
+                password = str(password)[2:-1]
+        return password
+
+
     def analyze_password(self, password, calc_policy=True):
 
+        # no masks needed, so take the fast path
+        if not calc_policy and is_ascii(password):
+            pass_length, charset, num_charsets = self.classify(password.encode() if type(password) == str else password)
+            return (None, pass_length, charset, num_charsets, '', '')
+
         # Character-set flags
         charset = 0b0000
         required_charset = 0b0000
@@ -128,4 +235,47 @@ class PasswordPolicy:
 
     def __bool__(self):
 
-        return not all([_ is None for _ in [self.minlength, self.maxlength, self.mincharsets, self.required_charset, self.regex]])
\ No newline at end of file
+        return not all([_ is None for _ in [self.minlength, self.maxlength, self.mincharsets, self.required_charset, self.regex]])
+
+
+
+class PolicyConstraint:
+    '''
+    the length and charset parts of a password policy,
+    relaxed to allow for anything the given (later) mutators might still change
+    called on a word, returns False if it can never meet the policy
+    '''
+
+    def __init__(self, policy, mutators=()):
+
+        self.policy = policy
+        self.mutators = list(mutators)
+
+        # which lengths can still end up in the length window
+        self.fits = LengthPlan(policy, self.mutators)
+
+        self.check_length = bool(self.fits)
+        self.check_charsets = policy.mincharsets is not None or policy.required_charset is not None
+
+
+    def __call__(self, word):
+
+        if self.check_length and not self.fits(self.policy.length(word)):
+            return False
+
+        if self.check_charsets:
+            return self.policy.meets_charsets(self.reachable_charsets(self.policy.charset(word)))
+
+        return True
+
+
+    def reachable_charsets(self, charset):
+
+        for mutator in self.mutators:
+            charset = mutator.reachable_charsets(charset)
+        return charset
+
+
+    def __bool__(self):
+
+        return self.check_length or self.check_charsets
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+from itertools import accumulate, chain
+from .mutator import Mutator
+from .errors import RuleError
+from .policy import PasswordPolicy
+
+
+class Rules(Mutator):
+    '''
+    applies hashcat rules to each word, like piping into hashcat -r
+    takes:      iterable containing words, and a list of rule files
+    yields:     the result of each rule ('c $1' --> 'Password1')
+
+    each rule is compiled once into a program: a tuple of (function, arg, arg) steps
+    runs of appends and prepends are merged into a single step,
+    and rules which compile to the same program are only applied once
+    rules that use unsupported functions (like the memory functions M, X, 4, and 6) are skipped
+    '''
+
+    scale = 5
+    fname = 'rules'
+
+    def __init__(self, _input, rule_files=(), limit=2048):
+
+        self.programs = []
+        # the rule each program was compiled from
+        self.rules = []
+        # rules that couldn't be parsed
+        self.skipped = []
+        self.read_rules(rule_files)
+
+        # running total of the bytes added by each rule, where it doesn't depend on the word
+        ranges = [program_length_range(p) for p in self.programs]
+        self.added_lengths = list(accumulate([lo if lo == hi else 0 for lo, hi in ranges]))
+        self.length_range = (min([lo for lo, hi in ranges]), max([hi for lo, hi in ranges]))
+
+        # every charset the rules can add (see reachable_charsets())
+        self.rules_charset = None
+
+        super().__init__(_input, limit)
+
+
+    def __len__(self):
+
+        return min(self.limit, len(self.programs))
+
+
+    def mutate(self, word):
+
+        # different rules often produce the same result
+        seen = set()
+        for program in self.programs:
+            result = word
+            for function, a, b in program:
+                result = function(result, a, b)
+                if result is None:
+                    break
+            else:
+                if result not in seen:
+                    seen.add(result)
+                    yield result
+
+
+    def count(self, word):
+
+        return len(self.programs)
+
+
+    def added_length(self, n):
+
+        if n <= 0 or not self.added_lengths:
+            return 0
+        return self.added_lengths[min(n, len(self.added_lengths)) - 1]
+
+
+    def added_length_range(self):
+
+        return self.length_range
+
+
+    def reachable_charsets(self, charset):
+
+        if self.rules_charset is None:
+            self.rules_charset = 0
+            for program in self.programs:
+                for function, a, b in program:
+                    if function in inserting_functions:
+                        self.rules_charset |= PasswordPolicy().charset(b''.join([arg for arg in (a, b) if type(arg) == bytes]))
+                    elif function in shifting_functions:
+                        # these can turn a character into anything
+                        self.rules_charset |= 0b1111
+
+        # any letter can end up as either case
+        alpha = PasswordPolicy.charset_flags['loweralpha'] | PasswordPolicy.charset_flags['upperalpha']
+        if charset & alpha:
+            charset |= alpha
+        return charset | self.rules_charset
+
+
+    def read_rules(self, rule_files):
+
+        programs = dict()
+        for rule_file in rule_files:
+            try:
+                with open(rule_file, 'rb') as f:
+                    lines = f.read().splitlines()
+            except OSError as e:
+                raise RuleError(f'Failed to read rules from {rule_file}: {e}')
+
+            for line in lines:
+                if not line or line.startswith(b'#'):
+                    continue
+                try:
+                    program = compile_rule(line)
+                except RuleError:
+                    self.skipped.append(line)
+                    continue
+                # a dict keeps the first of each identical program, in order
+                programs.setdefault(program, line)
+
+        self.programs = list(programs)
+        self.rules = list(programs.values())
+        if not self.programs:
+            raise RuleError('No usable rules found')
+
+
+
+### rule functions ###
+# each one takes (word, arg, arg) and returns the new word, or None to reject it
+# like hashcat, a position past the end of the word leaves it unchanged
+
+def lower(w, a, b):
+    return w.lower()
+
+def upper(w, a, b):
+    return w.upper()
+
+def capitalize(w, a, b):
+    return w.capitalize()
+
+def invert_capitalize(w, a, b):
+    return w[:1].lower() + w[1:].upper()
+
+def toggle_all(w, a, b):
+    return w.swapcase()
+
+def toggle_at(w, n, b):
+    return w[:n] + w[n:n+1].swapcase() + w[n+1:]
+
+def reverse(w, a, b):
+    return w[::-1]
+
+def duplicate(w, a, b):
+    return w + w
+
+def duplicate_n(w, n, b):
+    return w * (n + 1)
+
+def reflect(w, a, b):
+    return w + w[::-1]
+
+def rotate_left(w, a, b):
+    return w[1:] + w[:1]
+
+def rotate_right(w, a, b):
+    return w[-1:] + w[:-1]
+
+def pend(w, prefix, suffix):
+    return prefix + w + suffix
+
+def delete_first(w, a, b):
+    return w[1:]
+
+def delete_last(w, a, b):
+    return w[:-1]
+
+def delete_at(w, n, b):
+    return w[:n] + w[n+1:]
+
+def extract(w, n, m):
+    return w[n:n+m] if n + m <= len(w) else w
+
+def omit(w, n, m):
+    return w[:n] + w[n+m:] if n + m <= len(w) else w
+
+def insert(w, n, x):
+    return w[:n] + x + w[n:] if n <= len(w) else w
+
+def overwrite(w, n, x):
+    return w[:n] + x + w[n+1:] if n < len(w) else w
+
+def truncate(w, n, b):
+    return w[:n]
+
+def replace(w, x, y):
+    return w.replace(x, y)
+
+def purge(w, x, b):
+    return w.replace(x, b'')
+
+def duplicate_first(w, n, b):
+    return w[:1] * n + w
+
+def duplicate_last(w, n, b):
+    return w + w[-1:] * n
+
+def duplicate_all(w, a, b):
+    return bytes(chain.from_iterable(zip(w, w)))
+
+def duplicate_block_front(w, n, b):
+    return w[:n] + w if n <= len(w) else w
+
+def duplicate_block_back(w, n, b):
+    return w + w[-n:] if 0 < n <= len(w) else w
+
+def swap_front(w, a, b):
+    return w[1:2] + w[:1] + w[2:] if len(w) >= 2 else w
+
+def swap_back(w, a, b):
+    return w[:-2] + w[-1:] + w[-2:-1] if len(w) >= 2 else w
+
+def swap_at(w, n, m):
+    if n >= len(w) or m >= len(w):
+        return w
+    chars = bytearray(w)
+    chars[n], chars[m] = chars[m], chars[n]
+    return bytes(chars)
+
+def title(w, sep, b):
+    return sep.join([part.capitalize() for part in w.lower().split(sep)])
+
+def shift_at(f):
+    # builds a function which changes the character at a position
+    def shift(w, n, b):
+        if n >= len(w):
+            return w
+        return w[:n] + bytes([f(w, n) & 0xff]) + w[n+1:]
+    return shift
+
+increment_at = shift_at(lambda w, n: w[n] + 1)
+decrement_at = shift_at(lambda w, n: w[n] - 1)
+shift_left_at = shift_at(lambda w, n: w[n] << 1)
+shift_right_at = shift_at(lambda w, n: w[n] >> 1)
+replace_next = shift_at(lambda w, n: w[n+1] if n + 1 < len(w) else w[n])
+replace_prev = shift_at(lambda w, n: w[n-1] if n > 0 else w[n])
+
+def reject_longer(w, n, b):
+    return w if len(w) <= n else None
+
+def reject_shorter(w, n, b):
+    return w if len(w) >= n else None
+
+def reject_unless_length(w, n, b):
+    return w if len(w) == n else None
+
+def reject_contains(w, x, b):
+    return None if x in w else w
+
+def reject_unless_contains(w, x, b):
+    return w if x in w else None
+
+def reject_unless_starts(w, x, b):
+    return w if w.startswith(x) else None
+
+def reject_unless_ends(w, x, b):
+    return w if w.endswith(x) else None
+
+def reject_unless_at(w, n, x):
+    return w if w[n:n+1] == x else None
+
+def reject_unless_count(w, n, x):
+    return w if w.count(x) >= n else None
+
+
+# rule character --> (function, argument types), where N is a position or number and X is a character
+rule_functions = {
+    b':': (None, ''),
+    b'l': (lower, ''),
+    b'u': (upper, ''),
+    b'c': (capitalize, ''),
+    b'C': (invert_capitalize, ''),
+    b't': (toggle_all, ''),
+    b'T': (toggle_at, 'N'),
+    b'r': (reverse, ''),
+    b'd': (duplicate, ''),
+    b'p': (duplicate_n, 'N'),
+    b'f': (reflect, ''),
+    b'{': (rotate_left, ''),
+    b'}': (rotate_right, ''),
+    b'$': (pend, 'X'),
+    b'^': (pend, 'X'),
+    b'[': (delete_first, ''),
+    b']': (delete_last, ''),
+    b'D': (delete_at, 'N'),
+    b'x': (extract, 'NN'),
+    b'O': (omit, 'NN'),
+    b'i': (insert, 'NX'),
+    b'o': (overwrite, 'NX'),
+    b"'": (truncate, 'N'),
+    b's': (replace, 'XX'),
+    b'@': (purge, 'X'),
+    b'z': (duplicate_first, 'N'),
+    b'Z': (duplicate_last, 'N'),
+    b'q': (duplicate_all, ''),
+    b'y': (duplicate_block_front, 'N'),
+    b'Y': (duplicate_block_back, 'N'),
+    b'k': (swap_front, ''),
+    b'K': (swap_back, ''),
+    b'*': (swap_at, 'NN'),
+    b'E': (title, ''),
+    b'e': (title, 'X'),
+    b'+': (increment_at, 'N'),
+    b'-': (decrement_at, 'N'),
+    b'L': (shift_left_at, 'N'),
+    b'R': (shift_right_at, 'N'),
+    b'.': (replace_next, 'N'),
+    b',': (replace_prev, 'N'),
+    b'<': (reject_longer, 'N'),
+    b'>': (reject_shorter, 'N'),
+    b'_': (reject_unless_length, 'N'),
+    b'!': (reject_contains, 'X'),
+    b'/': (reject_unless_contains, 'X'),
+    b'(': (reject_unless_starts, 'X'),
+    b')': (reject_unless_ends, 'X'),
+    b'=': (reject_unless_at, 'NX'),
+    b'%': (reject_unless_count, 'NX'),
+}
+
+# functions which add their argument to the word
+inserting_functions = {pend, insert, overwrite, replace, title}
+# functions which can produce any character
+shifting_functions = {increment_at, decrement_at, shift_left_at, shift_right_at}
+# functions which set the case of every letter, regardless of what it was before
+case_functions = {lower, upper, capitalize, invert_capitalize, title}
+# functions which undo themselves
+involutions = {reverse, toggle_all, swap_front, swap_back}
+
+positions = b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def compile_rule(rule):
+    '''
+    compiles a hashcat rule (bytes) into a program: a tuple of (function, arg, arg) steps
+    raises RuleError if the rule is malformed or uses something we don't support
+    '''
+
+    steps = []
+    i = 0
+    while i < len(rule):
+        char = rule[i:i+1]
+        i += 1
+        # spaces between functions are ignored
+        if char == b' ':
+            continue
+        try:
+            function, arg_types = rule_functions[char]
+        except KeyError:
+            raise RuleError(f'Unsupported rule function: {char}')
+
+        args = []
+        for arg_type in arg_types:
+            if i >= len(rule):
+                raise RuleError(f'Missing argument for rule function: {char}')
+            arg = rule[i:i+1]
+            i += 1
+            if arg_type == 'N':
+                arg = positions.find(arg)
+                if arg < 0:
+                    raise RuleError(f'Invalid position for rule function: {char}')
+            args.append(arg)
+
+        if function is None:
+            continue
+        if char == b'$':
+            args = [b'', args[0]]
+        elif char == b'^':
+            args = [args[0], b'']
+        elif char == b'E':
+            args = [b' ']
+        args += [None] * (2 - len(args))
+        steps.append((function, args[0], args[1]))
+
+    return optimize(steps)
+
+
+def optimize(steps):
+    '''
+    merges and drops steps that don't change the result
+    so that rules which do the same thing end up as the same program
+    '''
+
+    program = []
+    for step in steps:
+        function = step[0]
+        if program:
+            previous = program[-1][0]
+            if function == pend and previous == pend:
+                # ^a $1 ^b $2 --> ^b ^a $1 $2
+                _, prefix, suffix = program.pop()
+                step = (pend, step[1] + prefix, suffix + step[2])
+            elif function in case_functions and previous in case_functions | {toggle_all, toggle_at}:
+                # the new case replaces the old one
+                program.pop()
+            elif function in involutions and program[-1] == step:
+                program.pop()
+                continue
+            elif (function, previous) in ((rotate_left, rotate_right), (rotate_right, rotate_left)):
+                program.pop()
+                continue
+        program.append(step)
+
+    return tuple(program)
+
+
+def program_length_range(program):
+    '''
+    the (min, max) number of bytes the program might add to a word
+    '''
+
+    lo, hi = 0, 0
+    inf = float('inf')
+    for function, a, b in program:
+        if function == pend:
+            lo, hi = lo + len(a) + len(b), hi + len(a) + len(b)
+        elif function in (insert, duplicate_first):
+            # nothing happens if the position is past the end
+            lo, hi = lo, hi + (len(b) if function == insert else a)
+        elif function in (duplicate_last, duplicate_block_front, duplicate_block_back):
+            lo, hi = lo, hi + a
+        elif function in (delete_first, delete_last, delete_at):
+            lo, hi = lo - 1, hi
+        elif function == omit:
+            lo, hi = lo - b, hi
+        elif function in (duplicate, duplicate_n, reflect, duplicate_all):
+            hi = inf
+        elif function in (extract, truncate, purge):
+            lo = -inf
+        elif function == replace:
+            # could happen any number of times
+            if len(b) < len(a):
+                lo = -inf
+            elif len(b) > len(a):
+                hi = inf
+        # rejections, case, and position changes don't change the length
+    return (lo, hi)
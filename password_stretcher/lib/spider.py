@@ -4,83 +4,115 @@
 
 import re
 import requests
+import threading
 import urllib.parse
-from sys import stderr
+from sys import stderr, version_info
+import multiprocessing
+from collections import deque, Counter
 from .errors import SpiderError
 from .utils import url_to_domain
-from html.parser import HTMLParser
+from html import unescape
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 
 
-class Parser(HTMLParser):
+class Parser():
     '''
-    Parses HTML data and extracts words
-    Keeps count of each word in self.words
-    '''
-
-    def __init__(self):
+    Extracts links and words from HTML in a single pass
+    Only visible text is counted, along with a few descriptive attributes like alt and title
+    Tag names, other attribute values, comments, scripts, and styles are skipped
 
-        self.word_regex = re.compile(r'[a-z][a-z01357$@]+[a-z]', re.I)
+    Everything that isn't text is matched by one regex, which is much faster than HTMLParser
+    '''
 
-        # track occurrences of each word
-        self.words = dict()
-        # stores each responses' links to other pages
-        self.temp_links = set()
+    word_regex = re.compile(r'[a-z][a-z01357$@]+[a-z]', re.I)
 
-        super().__init__()
+    # comments, <!doctype>, the contents of tags that aren't text, start tags (name, attributes), end tags
+    markup_regex = re.compile(r'''
+        <!--.*?(?:-->|$)
+        | <[!?][^>]*>
+        | <(script|style|template)\b.*?(?:</\1\s*>|$)
+        | <([a-z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>
+        | </[^>]*>
+    ''', re.I | re.S | re.X)
+    attr_regex = re.compile(r'''([a-z_:][-\w:.]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.I)
 
+    # attributes which contain text a person wrote
+    text_attrs = {'alt', 'title', 'placeholder'}
+    # <meta name="..." content="...">
+    meta_names = {'keywords', 'description', 'author'}
 
-    def injest(self, html):
+    def __init__(self, attrs=True):
 
-        self.temp_links.clear()
-        self.feed(html)
-        self.close()
-        self.handle_words(html)
-        return list(self.temp_links)
+        # also count words in text_attrs and meta_names
+        self.attrs = attrs
 
+        self.links = set()
+        self.text = []
 
-    def handle_words(self, html):
 
-        # strip start tags
-        #html = re.sub(r'<\w+', '', html)
-        # strip end tags
-        #html = re.sub(r'</\w+>', '', html)
+    def injest(self, html):
+        '''
+        returns the page's links and a Counter of its words
+        '''
 
-        for word in self.word_regex.findall(html):
-            try:
-                self.words[word] += 1
-            except KeyError:
-                self.words[word] = 1
+        self.links = set()
+        self.text = []
 
-    '''
-    def unknown_decl(self, data):
+        # replacing the markup with newlines leaves only the text
+        self.text.append(self.markup_regex.sub(self.handle_markup, html))
 
-        self.handle_words(data)
+        # one regex pass over all the text, instead of one per chunk
+        words = Counter(self.word_regex.findall(unescape('\n'.join(self.text))))
+        return list(self.links), words
 
 
-    def handle_data(self, data):
-        
-        self.handle_words(data)
+    def handle_markup(self, match):
 
+        tag, attrs = match.group(2, 3)
+        if tag and '=' in attrs:
+            self.handle_attrs(tag.lower(), self.attr_regex.findall(attrs))
+        return '\n'
 
-    def handle_comments(self, data):
 
-        self.handle_words(data)
-    '''
+    def handle_attrs(self, tag, attrs):
 
-    def handle_starttag(self, tag, attrs):
+        attrs = [(attr.lower(), v1 or v2 or v3) for attr, v1, v2, v3 in attrs]
 
         if tag == 'a':
             for attr, value in attrs:
                 if attr == 'href' and value:
-                    self.temp_links.add(value)
+                    self.links.add(unescape(value))
+
+        if not self.attrs:
+            return
+
+        if tag == 'meta':
+            attrs = dict(attrs)
+            if attrs.get('name', '').lower() in self.meta_names and attrs.get('content', None):
+                self.text.append(attrs['content'])
+
+        else:
+            for attr, value in attrs:
+                if attr in self.text_attrs and value:
+                    self.text.append(value)
+
+
+def parse_page(html):
+    '''
+    returns (links, word counts) for a page
+    runs in the fetching threads, or in a separate process (see Spider.parsers)
+    '''
+
+    return Parser().injest(html)
 
 
 
 
 class Spider:
 
-    def __init__(self, url, depth=2, user_agent=None):
+    def __init__(self, url, depth=2, user_agent=None, threads=8, per_host=4, max_pages=None, timeout=10, cache=None, parsers=0):
 
         if user_agent is None:
             user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.114 Safari/537.36 Edg/89.0.774.75'
@@ -88,10 +120,30 @@ class Spider:
 
         self.url = url
         self.base_domain = url_to_domain(url)
-        self.session = requests.Session()
-        self.parser = Parser()
+        # occurrences of each word across every page
+        self.words = Counter()
+        # every URL that has been queued, so we never fetch the same page twice
         self.visited = set()
         self.depth = depth
+        # number of concurrent requests, total and per hostname
+        self.threads = threads
+        self.per_host = per_host
+        # number of processes to parse pages with (0 == parse in the fetching threads)
+        self.parsers = parsers
+        self._parse_pool = None
+        # parse jobs that haven't finished yet, so they can be cancelled
+        self._parse_futures = set()
+        # maximum number of pages to request (None == unlimited)
+        self.max_pages = max_pages
+        # seconds to wait for each response
+        self.timeout = timeout
+        self.pages_fetched = 0
+        self.errors = 0
+        # pages we've already seen on a previous run (see SpiderCache)
+        self.cache = cache
+        self.pages_cached = 0
+        # each thread gets its own keep-alive session
+        self._local = threading.local()
         self.headers = {
             'Upgrade-Insecure-Requests': '1',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
@@ -109,42 +161,199 @@ class Spider:
         self.headers.update({'User-Agent': self.user_agent})
 
         try:
-            self.get(self.url)
+            self.crawl()
             stderr.write('\n')
             stderr.flush()
-        except requests.RequestException:
-            raise SpiderError(f'Error visiting URL: "{self.url}"')
         except KeyboardInterrupt:
             stderr.write('\n\n[!] Stopping spider...\n')
+        finally:
+            if self.cache is not None:
+                self.cache.close()
+
+
+    def crawl(self):
+        '''
+        breadth-first crawl with a pool of fetching threads
+        the frontier is split up by hostname so that one busy host can't starve the others
+        '''
+
+        # hostname --> deque of (url, depth)
+        frontier = dict()
+        # future --> (url, depth, hostname, cached page)
+        in_flight = dict()
+        # hostname --> number of requests in flight
+        host_load = dict()
+        pages_requested = 0
+
+        self.enqueue(frontier, self.url, self.depth)
+
+        if self.parsers > 0:
+            # forked parsers don't need to re-import everything
+            # (mp_context needs python 3.7, before which the default is already fork where it's available)
+            if version_info < (3, 7):
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parsers)
+            else:
+                if 'fork' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('fork')
+                else:
+                    context = multiprocessing.get_context()
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parsers, mp_context=context)
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            try:
+                while frontier or in_flight:
+
+                    for hostname in list(frontier):
+                        queue = frontier[hostname]
+                        while queue and len(in_flight) < self.threads and host_load.get(hostname, 0) < self.per_host:
+                            if self.max_pages is not None and pages_requested >= self.max_pages:
+                                frontier.clear()
+                                break
+                            url, depth = queue.popleft()
+                            pages_requested += 1
+                            page = None
+                            if self.cache is not None:
+                                page = self.cache.lookup(url)
+                                if page is not None and page.fresh:
+                                    # no need to ask
+                                    self.pages_cached += 1
+                                    self.process(frontier, url, depth, page.links, page.words)
+                                    continue
+                            in_flight[pool.submit(self.fetch, url, page)] = (url, depth, hostname, page)
+                            host_load[hostname] = host_load.get(hostname, 0) + 1
+                        if not queue:
+                            frontier.pop(hostname, None)
+
+                    if not in_flight:
+                        # pages from the cache may have queued more
+                        continue
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url, depth, hostname, page = in_flight.pop(future)
+                        host_load[hostname] -= 1
+                        try:
+                            response, links, words = future.result()
+                        except requests.RequestException:
+                            if url == self.url:
+                                raise SpiderError(f'Error visiting URL: "{self.url}"')
+                            self.errors += 1
+                            continue
+
+                        if page is not None and response.status_code == 304:
+                            # not modified
+                            self.pages_cached += 1
+                            self.cache.touch(url)
+                            self.process(frontier, url, depth, page.links, page.words)
+                            continue
+
+                        self.pages_fetched += 1
+                        self.process(frontier, url, depth, links, words)
+                        if self.cache is not None and response.status_code == 200:
+                            self.cache.store(url, links, words, etag=response.headers.get('ETag', None), last_modified=response.headers.get('Last-Modified', None))
+
+                    self.status()
+
+                self.status()
+
+            except KeyboardInterrupt:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+            finally:
+                if self._parse_pool is not None:
+                    # shutdown(cancel_futures=True) needs python 3.9
+                    for future in list(self._parse_futures):
+                        future.cancel()
+                    self._parse_pool.shutdown()
+                    self._parse_pool = None
+
+
+    def process(self, frontier, url, depth, links, words):
+        '''
+        counts a page's words and follows its links
+        '''
+
+        self.words.update(words)
+
+        if depth > 1:
+            for link in links:
+                self.enqueue(frontier, urllib.parse.urljoin(url, link), depth-1)
 
 
-    def get(self, url, depth=None):
+    def status(self):
 
-        if depth is None:
-            depth = self.depth
+        cached = f' ({self.pages_cached:,} cached)' if self.pages_cached else ''
+        stderr.write(f'\r[+] Found {len(self.words):,} words in {self.pages_fetched + self.pages_cached:,} pages{cached}')
 
-        if not url in self.visited and depth > 0:
 
-            response = self.session.get(url, headers=self.headers)
-            self.visited.add(url)
-            links = self.parser.injest(response.text)
+    def enqueue(self, frontier, url, depth):
 
-            for link in links:
-                link = urllib.parse.urljoin(url, link)
-                try:
-                    if url_to_domain(link) == self.base_domain:
-                        self.get(link, depth=depth-1)
-                except ValueError:
-                    continue
+        url = urllib.parse.urldefrag(url)[0]
+        if depth > 0 and url not in self.visited:
+            try:
+                if url_to_domain(url) == self.base_domain:
+                    self.visited.add(url)
+                    hostname = urllib.parse.urlparse(url).hostname
+                    try:
+                        frontier[hostname].append((url, depth))
+                    except KeyError:
+                        frontier[hostname] = deque([(url, depth)])
+            except ValueError:
+                pass
+
+
+    def fetch(self, url, page=None):
+        '''
+        runs in a worker thread
+        if we have an old copy of the page, only ask for it if it's changed
+        returns (response, links, word counts), or (response, None, None) if it hasn't changed
+        '''
 
-        stderr.write(f'\r[+] Found {len(self.parser.words):,} words in {len(self.visited):,} pages')
+        try:
+            session = self._local.session
+        except AttributeError:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=self.per_host))
+            session.mount('https://', HTTPAdapter(pool_maxsize=self.per_host))
+            self._local.session = session
+
+        headers = self.headers
+        if page is not None and (page.etag or page.last_modified):
+            headers = dict(headers)
+            if page.etag:
+                headers['If-None-Match'] = page.etag
+            if page.last_modified:
+                headers['If-Modified-Since'] = page.last_modified
+
+        response = session.get(url, headers=headers, timeout=self.timeout)
+        if page is not None and response.status_code == 304:
+            return response, None, None
+
+        if self._parse_pool is None:
+            links, words = parse_page(response.text)
+        else:
+            # this thread waits without holding the GIL, so the others keep fetching
+            future = self._parse_pool.submit(parse_page, response.text)
+            self._parse_futures.add(future)
+            try:
+                links, words = future.result()
+            finally:
+                self._parse_futures.discard(future)
+        return response, links, words
 
 
 
-    def __iter__(self):
+    def counts(self):
+        '''
+        {word: number of occurrences} (see Mangler.set_weights())
+        '''
 
-        words = list(self.parser.words.items())
-        words.sort(key=lambda x: x[1], reverse=True)
+        return {word.encode('utf-8'): count for word, count in self.words.items()}
+
+
+    def __iter__(self):
 
-        for word, count in words:
+        for word, count in self.words.most_common():
             yield word.encode('utf-8')
\ No newline at end of file
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import json
+import time
+import sqlite3
+from pathlib import Path
+from collections import namedtuple
+
+
+CachedPage = namedtuple('CachedPage', ['links', 'words', 'etag', 'last_modified', 'fresh'])
+
+
+class SpiderCache():
+    '''
+    remembers every page the spider has fetched: its links, its word counts, and its ETag / Last-Modified
+    so running against the same website again doesn't mean crawling it all over again
+
+    pages fetched less than <ttl> seconds ago are used as-is, without a request
+    older ones are revalidated with a conditional request, which is cheap if they haven't changed
+    '''
+
+    # bump this whenever the schema changes
+    version = 2
+    # number of changes between commits
+    commit_interval = 100
+
+    def __init__(self, filename=None, ttl=86400):
+
+        if filename is None:
+            cache_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'password-stretcher'
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            filename = cache_dir / 'spider.sqlite'
+        self.filename = Path(filename)
+        # seconds before a page needs to be revalidated
+        self.ttl = ttl
+        self.uncommitted = 0
+
+        self.db = sqlite3.connect(self.filename)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            self.db.execute('DROP TABLE IF EXISTS pages')
+            self.db.execute(f'PRAGMA user_version = {self.version}')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                fetched REAL,
+                links TEXT,
+                words TEXT
+            )
+        ''')
+
+
+    def lookup(self, url):
+        '''
+        returns a CachedPage, or None if we've never seen the page
+        '''
+
+        row = self.db.execute('SELECT etag, last_modified, fetched, links, words FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+
+        etag, last_modified, fetched, links, words = row
+        return CachedPage(
+            links=json.loads(links),
+            words=json.loads(words),
+            etag=etag,
+            last_modified=last_modified,
+            fresh=(time.time() - fetched < self.ttl),
+        )
+
+
+    def store(self, url, links, words, etag=None, last_modified=None):
+
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+            (url, etag, last_modified, time.time(), json.dumps(links), json.dumps(words))
+        )
+        self.changed()
+
+
+    def touch(self, url):
+        '''
+        the page hasn't changed, so it's good for another <ttl> seconds
+        '''
+
+        self.db.execute('UPDATE pages SET fetched = ? WHERE url = ?', (time.time(), url))
+        self.changed()
+
+
+    def changed(self):
+
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.db.commit()
+            self.uncommitted = 0
+
+
+    def close(self):
+
+        self.db.commit()
+        self.db.close()
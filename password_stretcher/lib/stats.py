@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import os
+import sys
+import json
+import time
+from .errors import PasswordStretcherError
+from .mutator import expansion_cache
+from .utils import int_to_human, bytes_to_human
+
+
+class Meter():
+    '''
+    counts and times the words pulled through one stage of the mangling chain
+
+    the chain is pull-based, so the time spent waiting for a word includes the stages before it
+    the time spent in each stage on its own is worked out afterwards (see Stats.stages())
+    '''
+
+    def __init__(self, name, _input=None):
+
+        self.name = name
+        self.input = _input
+
+        # words yielded
+        self.count = 0
+        # time spent waiting for them, including upstream stages
+        self.seconds = 0.
+        # results skipped before they were yielded (see Mangler.push_down_policy())
+        self.rejected = 0
+
+
+    def __iter__(self):
+
+        clock = time.perf_counter
+        start = clock()
+        for word in self.input:
+            self.seconds += clock() - start
+            self.count += 1
+            yield word
+            start = clock()
+        self.seconds += clock() - start
+
+
+    def counting(self, on_prune):
+        '''
+        wraps a mutator's on_prune hook so its rejections are counted
+        '''
+
+        def on_prune_counted(word):
+            self.rejected += 1
+            on_prune(word)
+
+        return on_prune_counted
+
+
+    def counting_skips(self, on_skip):
+        '''
+        same as counting(), for the ranges perm's length window skips
+        '''
+
+        def on_skip_counted(start, stop):
+            self.rejected += stop - start
+            on_skip(start, stop)
+
+        return on_skip_counted
+
+
+    def snapshot(self):
+
+        return (self.count, self.seconds, self.rejected)
+
+
+
+class Stats():
+    '''
+    reports where the time goes while mangling: each mutator, the policy filter, deduplication,
+    our own output loop, and time spent blocked on writing (e.g. hashcat not keeping up)
+
+    a status line is printed to stderr periodically, and a full report can be saved as JSON
+    with multiple workers, the mutator stages are summed across all the worker processes
+    '''
+
+    def __init__(self, mangler, writer, interval=5, status=True):
+
+        self.mangler = mangler
+        mangler.instrument()
+
+        # minimum number of seconds between status lines
+        self.interval = interval
+        self.show_status = status
+
+        self.start = time.perf_counter()
+        self.last_status = self.start
+        self.last_report = None
+        # words written before this run started, when resuming
+        self.resumed = writer.written_count
+
+
+    def update(self, writer):
+        '''
+        called by OutputWriter after each batch
+        '''
+
+        if self.show_status and time.perf_counter() - self.last_status >= self.interval:
+            self.status(writer)
+
+
+    def chain(self):
+        '''
+        names of the stages that mangle words, in order
+        these run in the worker processes if there are any
+        '''
+
+        chain = [str(m) for m in self.mangler.mutators]
+        if self.mangler.policy or self.mangler.masks is not None:
+            chain.append('policy')
+        return chain
+
+
+    def stages(self):
+        '''
+        returns [{name, words_in, words_out, rejected, seconds}, ...]
+        where seconds is the time spent in that stage alone
+        '''
+
+        mangler = self.mangler
+        chain = self.chain()
+
+        parent = list(chain) if mangler.workers == 1 else ['workers']
+        if mangler.dedup is not None:
+            parent.append('dedup')
+
+        totals = {name: [0, 0., 0] for name in chain + parent}
+
+        def add(snapshot, sequence):
+            # each stage's time includes everything before it
+            upstream = 0.
+            for name in sequence:
+                count, seconds, rejected = snapshot[name]
+                stage = totals[name]
+                stage[0] += count
+                stage[1] += max(0., seconds - upstream)
+                stage[2] += rejected
+                upstream = seconds
+
+        add({name: meter.snapshot() for name, meter in mangler.meters.items()}, parent)
+        for snapshot in mangler.worker_meters.values():
+            add(snapshot, chain)
+
+        order = list(chain)
+        if mangler.workers > 1:
+            order.append('workers')
+        if mangler.dedup is not None:
+            order.append('dedup')
+
+        stages = []
+        words_in = None
+        for name in order:
+            words_out, seconds, rejected = totals[name]
+            if name == 'workers':
+                stages.append({'name': 'waiting for workers', 'seconds': seconds})
+                continue
+            if words_in is None:
+                # the input to perm isn't metered
+                words_in = words_out + rejected
+            if name in ('policy', 'dedup'):
+                # whatever doesn't come out is rejected
+                rejected = words_in - words_out
+            stages.append({
+                'name': name,
+                'words_in': words_in,
+                'words_out': words_out,
+                'rejected': rejected,
+                'seconds': seconds,
+            })
+            words_in = words_out
+
+        return stages
+
+
+    def cache_stats(self):
+        '''
+        hits and misses in the leet/capswap expansion cache (see ExpansionCache), from every process
+        '''
+
+        hits, misses = expansion_cache.snapshot()
+        for snapshot in self.mangler.worker_meters.values():
+            worker_hits, worker_misses = snapshot['expansion cache']
+            hits += worker_hits
+            misses += worker_misses
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / max(1, hits + misses),
+        }
+
+
+    def report(self, writer):
+
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        stages = self.stages()
+
+        # whatever isn't mangling or blocked on writing is our own output loop
+        chain = self.chain() if self.mangler.workers > 1 else []
+        mangling = sum([stage['seconds'] for stage in stages if stage['name'] not in chain])
+        writer_seconds = max(0., elapsed - mangling - writer.blocked_seconds)
+
+        for stage in stages:
+            if 'words_out' in stage:
+                stage['words_per_sec'] = stage['words_out'] / max(stage['seconds'], 1e-9)
+
+        return {
+            'elapsed': elapsed,
+            'workers': self.mangler.workers,
+            'words_written': writer.written_count,
+            'bytes_written': writer.bytes_written,
+            'words_per_sec': (writer.written_count - self.resumed) / elapsed,
+            'bytes_per_sec': writer.bytes_written / elapsed,
+            'stages': stages,
+            'writer_seconds': writer_seconds,
+            'output_blocked_seconds': writer.blocked_seconds,
+            'expansion_cache': self.cache_stats(),
+        }
+
+
+    def status(self, writer, end=''):
+        '''
+        one line: words written, current rate, and the share of time spent in each stage since the last status
+        '''
+
+        report = self.report(writer)
+        last = self.last_report
+        self.last_report = report
+        self.last_status = time.perf_counter()
+
+        def delta(key, stage=None):
+            if stage is None:
+                return report[key] - (last[key] if last else 0)
+            previous = 0
+            if last:
+                previous = [s for s in last['stages'] if s['name'] == stage['name']][0][key]
+            return stage[key] - previous
+
+        elapsed = max(delta('elapsed'), 1e-9)
+        rate = (report['words_written'] - (last['words_written'] if last else self.resumed)) / elapsed
+
+        # with workers, the mutators' share is of the workers' time, and the rest is our own
+        groups = []
+        if self.mangler.workers > 1:
+            chain = self.chain()
+            worker_stages = [(s['name'], delta('seconds', s)) for s in report['stages'] if s['name'] in chain]
+            groups.append(('workers: ', worker_stages, None))
+            local = [(s['name'].split()[0], delta('seconds', s)) for s in report['stages'] if s['name'] not in chain]
+            groups.append(('main: ', local, elapsed))
+        else:
+            local = [(s['name'], delta('seconds', s)) for s in report['stages']]
+            groups.append(('', local, elapsed))
+        groups[-1][1].append(('writer', delta('writer_seconds')))
+        groups[-1][1].append(('blocked', delta('output_blocked_seconds')))
+
+        shares = []
+        for label, stages, total in groups:
+            if total is None:
+                total = sum([seconds for _, seconds in stages])
+            total = max(total, 1e-9)
+            shares.append(label + ' '.join([f'{name} {min(100, seconds * 100 / total):.0f}%' for name, seconds in stages]))
+
+        sys.stderr.write(
+            f'\r[+] {writer.written_count:,} words written ({bytes_to_human(writer.bytes_written)}) '
+            f'at {int_to_human(int(rate))}/s | {" | ".join(shares)}    {end}'
+        )
+
+
+    def close(self, writer):
+
+        if self.show_status:
+            self.last_report = None
+            self.status(writer, end='\n')
+            cache = self.cache_stats()
+            if cache['hits'] or cache['misses']:
+                sys.stderr.write(f'[+] Expansion cache: {cache["hits"]:,} hits, {cache["misses"]:,} misses ({cache["hit_rate"]*100:.1f}%)\n')
+
+
+    def save(self, filename, writer):
+
+        report = self.report(writer)
+        tmp_file = f'{filename}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(report, f, indent=2)
+            os.replace(tmp_file, filename)
+        except OSError as e:
+            raise PasswordStretcherError(f'Failed to save stats to {filename}: {e}')
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import heapq
+import tempfile
+from .cap import Cap
+from .dedup import BloomFilter
+from itertools import islice
+
+
+class StreamInput():
+    '''
+    reads the input wordlist lazily instead of loading it into memory
+    deduplicates with a bloom filter, so a small fraction of unique words may be dropped
+    optionally sorts by length with an external merge sort (output is delayed until the input is read)
+    '''
+
+    # assumed input size when it can't be estimated (e.g. STDIN)
+    default_estimate = 1000000
+
+    def __init__(self, _input, cap=False, sort=False, sort_buffer=1000000, fp_rate=0.0001, estimate=None):
+
+        self.input = _input
+        self.cap = cap
+        self.sort = sort
+        # number of words to sort in memory before spilling to disk
+        self.sort_buffer = sort_buffer
+
+        # mutation budgets are based on the estimate, and if it's too high there are no more words to use them up
+        self.estimate = estimate
+        if not self.estimate:
+            try:
+                self.estimate = _input.estimate_size()
+            except AttributeError:
+                self.estimate = None
+        # whether the estimate is just default_estimate
+        self.guessed = not self.estimate
+        if self.guessed:
+            self.estimate = self.default_estimate
+        if cap:
+            self.estimate *= Cap.cap_multiplier
+
+        self.seen = BloomFilter(max(1000000, self.estimate * 2), fp_rate=fp_rate)
+        self.duplicates = 0
+
+
+    def __len__(self):
+        '''
+        estimated number of (unique) input words
+        '''
+
+        return self.estimate
+
+
+    def __iter__(self):
+
+        words = self.dedup(Cap(self.input) if self.cap else self.input)
+        if self.sort:
+            words = external_sort(words, key=len, buffer_size=self.sort_buffer)
+        yield from words
+
+
+    def dedup(self, words):
+
+        for word in words:
+            if self.seen.add(word):
+                self.duplicates += 1
+            else:
+                yield word
+
+
+def external_sort(words, key=len, buffer_size=1000000):
+    '''
+    sorts an iterable of newline-free words using bounded memory
+    sorted runs of <buffer_size> words are spilled to temporary files, then merged
+    '''
+
+    runs = []
+    words = iter(words)
+    try:
+        while 1:
+            chunk = list(islice(words, buffer_size))
+            if not chunk:
+                break
+            chunk.sort(key=key)
+            # if everything fits in one run, skip the disk
+            if not runs and len(chunk) < buffer_size:
+                yield from chunk
+                return
+            run = tempfile.TemporaryFile()
+            chunk.append(b'')
+            run.write(b'\n'.join(chunk))
+            run.seek(0)
+            runs.append(run)
+            del chunk
+
+        yield from heapq.merge(*[_read_run(run) for run in runs], key=key)
+
+    finally:
+        for run in runs:
+            run.close()
+
+
+def _read_run(f):
+
+    for line in f:
+        yield line[:-1]
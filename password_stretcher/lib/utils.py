@@ -2,11 +2,15 @@
 
 # by TheTechromancer
 
+import io
+import re
 import sys
+import mmap
 import string
 from pathlib import Path
+from itertools import islice
 from urllib.parse import urlparse
-from .errors import InputListError
+from .errors import InputListError, PasswordStretcherError
 
 # UnicodeDammit
 import logging
@@ -39,6 +43,17 @@ class ReadFiles():
             yield from file
 
 
+    def batches(self):
+
+        for file in self.files:
+            yield from file.batches()
+
+
+    def estimate_size(self):
+
+        return sum([file.estimate_size() for file in self.files])
+
+
 class ReadFile():
 
     def __init__(self, filename, binary=True):
@@ -55,13 +70,79 @@ class ReadFile():
         if not self.filename.exists() or self.filename.is_dir():
             raise InputListError(f'Cannot find the file {self.filename}')
 
+        # compressed files are decompressed on the fly
+        self.compression = detect_compression(self.filename)
+
+
+    def estimate_size(self, sample_size=65536):
+        '''
+        estimates the number of lines in the file based on a sample from the beginning
+        '''
+
+        size = self.filename.stat().st_size
+        with open(self.filename, 'rb') as raw:
+            if self.compression:
+                with open_compressed(raw, self.compression) as f:
+                    sample = f.read(sample_size)
+                    # how much of the compressed file that sample took up
+                    sample_raw_size = max(1, raw.tell())
+            else:
+                sample = raw.read(sample_size)
+                sample_raw_size = len(sample)
+        if sample_raw_size >= size:
+            return len(sample.splitlines())
+        lines = max(1, sample.count(b'\n'))
+        return int(size / (sample_raw_size / lines))
 
 
     def __iter__(self):
 
+        for batch in self.batches():
+            yield from batch
+
+
+    def batches(self, batch_size=65536):
+        '''
+        yields lists of lines
+        binary files are memory-mapped and split in bulk
+        '''
+
+        if self.binary and self.compression:
+            with open(self.filename, 'rb') as raw:
+                with open_compressed(raw, self.compression) as f:
+                    for block in read_blocks(f, MappedFile.block_size):
+                        yield split_lines(block)
+            return
+
+        if self.binary:
+            try:
+                mapped = MappedFile(self.filename)
+            except (OSError, ValueError):
+                # not a regular file (e.g. a pipe), or empty
+                pass
+            else:
+                with mapped:
+                    yield from mapped.batches()
+                return
+
+        lines = self.lines()
+        while 1:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                break
+            yield batch
+
+
+    def lines(self):
+
         fucky_errors = 0
 
-        with open(self.filename, self.mode) as f:
+        with open(self.filename, 'rb') as raw:
+            f = raw
+            if self.compression:
+                f = open_compressed(raw, self.compression)
+            if not self.binary:
+                f = io.TextIOWrapper(f)
             i = f.__iter__()
             while 1:
                 try:
@@ -85,6 +166,176 @@ class ReadFile():
 
 
 
+class MappedFile():
+    '''
+    reads lines from a memory-mapped file
+    instead of reading line by line, big blocks of the file are split on newlines all at once
+    blank lines are skipped, and CRLF line endings are handled
+    '''
+
+    # bytes to split at once
+    block_size = 4 * 1024 * 1024
+
+    def __init__(self, filename):
+
+        self.filename = Path(filename)
+        with open(self.filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+    def __iter__(self):
+
+        for batch in self.batches():
+            yield from batch
+
+
+    def __enter__(self):
+
+        return self
+
+
+    def __exit__(self, *args):
+
+        self.close()
+
+
+    def __len__(self):
+
+        return len(self.mmap)
+
+
+    def batches(self, block_size=None):
+        '''
+        yields lists of lines, one for each block of about <block_size> bytes
+        '''
+
+        if block_size is None:
+            block_size = self.block_size
+
+        mm = self.mmap
+        size = len(mm)
+        pos = 0
+        while pos < size:
+            # cut each block off at the last newline so no line gets split between blocks
+            end = min(pos + block_size, size)
+            if end < size:
+                newline = mm.rfind(b'\n', pos, end)
+                if newline == -1:
+                    newline = mm.find(b'\n', end, size)
+                end = size if newline == -1 else newline + 1
+
+            yield split_lines(mm[pos:end])
+            pos = end
+
+
+    def close(self):
+
+        self.mmap.close()
+
+
+
+# leading bytes of each supported compression format
+compression_magic = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'BZh', 'bz2'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+
+# file extensions for compressed output
+compression_extensions = {
+    '.gz': 'gzip',
+    '.xz': 'xz',
+    '.bz2': 'bz2',
+    '.zst': 'zstd',
+}
+
+
+def detect_compression(filename):
+    '''
+    returns the compression format of a file based on its first few bytes, or None
+    '''
+
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(8)
+    except OSError:
+        return None
+
+    for magic, compression in compression_magic:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_compressed(f, compression, mode='rb', level=None):
+    '''
+    wraps a binary file object with a decompressor (or a compressor if mode is "wb")
+    closing the wrapper leaves the file object open
+    '''
+
+    writing = mode.startswith('w')
+
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=f, mode=mode, compresslevel=(6 if level is None else level))
+
+    elif compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(f, mode=mode, preset=(level if writing else None))
+
+    elif compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(f, mode=mode, compresslevel=(9 if level is None else level))
+
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise PasswordStretcherError('Please install the "zstandard" module to use .zst files (pip install zstandard)')
+        if writing:
+            return zstandard.ZstdCompressor(level=(3 if level is None else level)).stream_writer(f, closefd=False)
+        # files can have more than one frame (see OutputFile)
+        return zstandard.ZstdDecompressor().stream_reader(f, closefd=False, read_across_frames=True)
+
+    raise ValueError(f'Invalid compression: "{compression}"')
+
+
+def read_blocks(f, block_size):
+    '''
+    reads a file object in big blocks which end on a newline
+    '''
+
+    leftover = b''
+    while 1:
+        block = f.read(block_size)
+        if not block:
+            break
+        newline = block.rfind(b'\n')
+        if newline == -1:
+            leftover += block
+            continue
+        yield leftover + block[:newline+1]
+        leftover = block[newline+1:]
+
+    if leftover:
+        yield leftover
+
+
+def split_lines(block):
+    '''
+    splits a block of bytes into a list of lines
+    CRLF line endings are handled, and blank lines are skipped
+    '''
+
+    if b'\r' in block:
+        while b'\r\n' in block:
+            block = block.replace(b'\r\n', b'\n')
+        block = block.rstrip(b'\r')
+    return list(filter(None, block.split(b'\n')))
+
+
+
 class ReadSTDIN():
 
     def __init__(self, binary=True):
@@ -158,6 +409,49 @@ def human_to_int(h):
     return int(i * units[unit])
 
 
+def read_counts(lines):
+    '''
+    reads words with a count on each line, like the output of "sort | uniq -c" ("  5 password")
+    or tab-separated ("password\t5")
+    lines without a count are counted once
+    returns {word: count}
+    '''
+
+    counts = dict()
+    for line in lines:
+        match = count_regex.match(line)
+        if match is None:
+            word, count = line, 1
+        elif match.group(1) is not None:
+            count, word = int(match.group(1)), match.group(2)
+        else:
+            word, count = match.group(3), int(match.group(4))
+        if word:
+            counts[word] = counts.get(word, 0) + count
+
+    return counts
+
+
+count_regex = re.compile(rb'^\s*(\d+) (.+)$|^(.+)\t(\d+)$', re.S)
+
+
+def parse_shard(s):
+    '''
+    converts "K/N" to (K, N)
+    e.g. 2/4 --> (2, 4)
+    '''
+
+    try:
+        k, n = [int(i) for i in s.split('/')]
+    except ValueError:
+        raise ValueError(f'Invalid shard "{s}"')
+
+    if not 1 <= k <= n:
+        raise ValueError(f'Invalid shard "{s}"')
+
+    return (k, n)
+
+
 def bytes_to_human(_bytes):
     '''
     converts bytes to human-readable filesize
@@ -181,6 +475,20 @@ def bytes_to_human(_bytes):
     raise ValueError
 
 
+def is_ascii(s):
+    '''
+    same as bytes.isascii() and str.isascii(), which need python 3.7
+    '''
+
+    if type(s) == bytes:
+        return non_ascii_bytes.search(s) is None
+    return non_ascii_str.search(s) is None
+
+
+non_ascii_bytes = re.compile(rb'[\x80-\xff]')
+non_ascii_str = re.compile(r'[^\x00-\x7f]')
+
+
 
 def hostname_to_domain(hostname):
 
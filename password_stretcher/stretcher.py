@@ -5,12 +5,19 @@
 import os
 import re
 import sys
+import sqlite3
 import argparse
+from itertools import chain
 from password_stretcher.lib.utils import *
 from password_stretcher.lib.errors import *
 from password_stretcher.lib.mangler import *
 from password_stretcher.lib.spider import Spider
+from password_stretcher.lib.spider_cache import SpiderCache
+from password_stretcher.lib.output import OutputWriter, OutputFile
+from password_stretcher.lib.checkpoint import Checkpoint
+from password_stretcher.lib.stats import Stats
 from password_stretcher.lib.policy import PasswordPolicy
+from password_stretcher.lib.mask import read_masks
 
 
 
@@ -21,8 +28,7 @@ def stretcher(options):
             print('U WOT M8')
             sys.exit()
 
-    show_written_count = not sys.stdout.isatty()
-    written_count = 0
+    show_written_count = options.output is not None or not sys.stdout.isatty()
 
     policy = PasswordPolicy(
         minlength=options.minlength,
@@ -32,7 +38,21 @@ def stretcher(options):
         regex=options.regex,
     )
 
-    sys.stderr.write('[+] Reading input wordlist...')
+    if options.stream:
+        sys.stderr.write('[+] Streaming input wordlist...')
+    else:
+        sys.stderr.write('[+] Reading input wordlist...')
+
+    weights = None
+    if options.weighted:
+        if options.stream:
+            raise InputListError('Weighted mutations need the whole wordlist in memory and can\'t be used while streaming')
+        if type(options.input) == Spider:
+            weights = options.input.counts()
+        else:
+            # each line has a count
+            weights = read_counts(options.input)
+            options.input = list(weights)
     mangler = Mangler(
         _input=options.input,
         output_size=options.limit,
@@ -42,54 +62,165 @@ def stretcher(options):
         cap=options.cap,
         capswap=options.capswap,
         pend=options.pend,
+        pend_model=options.pend_model,
+        rules=options.rules,
+        policy=policy,
+        masks=(None if options.mask is None else read_masks(options.mask)),
+        workers=options.workers,
+        ordered=not options.unordered,
+        shard=options.shard,
+        stream=options.stream,
+        stream_sort=options.stream_sort,
+        stream_estimate=options.stream_estimate,
+        dedup=options.dedup,
+        dedup_fp_rate=options.dedup_fp_rate,
+        dedup_memory=options.dedup_memory,
+        weights=weights,
     )
-    sys.stderr.write(f' read {len(mangler.input):,} words {"(after basic cap mutations)" if (options.cap and not options.capswap) else ""}\n')
+    if options.stream:
+        sys.stderr.write(f' estimated {len(mangler.input):,} words\n')
+        if mangler.input.guessed:
+            sys.stderr.write(f'[!] Can\'t tell how many words are coming, so mutations per word are based on a guess of {len(mangler.input):,}\n')
+            sys.stderr.write(f'[!] If the input is smaller, the output will be too (use --stream-estimate)\n')
+    else:
+        sys.stderr.write(f' read {len(mangler.input):,} words {"(after basic cap mutations)" if (options.cap and not options.capswap) else ""}\n')
     if options.permutations > 1:
         sys.stderr.write(f'[*] Input wordlist after permutations: {len(mangler.mutators[0]):,}\n')
     else:
         sys.stderr.write(f'[*] Output capped at {mangler.output_size:,} words\n')
-    if any([mangler.leet, mangler.cap, mangler.pend]):
+    if mangler.rules:
+        rules = mangler.mutators[-1]
+        sys.stderr.write(f'[+] Loaded {len(rules.programs):,} unique rules\n')
+        if rules.skipped:
+            sys.stderr.write(f'[!] Skipped {len(rules.skipped):,} unsupported rules (e.g. "{rules.skipped[0].decode(errors="replace")}")\n')
+    if any([mangler.leet, mangler.cap, mangler.pend, mangler.rules]):
         sys.stderr.write('[+] Mutations allowed per word:\n')
         for mutator in mangler.mutators[1:]:
             sys.stderr.write(f'       {str(mutator):<16}{mutator.limit:,}\n')
     if policy:
         sys.stderr.write(f'[+] Filtering based on policy, output size may be reduced\n')
+    if mangler.masks is not None:
+        sys.stderr.write(f'[+] Only generating words which match {len(mangler.masks):,} masks, output size may be reduced\n')
+    if mangler.workers > 1:
+        sys.stderr.write(f'[+] Mangling with {mangler.workers:,} processes{"" if mangler.ordered else " (unordered)"}\n')
+    if mangler.shards > 1:
+        sys.stderr.write(f'[+] Generating shard {mangler.shard+1:,} of {mangler.shards:,}\n')
+
+    if options.dry_run:
+        estimate = mangler.estimate()
+        sys.stderr.write(f'[+] {"Exact" if estimate["exact"] else "Estimated maximum"} output before filtering: {estimate["words"]:,} words ({bytes_to_human(estimate["bytes"])})\n')
+        if estimate['stages']:
+            sys.stderr.write(f'       {"mutator":<16}{"words in":>16}{"words out":>16}\n')
+            for name, words_in, words_out in estimate['stages']:
+                sys.stderr.write(f'       {name:<16}{words_in:>16,}{words_out:>16,}\n')
+        return
 
-    #sys.stderr.write(f'[+] Estimated output: {len(mangler):,} words\n')
+    state = None
+    if options.resume:
+        state = Checkpoint.load(options.resume, mangler)
+        if state['finished']:
+            sys.stderr.write(f'[+] Checkpoint says this run already finished ({state["written"]:,} words written)\n')
+            return
+        mangler.resume(state)
+        sys.stderr.write(f'[+] Resuming after {state["written"]:,} words\n')
 
-    bytes_written = 0
-    for mangled_word in mangler:
+    if options.output:
+        offset = None
+        if state is not None:
+            # throw away anything written after the checkpoint
+            offset = state.get('output_offset', None)
+            if offset is None and os.path.exists(options.output):
+                offset = os.path.getsize(options.output)
+        output = OutputFile(options.output, offset=offset)
+    else:
+        output = sys.stdout.buffer
 
-        if policy.meets_policy(mangled_word):
-            sys.stdout.buffer.write(mangled_word + b'\n')
-            bytes_written += (len(mangled_word)+1)
-            if show_written_count and written_count % 10000 == 0:
-                sys.stderr.write(f'\r[+] {written_count:,} words written ({bytes_to_human(bytes_written)})    ')
+    # the profiling status line replaces the plain word count
+    profile = options.profile or options.stats
+    writer = OutputWriter(output, batch_size=options.batch_size, progress=(show_written_count and not profile))
+    if state is not None:
+        writer.written_count = state['written']
 
-            written_count += 1
+    # keep saving to the checkpoint we resumed from, unless told otherwise
+    checkpoint_file = options.checkpoint or options.resume
+    checkpoint = None
+    if checkpoint_file:
+        checkpoint = Checkpoint(checkpoint_file, mangler, interval=options.checkpoint_interval)
+        writer.on_write.append(checkpoint.update)
 
-        else:
-            # if the word didn't meet length requirements, increase the limit by 1
-            mangler.mutators[-1].cur_limit += 1
+    stats = None
+    if profile:
+        stats = Stats(mangler, writer, interval=options.profile_interval)
+        writer.on_write.append(stats.update)
+
+    try:
+        writer.write(mangler)
+        writer.close()
+    finally:
+        if options.output:
+            output.close()
+        if stats is not None:
+            stats.close(writer)
+            if options.stats:
+                stats.save(options.stats, writer)
+
+    if checkpoint is not None:
+        checkpoint.save(writer, finished=True)
 
-    if show_written_count:
-        sys.stderr.write(f'\r[+] {written_count:,} words written ({bytes_to_human(bytes_written)})    \n')
+    if mangler.dedup is not None:
+        sys.stderr.write(f'[+] Suppressed {mangler.dedup.duplicates:,} duplicate words\n')
 
-    sys.stdout.buffer.flush()
     sys.stdout.close()
 
 
+def train_pend(options):
+
+    from password_stretcher.lib.pend import Pend
+
+    if not options.pend_model:
+        raise RuleError('Please specify where to save the model with --pend-model')
+
+    sys.stderr.write('[+] Training append/prepend model...')
+    try:
+        passwords = chain.from_iterable(options.input.batches())
+    except AttributeError:
+        passwords = options.input
+    model = Pend([]).train(passwords)
+    model.save(options.pend_model)
+    sys.stderr.write(f' learned {len(model.shapes):,} word shapes, saved to {options.pend_model}\n')
+
+
+def benchmark(options):
+
+    import json
+    from password_stretcher.lib import benchmark
+
+    sys.stderr.write(f'[+] Benchmarking with {options.benchmark_size:,} words per wordlist\n')
+    benchmark.print_header()
+    report = benchmark.run_benchmarks(size=options.benchmark_size, progress=benchmark.print_result)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
 def main():
 
     parser = argparse.ArgumentParser(description='FETCH THE PASSWORD STRETCHER')
     parser.add_argument('-i', '--input', nargs='+', default=ReadSTDIN(), help='input website or wordlist(s) (default: STDIN)', metavar='')
     parser.add_argument('--limit', type=human_to_int, help='limit length of output (default: max(100M, 1000x input))')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write to a file instead of STDOUT (compressed if it ends in .gz, .xz, .bz2, or .zst)')
+    parser.add_argument('--dry-run', action='store_true', help='calculate output size without generating anything')
+    parser.add_argument('--benchmark', action='store_true', help='measure the speed of each mutator on synthetic wordlists (JSON report to STDOUT)')
+    parser.add_argument('--benchmark-size', type=human_to_int, default=2000, metavar='INT', help='number of words in each benchmark wordlist (default: 2000)')
     mangling = argparse.ArgumentParser.add_argument_group(parser, 'mangling options')
     mangling.add_argument('-L', '--leet', action='store_true', help='"leetspeak" mutations')
     mangling.add_argument('-c', '--cap', action='store_true', help='common upper/lowercase variations')
     mangling.add_argument('-C', '--capswap', action='store_true', help='all possible case combinations')
     mangling.add_argument('-p', '--pend', action='store_true', help='append/prepend common digits & special characters')
+    mangling.add_argument('--pend-model', metavar='FILE', help='with -p, pick the most likely append/prepend rules for each word using a model from --train-pend')
+    mangling.add_argument('--train-pend', action='store_true', help='learn which append/prepend rules suit each kind of word from the input (real passwords), and save the model to --pend-model')
+    mangling.add_argument('-r', '--rules', nargs='+', help='apply hashcat rules from these files (after all other mutations)', metavar='FILE')
     mangling.add_argument('-dd', '--double', action='store_true', help='double each word (e.g. "Pass" --> "PassPass")')
+    mangling.add_argument('--weighted', action='store_true', help='give frequent words more mutations, based on spider word counts or input lines like "COUNT WORD" (uniq -c) or "WORD<TAB>COUNT"')
     mangling.add_argument('-P', '--permutations',type=int, default=1, help='max permutation depth (careful! massive output)', metavar='INT')
     filters = argparse.ArgumentParser.add_argument_group(parser, 'password complexity filters')
     filters.add_argument('--minlength', type=int, metavar='8', help='minimum password length')
@@ -97,14 +228,46 @@ def main():
     filters.add_argument('--mincharsets', type=int, metavar='3', help='must have this many character sets')
     filters.add_argument('--charsets', nargs='+', choices=PasswordPolicy.charset_choices, help='must include these character sets')
     filters.add_argument('--regex', type=re.compile, metavar='\'$[a-z]*^\'', help='custom regex')
+    filters.add_argument('--mask', nargs='+', metavar='MASK', help='only generate words matching these hashcat masks or .hcmask files (e.g. \'?u?l?l?l?l?d?d\')')
+    performance = argparse.ArgumentParser.add_argument_group(parser, 'performance options')
+    performance.add_argument('--workers', type=int, default=1, metavar='INT', help='number of processes to mangle with, needs the fork start method so not on windows (default: 1)')
+    performance.add_argument('--batch-size', type=human_to_int, default=65536, metavar='INT', help='number of words per output write (default: 65536)')
+    performance.add_argument('--unordered', action='store_true', help='don\'t preserve word order when using multiple workers (faster)')
+    performance.add_argument('--shard', type=parse_shard, metavar='K/N', help='only generate the Kth of N slices of the output (e.g. one per cracking node)')
+    performance.add_argument('--stream', action='store_true', help='don\'t load the input wordlist into memory (approximate deduplication)')
+    performance.add_argument('--stream-sort', action='store_true', help='when streaming, sort input by length on disk first')
+    performance.add_argument('--stream-estimate', type=human_to_int, metavar='INT', help='when streaming, number of input words to plan mutations for (default: estimated from the file, or 1M for STDIN)')
+    checkpoints = argparse.ArgumentParser.add_argument_group(parser, 'checkpoint options')
+    checkpoints.add_argument('--checkpoint', metavar='FILE', help='periodically save progress to this file')
+    checkpoints.add_argument('--resume', metavar='FILE', help='resume from a checkpoint (and keep saving progress to it)')
+    checkpoints.add_argument('--checkpoint-interval', type=float, default=60, metavar='SECONDS', help='how often to save progress (default: 60)')
+    profiling = argparse.ArgumentParser.add_argument_group(parser, 'profiling options')
+    profiling.add_argument('--profile', action='store_true', help='show where the time goes (each mutator, filtering, and output) in a status line (adds some overhead)')
+    profiling.add_argument('--profile-interval', type=float, default=5, metavar='SECONDS', help='how often to print the status line (default: 5)')
+    profiling.add_argument('--stats', metavar='FILE', help='save a JSON report of words and time per stage to this file (implies --profile)')
+    dedup = argparse.ArgumentParser.add_argument_group(parser, 'deduplication options')
+    dedup.add_argument('--dedup', choices=['exact', 'bloom', 'disk'], help='suppress duplicate output words (exact: in memory, bloom: fixed size but may drop unique words, disk: spill to disk)')
+    dedup.add_argument('--dedup-fp-rate', type=float, default=0.001, metavar='RATE', help='bloom filter false-positive rate (default: 0.001)')
+    dedup.add_argument('--dedup-memory', type=human_to_int, default=10000000, metavar='INT', help='words to keep in memory before spilling to disk (default: 10M)')
     spidering = argparse.ArgumentParser.add_argument_group(parser, 'spider options')
     spidering.add_argument('--spider-depth', type=int, default=1, help='maximum website spider depth (default: 1)')
     spidering.add_argument('--user-agent', help='user-agent for web spider')
+    spidering.add_argument('--spider-threads', type=int, default=8, metavar='INT', help='number of concurrent requests (default: 8)')
+    spidering.add_argument('--spider-per-host', type=int, default=4, metavar='INT', help='max concurrent requests to the same host (default: 4)')
+    spidering.add_argument('--spider-max-pages', type=human_to_int, metavar='INT', help='stop after requesting this many pages')
+    spidering.add_argument('--spider-timeout', type=float, default=10, metavar='SECONDS', help='timeout for each request (default: 10)')
+    spidering.add_argument('--spider-parsers', type=int, default=0, metavar='INT', help='number of processes to parse pages with (default: 0, parse in the fetching threads)')
+    spidering.add_argument('--spider-cache-ttl', type=float, default=86400, metavar='SECONDS', help='reuse pages from previous runs for this long before checking if they changed (default: 86400)')
+    spidering.add_argument('--no-spider-cache', action='store_true', help='don\'t read or save pages in the spider cache')
 
     try:
 
         options = parser.parse_args()
 
+        if options.benchmark:
+            benchmark(options)
+            return
+
         # print help if there's nothing to stretch
         if type(options.input) == ReadSTDIN and sys.stdin.isatty():
             parser.print_help()
@@ -118,8 +281,22 @@ def main():
             spider = options.input
             spider.depth = options.spider_depth
             spider.user_agent = options.user_agent
+            spider.threads = max(1, options.spider_threads)
+            spider.per_host = max(1, options.spider_per_host)
+            spider.max_pages = options.spider_max_pages
+            spider.timeout = options.spider_timeout
+            spider.parsers = max(0, options.spider_parsers)
+            if not options.no_spider_cache:
+                try:
+                    spider.cache = SpiderCache(ttl=options.spider_cache_ttl)
+                except (OSError, sqlite3.Error) as e:
+                    sys.stderr.write(f'[!] Not using the spider cache: {e}\n')
             spider.start()
 
+        if options.train_pend:
+            train_pend(options)
+            return
+
         stretcher(options)
 
 
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import pytest
+from password_stretcher.lib import benchmark
+from password_stretcher.lib.benchmark import isolated, peak_rss, benchmark_chain, synthetic_wordlist
+
+
+pytestmark = pytest.mark.skipif(benchmark.resource is None, reason='peak RSS can\'t be measured here')
+
+
+def allocate(num_bytes):
+
+    def run():
+        block = bytearray(num_bytes)
+        block[::4096] = b'x' * len(block[::4096])
+        return {'peak_rss': peak_rss()}
+
+    return run
+
+
+def test_peak_rss_is_per_benchmark():
+
+    big = isolated(allocate(128 * 1024 * 1024))
+    small = isolated(allocate(1024))
+    # the small one doesn't inherit the big one's peak
+    assert big['peak_rss'] - big['baseline_rss'] >= 100 * 1024 * 1024
+    assert small['peak_rss'] - small['baseline_rss'] < 32 * 1024 * 1024
+    assert small['peak_rss'] < big['peak_rss']
+    # and neither does this process
+    assert peak_rss() < big['peak_rss']
+
+
+def test_chain_stages():
+
+    words = synthetic_wordlist('short', 50)
+    result = isolated(lambda: benchmark_chain('chain', 'short', words, output_size=20000, leet=True, capswap=True, pend=True))
+    names = [stage['name'] for stage in result['stages']]
+    assert names == ['perm', 'leet', 'capitalization', 'append/prepend', 'output']
+    assert result['stages'][3]['words_out'] == result['candidates']
+    assert 0 < sum([stage['seconds'] for stage in result['stages']]) <= result['seconds'] * 1.1
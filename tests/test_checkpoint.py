@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import gzip
+import random
+import pytest
+from itertools import islice
+from password_stretcher.lib.mangler import Mangler
+from password_stretcher.lib.checkpoint import Checkpoint
+from password_stretcher.lib.output import OutputWriter, OutputFile
+from password_stretcher.lib.policy import PasswordPolicy
+from password_stretcher.lib.errors import CheckpointError
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(3, 8))]).encode())
+    return sorted(words)
+
+
+words = random_words(40)
+options = dict(perm=2, leet=True, cap=True, policy=PasswordPolicy(minlength=8), output_size=8000)
+
+
+def read_output(filename):
+
+    data = filename.read_bytes()
+    if filename.suffix == '.gz':
+        # one gzip stream per flush
+        data = gzip.decompress(data)
+    return data
+
+
+def uninterrupted_run(filename, **options):
+
+    output = OutputFile(filename)
+    writer = OutputWriter(output, batch_size=1000)
+    writer.write(Mangler(list(words), **options))
+    writer.close()
+    output.close()
+    return read_output(filename)
+
+
+def interrupted_run(filename, checkpoint_file, stop, **options):
+    '''
+    stops after <stop> words, like ctrl+c
+    then writes some more words without saving a checkpoint, like a kill -9 between checkpoints
+    '''
+
+    mangler = Mangler(list(words), **options)
+    output = OutputFile(filename)
+    writer = OutputWriter(output, batch_size=1000)
+    checkpoint = Checkpoint(checkpoint_file, mangler, interval=0)
+    writer.on_write.append(checkpoint.update)
+
+    generated = iter(mangler)
+    writer.write(islice(generated, stop))
+    writer.on_write.remove(checkpoint.update)
+    writer.write(islice(generated, 777))
+    generated.close()
+    output.close()
+
+
+def resumed_run(filename, checkpoint_file, **options):
+
+    mangler = Mangler(list(words), **options)
+    state = Checkpoint.load(checkpoint_file, mangler)
+    mangler.resume(state)
+    output = OutputFile(filename, offset=state['output_offset'])
+    writer = OutputWriter(output, batch_size=1000)
+    writer.written_count = state['written']
+    checkpoint = Checkpoint(checkpoint_file, mangler, interval=0)
+    writer.on_write.append(checkpoint.update)
+
+    writer.write(mangler)
+    writer.close()
+    output.close()
+    checkpoint.save(writer, finished=True)
+    return read_output(filename)
+
+
+@pytest.mark.parametrize('suffix', ['.txt', '.gz'])
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('stop', [1234, 6000])
+def test_resume_matches_uninterrupted_run(tmp_path, suffix, workers, stop):
+
+    expected = uninterrupted_run(tmp_path / f'expected{suffix}', workers=workers, **options)
+    assert expected.count(b'\n') > stop + 777
+
+    filename = tmp_path / f'output{suffix}'
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    interrupted_run(filename, checkpoint_file, stop, workers=workers, **options)
+    # the words after the checkpoint are still in the file, and have to be truncated
+    state = Checkpoint.load(checkpoint_file, Mangler(list(words), workers=workers, **options))
+    assert filename.stat().st_size > state['output_offset']
+    assert not state['finished']
+
+    assert resumed_run(filename, checkpoint_file, workers=workers, **options) == expected
+    state = Checkpoint.load(checkpoint_file, Mangler(list(words), workers=workers, **options))
+    assert state['finished']
+    assert state['written'] == expected.count(b'\n')
+
+
+def test_resume_twice(tmp_path):
+
+    expected = uninterrupted_run(tmp_path / 'expected.txt', **options)
+    filename = tmp_path / 'output.txt'
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    interrupted_run(filename, checkpoint_file, 2000, **options)
+
+    # interrupted again, partway through the resumed run
+    mangler = Mangler(list(words), **options)
+    state = Checkpoint.load(checkpoint_file, mangler)
+    mangler.resume(state)
+    output = OutputFile(filename, offset=state['output_offset'])
+    writer = OutputWriter(output, batch_size=1000)
+    writer.written_count = state['written']
+    checkpoint = Checkpoint(checkpoint_file, mangler, interval=0)
+    writer.on_write.append(checkpoint.update)
+    generated = iter(mangler)
+    writer.write(islice(generated, 3000))
+    generated.close()
+    output.close()
+
+    assert resumed_run(filename, checkpoint_file, **options) == expected
+
+
+def test_checkpoint_rejects_different_run(tmp_path):
+
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    interrupted_run(tmp_path / 'output.txt', checkpoint_file, 1000, **options)
+
+    Checkpoint.load(checkpoint_file, Mangler(list(words), **options))
+    different_options = dict(options, leet=False)
+    with pytest.raises(CheckpointError):
+        Checkpoint.load(checkpoint_file, Mangler(list(words), **different_options))
+    with pytest.raises(CheckpointError):
+        Checkpoint.load(checkpoint_file, Mangler(list(words)[1:], **options))
+    with pytest.raises(CheckpointError):
+        Checkpoint.load(checkpoint_file, Mangler(list(words), workers=2, **options))
+
+    checkpoint_file.write_text('{"version": 1}')
+    with pytest.raises(CheckpointError):
+        Checkpoint.load(checkpoint_file, Mangler(list(words), **options))
+    with pytest.raises(CheckpointError):
+        Checkpoint.load(tmp_path / 'missing.json', Mangler(list(words), **options))
+
+
+def test_checkpoint_refuses_unordered(tmp_path):
+
+    mangler = Mangler(list(words), workers=2, ordered=False, **options)
+    with pytest.raises(CheckpointError):
+        Checkpoint(tmp_path / 'checkpoint.json', mangler)
+
+
+def test_resume_with_missing_or_short_output(tmp_path):
+
+    filename = tmp_path / 'output.txt'
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    interrupted_run(filename, checkpoint_file, 5000, **options)
+    state = Checkpoint.load(checkpoint_file, Mangler(list(words), **options))
+
+    filename.write_bytes(filename.read_bytes()[:state['output_offset'] - 1])
+    with pytest.raises(CheckpointError):
+        OutputFile(filename, offset=state['output_offset'])
+    filename.unlink()
+    with pytest.raises(CheckpointError):
+        OutputFile(filename, offset=state['output_offset'])
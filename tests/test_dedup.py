@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from password_stretcher.lib.dedup import Dedup
+from password_stretcher.lib.mangler import Mangler
+from password_stretcher.lib.policy import PasswordPolicy
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(4, 12))]).encode())
+    return sorted(words)
+
+
+@pytest.mark.parametrize('backend', ['exact', 'bloom', 'disk'])
+def test_dedup_suppresses_duplicates(backend):
+
+    words = random_words(2000)
+    # every word twice, then the first half again
+    stream = words + words + words[:1000]
+    dedup = Dedup.create(backend, len(words), memory_limit=300)
+    try:
+        output = list(dedup.wrap(stream))
+    finally:
+        dedup.close()
+
+    assert len(output) == len(set(output))
+    if backend == 'bloom':
+        # a few unique words may be dropped
+        assert len(output) >= len(words) * 0.99
+        assert set(output) <= set(words)
+    else:
+        assert output == words
+    assert dedup.duplicates == len(stream) - len(output)
+
+
+def test_disk_dedup_spills():
+
+    words = random_words(1000)
+    dedup = Dedup.create('disk', len(words), memory_limit=100)
+    try:
+        assert list(dedup.wrap(words)) == words
+        assert dedup.num_spilled >= 900
+        # spilled words are still found
+        assert list(dedup.wrap(words[::-1])) == []
+    finally:
+        dedup.close()
+
+
+@pytest.mark.parametrize('backend', ['exact', 'bloom', 'disk'])
+def test_dedup_sized_for_pruned_credit(backend):
+
+    # words outside the length window give their budget to the ones that fit, so the filter has to be sized for that
+    words = random_words(300)
+    options = dict(leet=True, capswap=True, policy=PasswordPolicy(minlength=10), output_size=100000)
+    expected = list(Mangler(words, **options))
+    mangler = Mangler(words, dedup=backend, **options)
+    output = list(mangler)
+    if backend == 'bloom':
+        assert mangler.dedup.seen.capacity >= len(expected)
+        # a few unique words may be dropped
+        assert len(output) >= len(expected) * 0.99
+        assert set(output) <= set(expected)
+    else:
+        assert output == expected
+        assert mangler.dedup.duplicates == 0
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import tracemalloc
+import pytest
+from password_stretcher.lib import mutator
+from password_stretcher.lib.leet import Leet
+from password_stretcher.lib.mutator import ExpansionCache, ranked_indices
+
+
+def leetable_words(num_words, length=16, seed=0):
+    '''
+    words made only of leetable characters, so each one has its own costs
+    '''
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('aiost') for _ in range(length)]).encode())
+    return sorted(words)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+
+    cache = ExpansionCache()
+    monkeypatch.setattr(mutator, 'expansion_cache', cache)
+    return cache
+
+
+def test_expansion_cache_skips_unique_costs(cache):
+
+    words = leetable_words(40)
+    leet = Leet(words, limit=1024)
+    list(leet)
+    assert cache.snapshot() == (0, 40)
+    # nothing was seen twice, so nothing was kept
+    assert not cache.entries
+    assert cache.size == 0
+
+
+def test_expansion_cache_hits(cache):
+
+    words = leetable_words(20, length=8)
+    leet = Leet(words * 3, limit=256)
+    output = list(leet)
+    # a miss the first time, a miss when it's cached the second time, and a hit the third
+    assert cache.snapshot() == (20, 40)
+    assert len(cache.entries) == 20
+    # the cache doesn't change the order
+    assert output == list(Leet(words, limit=256)) * 3
+
+
+def test_expansion_cache_memory_bound(cache):
+
+    cache.max_bytes = 256 * 1024
+    words = leetable_words(60, length=12)
+    leet = Leet(words * 2, limit=256)
+
+    tracemalloc.start()
+    try:
+        list(leet)
+
+        assert cache.size <= cache.max_bytes
+        # least recently used entries were dropped to stay under budget
+        assert 0 < len(cache.entries) < len(words)
+        for entry in cache.entries.values():
+            assert entry.size == entry.estimate_size()
+        assert sum([entry.size for entry in cache.entries.values()]) == cache.size
+
+        # the estimate is in the right ballpark of what's actually held
+        held, _ = tracemalloc.get_traced_memory()
+        cache.clear()
+        held -= tracemalloc.get_traced_memory()[0]
+        assert held < cache.max_bytes * 2
+    finally:
+        tracemalloc.stop()
+
+
+def test_expansion_cache_order_matches_priority_queue():
+
+    cache = ExpansionCache(max_bytes=4096, max_combinations=100)
+    costs = ((0, 100, 200), (0, 50), (0, 10, 400, 500))
+    expected = list(ranked_indices(costs))
+    for _ in range(3):
+        assert list(cache.combinations(costs)) == expected
+    # too big to keep, so it was dropped along the way
+    assert cache.size <= cache.max_bytes
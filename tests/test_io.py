@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import io
+import random
+import pytest
+from password_stretcher.lib.utils import ReadFile, MappedFile, split_lines, read_blocks, detect_compression, open_compressed
+from password_stretcher.lib.output import OutputWriter, OutputFile
+from password_stretcher.lib.errors import CheckpointError
+
+
+compressions = ['gzip', 'xz', 'bz2', 'zstd']
+extensions = {'gzip': '.gz', 'xz': '.xz', 'bz2': '.bz2', 'zstd': '.zst'}
+
+
+def skip_missing(compression):
+
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+
+
+def random_lines(num_lines, seed=0):
+
+    rand = random.Random(seed)
+    return [''.join([rand.choice('abcdefghijklmnopqrstuvwxyz0123456789!@#') for _ in range(rand.randint(1, 20))]).encode() for _ in range(num_lines)]
+
+
+def expected_lines(data):
+    '''
+    what reading <data> line by line gives us
+    '''
+
+    lines = [line.rstrip(b'\r\n') for line in data.split(b'\n')]
+    return [line for line in lines if line]
+
+
+messy = [
+    b'',
+    b'\n',
+    b'one',
+    b'one\n',
+    b'one\ntwo',
+    b'one\ntwo\n',
+    b'one\r\ntwo\r\n',
+    b'one\r\ntwo',
+    b'one\r\ntwo\r',
+    b'\r\n\r\none\r\n\r\n\ntwo\n\n',
+    b'one\r\r\ntwo\rthree\n',
+    b'\xff\xfe\x00bytes\nstay\x00as they are\n',
+]
+
+
+@pytest.mark.parametrize('data', messy)
+def test_split_lines(data):
+
+    assert split_lines(data) == expected_lines(data)
+
+
+@pytest.mark.parametrize('data', messy)
+@pytest.mark.parametrize('block_size', [1, 3, 4096])
+def test_mapped_file(tmp_path, data, block_size):
+
+    if not data:
+        # can't mmap an empty file
+        return
+    filename = tmp_path / 'words.txt'
+    filename.write_bytes(data)
+    with MappedFile(filename) as mapped:
+        assert len(mapped) == len(data)
+        batches = list(mapped.batches(block_size))
+    assert sum(batches, []) == expected_lines(data)
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 100, 1 << 20])
+def test_read_blocks(block_size):
+
+    data = b'\r\n'.join(random_lines(1000)) + b'\nno newline at the end'
+    blocks = list(read_blocks(io.BytesIO(data), block_size))
+    assert b''.join(blocks) == data
+    # every block but the last ends on a line boundary
+    assert all(block.endswith(b'\n') for block in blocks[:-1])
+
+
+@pytest.mark.parametrize('line_ending', [b'\n', b'\r\n'])
+@pytest.mark.parametrize('trailing', [True, False])
+@pytest.mark.parametrize('compression', [None] + compressions)
+def test_read_file(tmp_path, line_ending, trailing, compression):
+
+    lines = random_lines(5000)
+    data = line_ending.join(lines) + (line_ending if trailing else b'')
+    filename = tmp_path / 'words.txt'
+    if compression is None:
+        filename.write_bytes(data)
+    else:
+        skip_missing(compression)
+        with open(filename, 'wb') as f:
+            with open_compressed(f, compression, mode='wb') as compressed:
+                compressed.write(data)
+
+    assert detect_compression(filename) == compression
+    read_file = ReadFile(filename)
+    assert list(read_file) == lines
+    assert 4000 < read_file.estimate_size() < 6000
+
+
+def test_read_empty_file(tmp_path):
+
+    filename = tmp_path / 'empty.txt'
+    filename.write_bytes(b'')
+    assert list(ReadFile(filename)) == []
+    assert detect_compression(filename) is None
+    assert detect_compression(tmp_path / 'missing.txt') is None
+
+
+@pytest.mark.parametrize('compression', [None] + compressions)
+def test_output_file_round_trip(tmp_path, compression):
+
+    if compression is not None:
+        skip_missing(compression)
+    filename = tmp_path / f'output.txt{extensions.get(compression, "")}'
+    lines = random_lines(20000)
+
+    # each flush starts a new compressed stream
+    output = OutputFile(filename)
+    writer = OutputWriter(output, batch_size=3000)
+    writer.write(lines[:10000])
+    output.flush()
+    offset = output.offset
+    writer.write(lines[10000:])
+    writer.close()
+    output.close()
+    assert detect_compression(filename) == compression
+    assert list(ReadFile(filename)) == lines
+
+    # resuming throws away everything after the offset
+    output = OutputFile(filename, offset=offset)
+    assert output.offset == offset
+    writer = OutputWriter(output, batch_size=3000)
+    writer.write(lines[10000:15000])
+    writer.close()
+    output.close()
+    assert list(ReadFile(filename)) == lines[:15000]
+
+
+def test_output_file_resume_errors(tmp_path):
+
+    filename = tmp_path / 'output.txt'
+    with pytest.raises(CheckpointError):
+        OutputFile(filename, offset=0)
+    filename.write_bytes(b'abc\n')
+    with pytest.raises(CheckpointError):
+        OutputFile(filename, offset=100)
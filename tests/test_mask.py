@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from collections import Counter
+from password_stretcher.lib.mangler import Mangler
+from password_stretcher.lib.mask import MaskSet, parse_mask, charsets, read_masks
+from password_stretcher.lib.errors import MaskError
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('aeilostbrdn') for _ in range(rand.randint(3, 7))]).encode())
+    return sorted(words)
+
+
+def test_parse_mask():
+
+    assert parse_mask('?u?l?d') == (frozenset(charsets['u']), frozenset(charsets['l']), frozenset(charsets['d']))
+    # literals and escaped question marks
+    assert parse_mask('a??b') == (frozenset(b'a'), frozenset(b'?'), frozenset(b'b'))
+
+
+def test_custom_charsets():
+
+    masks = MaskSet(['?l?d,?u?1?1', 'abc,?d,XY,?s,?1?2?3?4'])
+    assert masks.masks[0] == (frozenset(charsets['u']), frozenset(charsets['l'] + charsets['d'])) + (frozenset(charsets['l'] + charsets['d']),)
+    assert masks.matches(b'Ab1')
+    assert not masks.matches(b'AB1')
+    assert masks.matches(b'c5Y!')
+    assert not masks.matches(b'd5Y!')
+    # custom charsets can use each other, and commas can be escaped
+    masks = MaskSet(['?d,?1\\,,?2?2'])
+    assert masks.matches(b'1,')
+    assert not masks.matches(b'1a')
+
+
+@pytest.mark.parametrize('mask', ['?x', '?1', '?l?', 'a,b,c,d,e,?1', '?1,?l'])
+def test_malformed_masks(mask):
+
+    with pytest.raises(MaskError):
+        MaskSet([mask])
+
+
+def test_no_masks():
+
+    with pytest.raises(MaskError):
+        MaskSet([])
+
+
+def test_read_masks(tmp_path):
+
+    mask_file = tmp_path / 'test.hcmask'
+    mask_file.write_text('# comment\n?u?l?l\n\n?d,?1?1\n')
+    assert read_masks([str(mask_file), '?l?d']) == ['?u?l?l', '?d,?1?1', '?l?d']
+
+
+def unlimited(mangler):
+
+    for mutator in mangler.mutators[1:]:
+        mutator.limit = 10**9
+    return mangler
+
+
+# append/prepend has lots of rules, so it gets fewer words
+@pytest.mark.parametrize('mutators,num_words', [
+    ({'leet': True}, 20),
+    ({'cap': True}, 20),
+    ({'capswap': True}, 20),
+    ({'pend': True}, 20),
+    ({'leet': True, 'pend': True}, 3),
+    ({'cap': True, 'pend': True}, 3),
+    ({'perm': 2, 'leet': True, 'cap': True}, 12),
+])
+@pytest.mark.parametrize('masks', [
+    ['?l?l?l?l?d?d', '?u?l?l?l?l?d', '?a?a?a?a?a'],
+    ['?l?d?l?l', '?l?l?d?l?l', '?l?d,?1?1?1?1?1?1'],
+])
+def test_pushed_down_masks_match_post_filter(mutators, num_words, masks):
+
+    # as long as the limit doesn't bind, pushing masks down only skips words the filter would drop
+    words = random_words(num_words)
+    mask_set = MaskSet(masks)
+    unfiltered = unlimited(Mangler(list(words), **mutators))
+    expected = Counter([word for word in unfiltered if mask_set.matches(word)])
+
+    output = Counter(unlimited(Mangler(list(words), masks=masks, **mutators)))
+    assert output
+    assert output == expected
+    assert all([mask_set.matches(word) for word in output])
+
+
+def test_masks_with_rules(tmp_path):
+
+    # hashcat rules can't be predicted, so everything is filtered at the end
+    rule_file = tmp_path / 'test.rule'
+    rule_file.write_bytes(b':\nc\n$1\nc $1 $2\n')
+    words = random_words(100)
+    masks = ['?u?l?l?l?d?d', '?l?l?l?l?d', '?u?l?d?l?d']
+    mask_set = MaskSet(masks)
+    unfiltered = Mangler(list(words), output_size=10**9, leet=True, rules=[str(rule_file)])
+    expected = Counter([word for word in unfiltered if mask_set.matches(word)])
+    output = Counter(Mangler(list(words), output_size=10**9, leet=True, rules=[str(rule_file)], masks=masks))
+    assert output
+    assert output == expected
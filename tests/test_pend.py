@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import json
+import pytest
+from password_stretcher.lib.pend import Pend
+
+
+def cache_files(cache_home):
+
+    return list((cache_home / 'password-stretcher').glob('pend-*'))
+
+
+def test_rule_cache_round_trip(tmp_path, monkeypatch):
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    first = Pend([])
+    cached = cache_files(tmp_path)
+    assert len(cached) == 1
+
+    # the cache is plain JSON, not something that can run code when it's loaded
+    with open(cached[0]) as f:
+        cache = json.load(f)
+    assert len(cache['prefixes']) == len(cache['suffixes']) == len(first.prefixes)
+
+    second = Pend([])
+    assert second.prefixes == first.prefixes
+    assert second.suffixes == first.suffixes
+
+
+@pytest.mark.parametrize('contents', [
+    b'',
+    b'\x80\x04\x95 not json',
+    b'[]',
+    b'{"prefixes": ["a"]}',
+    b'{"prefixes": ["a", "b"], "suffixes": ["c"]}',
+    b'{"prefixes": [1], "suffixes": [2]}',
+])
+def test_bad_rule_cache_is_rebuilt(tmp_path, monkeypatch, contents):
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    expected = Pend([])
+    cache_file = cache_files(tmp_path)[0]
+    cache_file.write_bytes(contents)
+
+    with pytest.raises(ValueError):
+        Pend.load_cache(cache_file)
+    pend = Pend([])
+    assert pend.prefixes == expected.prefixes
+    assert pend.suffixes == expected.suffixes
+    # and the broken cache is replaced
+    assert Pend.load_cache(cache_file) == (expected.prefixes, expected.suffixes)
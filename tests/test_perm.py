@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+import itertools
+from collections import Counter
+from password_stretcher.lib.perm import Perm
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(1, 6))]).encode())
+    # not sorted by length
+    return sorted(words)
+
+
+def reference(words, depth, double):
+    '''
+    every permutation, the slow way
+    '''
+
+    if depth > 1:
+        return [b''.join(p) for d in range(1, depth+1) for p in itertools.product(words, repeat=d)]
+    results = []
+    for word in words:
+        results.append(word)
+        if double:
+            results.append(word + word)
+    return results
+
+
+cases = [(depth, double) for depth in (1, 2, 3) for double in (False, True)]
+
+
+@pytest.mark.parametrize('depth,double', cases)
+def test_perm_matches_full_enumeration(depth, double):
+
+    words = random_words(12)
+    perm = Perm(list(words), perm_depth=depth, double=double)
+    full = list(perm)
+
+    expected = reference(words, depth, double)
+    assert len(full) == perm.num_permutations() == len(expected)
+    assert Counter(full) == Counter(expected)
+    if depth > 1:
+        # shortest first, then by number of words
+        lengths = [len(word) for word in full]
+        assert lengths == sorted(lengths)
+    else:
+        assert full == expected
+
+    # random access
+    assert [perm[i] for i in range(len(full))] == full
+    assert perm[-1] == full[-1]
+    with pytest.raises(IndexError):
+        perm[len(full)]
+
+    # ranges
+    rand = random.Random(depth)
+    for _ in range(200):
+        start = rand.randint(0, len(full))
+        stop = rand.randint(start, len(full))
+        assert list(perm.permutations(start, stop)) == full[start:stop]
+        assert list(perm.permutations(start)) == full[start:]
+
+
+@pytest.mark.parametrize('depth,double', cases)
+def test_perm_resumes_from_start(depth, double):
+
+    words = random_words(10)
+    full = list(Perm(list(words), perm_depth=depth, double=double))
+    for start in (0, 1, 7, len(full) // 2, len(full) - 1):
+        perm = Perm(list(words), perm_depth=depth, double=double)
+        perm.start = start
+        assert list(perm) == full[start:]
+
+
+@pytest.mark.parametrize('depth,double', cases)
+def test_window_ranges_cover_every_fit(depth, double):
+
+    words = random_words(12)
+    for sort in (False, True):
+        if sort:
+            words = sorted(words, key=len)
+        perm = Perm(list(words), perm_depth=depth, double=double)
+        full = list(perm)
+        for minlength, maxlength in [(None, None), (4, None), (None, 5), (6, 9), (3, 3), (100, None)]:
+            ranges = perm.window_ranges(minlength, maxlength)
+            covered = set()
+            for start, stop in ranges:
+                assert 0 <= start < stop <= len(full)
+                covered.update(range(start, stop))
+            # in order, without overlapping
+            assert all(a[1] < b[0] for a, b in zip(ranges, ranges[1:]))
+
+            lo = 0 if minlength is None else minlength
+            hi = float('inf') if maxlength is None else maxlength
+            fits = {i for i, word in enumerate(full) if lo <= len(word) <= hi}
+            assert fits <= covered
+            if depth > 1:
+                # blocks are all one length, so nothing else is included
+                assert covered == fits
+
+
+@pytest.mark.parametrize('depth,double', cases)
+@pytest.mark.parametrize('size,first,step', [(7, 0, 1), (7, 2, 3), (64, 1, 2)])
+def test_perm_chunks(depth, double, size, first, step):
+
+    words = random_words(12)
+    full = list(Perm(list(words), perm_depth=depth, double=double))
+    expected = [(c, full[c*size:(c+1)*size]) for c in range(first, -(-len(full) // size), step)]
+
+    perm = Perm(list(words), perm_depth=depth, double=double)
+    assert [(c, list(chunk)) for c, chunk in perm.chunks(size, first=first, step=step)] == expected
+    if depth <= 1:
+        # streamed input is walked instead of indexed
+        perm = Perm(iter(words), perm_depth=depth, double=double)
+        assert [(c, list(chunk)) for c, chunk in perm.chunks(size, first=first, step=step)] == expected
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from password_stretcher.lib.leet import Leet
+from password_stretcher.lib.cap import Cap
+from password_stretcher.lib.mangler import Mangler
+from password_stretcher.lib.policy import PasswordPolicy, PolicyConstraint
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('aeiostbrdnl1') for _ in range(rand.randint(2, 9))]).encode())
+    return sorted(words)
+
+
+def post_filtered(words, policy, **options):
+    '''
+    the policy only checked at the end, without pushing anything down into the mutators
+    '''
+
+    mangler = Mangler(list(words), **options)
+    mangler.policy = policy
+    mangler.policy_exact = False
+    return list(mangler)
+
+
+policies = [
+    PasswordPolicy(minlength=8),
+    PasswordPolicy(minlength=6, maxlength=8),
+    PasswordPolicy(minlength=7, mincharsets=3),
+    PasswordPolicy(required_charsets=['numeric']),
+]
+
+
+# the limits bind, so every bit of budget a pruned word gives back shows up in the output
+@pytest.mark.parametrize('options', [
+    dict(leet=True, output_size=500),
+    dict(capswap=True, output_size=1000),
+    dict(leet=True, capswap=True, output_size=3000),
+    dict(leet=True, capswap=True, weights=True, output_size=3000),
+])
+@pytest.mark.parametrize('policy', policies)
+def test_push_down_matches_post_filter(options, policy):
+
+    options = dict(options)
+    words = random_words(options.pop('num_words', 150))
+    if options.get('weights', False):
+        options = dict(options, weights={word: i % 7 + 1 for i, word in enumerate(words)})
+
+    expected = post_filtered(words, policy, **options)
+    assert expected
+    assert list(Mangler(list(words), policy=policy, **options)) == expected
+
+
+# perm's length window skips whole blocks of permutations without generating them
+@pytest.mark.parametrize('options', [
+    dict(perm=2, leet=True, output_size=5000),
+    dict(perm=2, leet=True, capswap=True, output_size=20000),
+    dict(perm=3, capswap=True, output_size=20000),
+])
+@pytest.mark.parametrize('policy', policies[:3])
+def test_skipped_permutations_give_back_their_budget(options, policy):
+
+    words = random_words(15)
+    mangler = Mangler(list(words), policy=policy, **options)
+    assert mangler.mutators[0].length_window is not None
+    expected = post_filtered(words, policy, **options)
+    assert expected
+    assert list(mangler) == expected
+
+
+@pytest.mark.parametrize('policy', policies[:2])
+def test_push_down_matches_post_filter_with_pend(policy):
+
+    words = random_words(12)
+    options = dict(leet=True, capswap=True, pend=True, output_size=20000)
+    assert list(Mangler(list(words), policy=policy, **options)) == post_filtered(words, policy, **options)
+
+
+def test_pruned_words_give_back_their_budget():
+
+    # the short words can't meet the policy, so the long one gets all of their budget
+    words = [b'bcd', b'xyz', b'password1']
+    output = list(Mangler(words, leet=True, output_size=12, policy=PasswordPolicy(minlength=6)))
+    assert len(output) == 12
+    assert all([len(word) == 9 for word in output])
+
+
+@pytest.mark.parametrize('policy', policies[:3])
+def test_policy_constraint_never_prunes_a_valid_word(policy):
+
+    # a word is only pruned if nothing the later mutators make from it can meet the policy
+    leet = Leet([])
+    cap = Cap([], capswap=True)
+    constraint = PolicyConstraint(policy, [leet, cap])
+    pruned = 0
+    for word in random_words(300):
+        if not constraint(word):
+            pruned += 1
+            results = [c for l in leet.mutate(word) for c in cap.mutate(l)]
+            assert not any([policy.meets_policy(r) for r in results]), word
+    assert pruned
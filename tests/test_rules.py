@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from password_stretcher.lib import rules
+from password_stretcher.lib.rules import Rules, compile_rule, program_length_range
+from password_stretcher.lib.errors import RuleError
+
+
+def run(program, word):
+
+    for function, a, b in program:
+        word = function(word, a, b)
+        if word is None:
+            break
+    return word
+
+
+# examples from the hashcat wiki (https://hashcat.net/wiki/doku.php?id=rule_based_attack)
+# (rule, input, output), where an output of None means the word is rejected
+wiki_examples = [
+    (b':', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'l', b'p@ssW0rd', b'p@ssw0rd'),
+    (b'u', b'p@ssW0rd', b'P@SSW0RD'),
+    (b'c', b'p@ssW0rd', b'P@ssw0rd'),
+    (b'C', b'p@ssW0rd', b'p@SSW0RD'),
+    (b't', b'p@ssW0rd', b'P@SSw0RD'),
+    (b'T3', b'p@ssW0rd', b'p@sSW0rd'),
+    (b'r', b'p@ssW0rd', b'dr0Wss@p'),
+    (b'd', b'p@ssW0rd', b'p@ssW0rdp@ssW0rd'),
+    (b'p2', b'p@ssW0rd', b'p@ssW0rdp@ssW0rdp@ssW0rd'),
+    (b'f', b'p@ssW0rd', b'p@ssW0rddr0Wss@p'),
+    (b'{', b'p@ssW0rd', b'@ssW0rdp'),
+    (b'}', b'p@ssW0rd', b'dp@ssW0r'),
+    (b'$1', b'p@ssW0rd', b'p@ssW0rd1'),
+    (b'^1', b'p@ssW0rd', b'1p@ssW0rd'),
+    (b'[', b'p@ssW0rd', b'@ssW0rd'),
+    (b']', b'p@ssW0rd', b'p@ssW0r'),
+    (b'D3', b'p@ssW0rd', b'p@sW0rd'),
+    (b'x04', b'p@ssW0rd', b'p@ss'),
+    (b'O12', b'p@ssW0rd', b'psW0rd'),
+    (b'i4!', b'p@ssW0rd', b'p@ss!W0rd'),
+    (b'o3$', b'p@ssW0rd', b'p@s$W0rd'),
+    (b"'6", b'p@ssW0rd', b'p@ssW0'),
+    (b'ss$', b'p@ssW0rd', b'p@$$W0rd'),
+    (b'@s', b'p@ssW0rd', b'p@W0rd'),
+    (b'z2', b'p@ssW0rd', b'ppp@ssW0rd'),
+    (b'Z2', b'p@ssW0rd', b'p@ssW0rddd'),
+    (b'q', b'p@ssW0rd', b'pp@@ssssWW00rrdd'),
+    (b'E', b'p@ssW0rd w0rld', b'P@ssw0rd W0rld'),
+    (b'e-', b'p@ssW0rd-w0rld', b'P@ssw0rd-W0rld'),
+    (b'k', b'p@ssW0rd', b'@pssW0rd'),
+    (b'K', b'p@ssW0rd', b'p@ssW0dr'),
+    (b'*34', b'p@ssW0rd', b'p@sWs0rd'),
+    (b'L2', b'p@ssW0rd', b'p@\xe6sW0rd'),
+    (b'R2', b'p@ssW0rd', b'p@9sW0rd'),
+    (b'+2', b'p@ssW0rd', b'p@tsW0rd'),
+    (b'-1', b'p@ssW0rd', b'p?ssW0rd'),
+    (b'.1', b'p@ssW0rd', b'psssW0rd'),
+    (b',1', b'p@ssW0rd', b'ppssW0rd'),
+    (b'y2', b'p@ssW0rd', b'p@p@ssW0rd'),
+    (b'Y2', b'p@ssW0rd', b'p@ssW0rdrd'),
+    (b'<G', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'<5', b'p@ssW0rd', None),
+    (b'>5', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'>G', b'p@ssW0rd', None),
+    (b'_7', b'p@ssW0rd', None),
+    (b'_8', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'!z', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'!@', b'p@ssW0rd', None),
+    (b'/p', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'/z', b'p@ssW0rd', None),
+    (b'(p', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'(P', b'p@ssW0rd', None),
+    (b')d', b'p@ssW0rd', b'p@ssW0rd'),
+    (b')D', b'p@ssW0rd', None),
+    (b'=1@', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'=1p', b'p@ssW0rd', None),
+    (b'%2s', b'p@ssW0rd', b'p@ssW0rd'),
+    (b'%3s', b'p@ssW0rd', None),
+]
+
+
+@pytest.mark.parametrize('rule,word,expected', wiki_examples)
+def test_rules_match_hashcat(rule, word, expected):
+
+    assert run(compile_rule(rule), word) == expected
+
+
+def test_rules_past_end_of_word():
+
+    # like hashcat, positions past the end leave the word unchanged
+    for rule in [b'T9', b'D9', b'x39', b'O39', b'i9!', b'o9!', b'*09', b'+9', b'Y9']:
+        assert run(compile_rule(rule), b'abc') == b'abc'
+
+
+def random_rule(rand):
+
+    steps = []
+    for _ in range(rand.randint(1, 6)):
+        char = rand.choice(list(rules.rule_functions))
+        _, arg_types = rules.rule_functions[char]
+        args = b''
+        for arg_type in arg_types:
+            if arg_type == 'N':
+                args += rand.choice(b'0123456789AB').to_bytes(1, 'big')
+            else:
+                args += rand.choice(b'aAsS1$ -').to_bytes(1, 'big')
+        steps.append(char + args)
+    return b' '.join(steps)
+
+
+def test_optimize_doesnt_change_results(monkeypatch):
+
+    rand = random.Random(0)
+    words = [b'', b'a', b'Password', b'p@ssW0rd w0rld', b'S3cret-s3cret$']
+    random_rules = [random_rule(rand) for _ in range(20000)]
+    optimized = [compile_rule(rule) for rule in random_rules]
+
+    monkeypatch.setattr(rules, 'optimize', tuple)
+    for rule, program in zip(random_rules, optimized):
+        unoptimized = compile_rule(rule)
+        for word in words:
+            assert run(program, word) == run(unoptimized, word), rule
+
+
+def test_optimize_merges_equivalent_rules():
+
+    assert compile_rule(b'^a $1 ^b $2') == compile_rule(b'^a^b$1$2')
+    assert compile_rule(b'l u c') == compile_rule(b'c')
+    assert compile_rule(b'r r') == compile_rule(b':') == ()
+    assert compile_rule(b'{ }') == ()
+
+
+def test_program_length_range():
+
+    rand = random.Random(1)
+    words = [b'', b'a', b'Password', b'p@ssW0rd w0rld']
+    for _ in range(2000):
+        program = compile_rule(random_rule(rand))
+        lo, hi = program_length_range(program)
+        for word in words:
+            result = run(program, word)
+            if result is not None:
+                assert lo <= len(result) - len(word) <= hi
+
+
+@pytest.mark.parametrize('rule', [b'M', b'X012', b'4', b'6', b'Q', b'T', b'$', b'i1', b'sa', b'T#', b'x0', b'p~'])
+def test_invalid_rules_raise(rule):
+
+    with pytest.raises(RuleError):
+        compile_rule(rule)
+
+
+def test_rule_file(tmp_path):
+
+    rule_file = tmp_path / 'test.rule'
+    rule_file.write_bytes(b'# comment\n:\nc\nl c\n$1\nM\n\nc $1\n')
+    mutator = Rules([b'password'], [str(rule_file)])
+    # "l c" does the same as "c", and "M" isn't supported
+    assert mutator.rules == [b':', b'c', b'$1', b'c $1']
+    assert mutator.skipped == [b'M']
+    assert list(mutator) == [b'password', b'Password', b'password1', b'Password1']
+
+
+def test_rule_file_without_usable_rules(tmp_path):
+
+    rule_file = tmp_path / 'test.rule'
+    rule_file.write_bytes(b'M\nX012\n')
+    with pytest.raises(RuleError):
+        Rules([b'password'], [str(rule_file)])
+    with pytest.raises(RuleError):
+        Rules([b'password'], [str(tmp_path / 'missing.rule')])
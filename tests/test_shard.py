@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from collections import Counter
+from password_stretcher.lib.mangler import Mangler
+from password_stretcher.lib.policy import PasswordPolicy
+from password_stretcher.lib.utils import parse_shard
+from password_stretcher.lib.errors import InputListError
+
+
+def random_words(num_words, seed=0):
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(3, 8))]).encode())
+    return sorted(words)
+
+
+words = random_words(50)
+# the policy prunes a lot, so the carry-over between words matters
+options = dict(perm=2, leet=True, cap=True, policy=PasswordPolicy(minlength=9), output_size=8000)
+
+
+@pytest.mark.parametrize('shards,workers', [(2, 1), (3, 1), (2, 2)])
+def test_shards_add_up_to_workers(shards, workers):
+
+    # N shards with M workers each produce the same words as one run with N*M workers
+    # (not a single-process run, since each worker carries its unused budget over separately)
+    expected = list(Mangler(list(words), workers=shards * workers, **options))
+    output = []
+    for k in range(1, shards+1):
+        shard = list(Mangler(list(words), workers=workers, shard=(k, shards), **options))
+        assert shard
+        output += shard
+
+    assert Counter(output) == Counter(expected)
+
+
+def test_shards_are_disjoint_slices():
+
+    # without mutators, the shards are just slices of the permutations
+    expected = list(Mangler(list(words), perm=2))
+    output = [list(Mangler(list(words), perm=2, shard=(k, 3))) for k in range(1, 4)]
+    assert sorted(sum(output, [])) == sorted(expected)
+    assert abs(len(output[0]) - len(output[2])) <= 256
+
+
+def test_shard_estimate():
+
+    total = Mangler(list(words), perm=2).estimate()['words']
+    shards = [Mangler(list(words), perm=2, shard=(k, 3)).estimate()['words'] for k in range(1, 4)]
+    assert sum(shards) == total
+
+
+@pytest.mark.parametrize('spec,expected', [('1/1', (1, 1)), ('2/4', (2, 4)), ('4/4', (4, 4))])
+def test_parse_shard(spec, expected):
+
+    assert parse_shard(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['', '1', '0/2', '3/2', '-1/2', '1/0', 'a/b', '1/2/3', '1.5/2'])
+def test_parse_invalid_shard(spec):
+
+    with pytest.raises(ValueError):
+        parse_shard(spec)
+
+
+@pytest.mark.parametrize('shard', [(0, 2), (3, 2), (1, 0)])
+def test_mangler_rejects_invalid_shard(shard):
+
+    with pytest.raises(InputListError):
+        Mangler(list(words), perm=2, shard=shard)
+
+
+def test_workers_need_fork(monkeypatch):
+
+    # the chain can't be pickled, so there's no falling back to spawn
+    monkeypatch.setattr('multiprocessing.get_all_start_methods', lambda: ['spawn'])
+    with pytest.raises(InputListError):
+        Mangler(list(words), perm=2, workers=2)
+    # one process is fine
+    assert list(Mangler(list(words), perm=2, workers=1))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import time
+import hashlib
+import threading
+import pytest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from password_stretcher.lib.spider import Spider, Parser
+from password_stretcher.lib.spider_cache import SpiderCache
+from password_stretcher.lib.errors import SpiderError
+
+
+home_page = '''<!doctype html>
+<html>
+<head>
+    <title>Welcome to Stretchville</title>
+    <meta name="description" content="Artisanal passwords">
+    <meta name="keywords" content="hunter, tomato">
+    <meta name="viewport" content="width=device-width">
+    <style>.hidden { display: none }</style>
+    <script>var secretvariable = "javascript";</script>
+</head>
+<body class="bodyclass">
+    <!-- commented out -->
+    <img src="/logo.png" alt="Gorgonzola logo" title="Mascarpone">
+    <input placeholder="Pecorino">
+    <p>Visible paragraph about Tuscany &amp; Umbria</p>
+    <a href="/a">first</a>
+    <a href="b">second</a>
+    <a href="/a#fragment">same page</a>
+    <a href="http://example.com/">elsewhere</a>
+</body>
+</html>'''
+
+pages = {
+    '/': home_page,
+    '/a': '<p>Alpha page</p><a href="/c">deeper</a>',
+    '/b': '<p>Bravo page</p>',
+    '/c': '<p>Charlie page</p>',
+    '/slow': '<p>Slowpoke</p>' + ''.join([f'<a href="/slow{i}">{i}</a>' for i in range(8)]),
+    '/hang': '<p>Neverland</p>',
+    '/timeouts': '<p>Timeouts</p><a href="/hang">hang</a><a href="/b">bravo</a>',
+}
+for i in range(8):
+    pages[f'/slow{i}'] = f'<p>Sluggish</p>'
+
+
+class Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        # path --> [status codes]
+        self.requests = dict()
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self):
+
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count(self, status):
+
+        return sum([codes.count(status) for codes in self.requests.values()])
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith('/slow'):
+                time.sleep(.2)
+            elif self.path == '/hang':
+                time.sleep(2)
+            self.respond()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def respond(self):
+
+        page = pages.get(self.path, None)
+        if page is None:
+            status, body = 404, b'not found'
+        else:
+            status, body = 200, page.encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if status == 200 and self.headers.get('If-None-Match', None) == etag:
+            status, body = 304, b''
+
+        with self.server.lock:
+            self.server.requests.setdefault(self.path, []).append(status)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+
+        pass
+
+
+@pytest.fixture
+def site():
+
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def crawl(url, **options):
+
+    spider = Spider(url, **options)
+    spider.start()
+    return spider
+
+
+def test_parser_extracts_visible_text():
+
+    links, words = Parser().injest(home_page)
+    assert sorted(links) == ['/a', '/a#fragment', 'b', 'http://example.com/']
+    for word in ['Welcome', 'Stretchville', 'Artisanal', 'passwords', 'hunter', 'tomato', 'Gorgonzola', 'Mascarpone', 'Pecorino', 'Visible', 'Tuscany', 'Umbria']:
+        assert words[word] >= 1, word
+    for word in ['hidden', 'display', 'secretvariable', 'javascript', 'commented', 'bodyclass', 'png', 'width', 'device', 'viewport', 'html']:
+        assert word not in words, word
+
+    # without attributes, only the visible text counts
+    _, words = Parser(attrs=False).injest(home_page)
+    assert 'Gorgonzola' not in words and 'Artisanal' not in words
+    assert words['Tuscany'] == 1
+
+
+@pytest.mark.parametrize('parsers', [0, 2])
+def test_spider_follows_links(site, parsers):
+
+    spider = crawl(site.url + '/', depth=2, parsers=parsers)
+    # the fragment is the same page, and example.com is a different domain
+    assert sorted(site.requests) == ['/', '/a', '/b']
+    assert spider.pages_fetched == 3
+    for word in ['Stretchville', 'Gorgonzola', 'Alpha', 'Bravo']:
+        assert spider.words[word] >= 1
+    assert b'Alpha' in list(spider)
+
+    spider = crawl(site.url + '/', depth=3, parsers=parsers)
+    assert site.requests['/c'] == [200]
+    assert spider.words['Charlie'] == 1
+
+
+@pytest.mark.parametrize('per_host', [1, 2, 3])
+def test_spider_per_host_limit(site, per_host):
+
+    spider = crawl(site.url + '/slow', depth=2, threads=8, per_host=per_host)
+    assert spider.pages_fetched == 9
+    assert site.max_active == per_host
+
+
+def test_spider_max_pages(site):
+
+    spider = crawl(site.url + '/slow', depth=2, max_pages=4)
+    assert spider.pages_fetched == 4
+    assert sum([len(codes) for codes in site.requests.values()]) == 4
+
+
+def test_spider_timeout(site):
+
+    start = time.monotonic()
+    spider = crawl(site.url + '/timeouts', depth=2, timeout=.5)
+    assert time.monotonic() - start < 1.9
+    assert spider.errors == 1
+    assert spider.pages_fetched == 2
+    assert spider.words['Bravo'] == 1
+    assert 'Neverland' not in spider.words
+
+    # the first page has to work
+    with pytest.raises(SpiderError):
+        crawl(site.url + '/hang', depth=2, timeout=.5)
+
+
+def test_spider_cache_revalidates(site, tmp_path):
+
+    cache_file = tmp_path / 'spider.sqlite'
+    first = crawl(site.url + '/', depth=2, cache=SpiderCache(cache_file, ttl=0))
+    assert site.count(200) == 3
+    assert first.pages_cached == 0
+
+    # expired, so each page is asked for again, but only if it changed
+    second = crawl(site.url + '/', depth=2, cache=SpiderCache(cache_file, ttl=0))
+    assert site.count(200) == 3
+    assert site.count(304) == 3
+    assert second.pages_cached == 3
+    assert second.pages_fetched == 0
+    assert second.words == first.words
+
+    # fresh, so there's no need to ask
+    third = crawl(site.url + '/', depth=2, cache=SpiderCache(cache_file, ttl=3600))
+    assert site.count(200) + site.count(304) == 6
+    assert third.pages_cached == 3
+    assert third.words == first.words
+
+
+def test_spider_cache_refetches_changed_pages(site, tmp_path, monkeypatch):
+
+    cache_file = tmp_path / 'spider.sqlite'
+    crawl(site.url + '/', depth=2, cache=SpiderCache(cache_file, ttl=0))
+    monkeypatch.setitem(pages, '/b', '<p>Changed page</p>')
+    spider = crawl(site.url + '/', depth=2, cache=SpiderCache(cache_file, ttl=0))
+    assert site.requests['/b'] == [200, 200]
+    assert spider.words['Changed'] == 1
+    assert 'Bravo' not in spider.words
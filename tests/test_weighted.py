@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# by TheTechromancer
+
+import random
+import pytest
+from password_stretcher.lib.mangler import Mangler
+
+
+def skewed_counts(num_words, seed=0):
+    '''
+    {word: count}, with a few very common words and a long tail of rare ones (like a spidered website)
+    '''
+
+    rand = random.Random(seed)
+    words = set()
+    while len(words) < num_words:
+        words.add(''.join([rand.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rand.randint(4, 9))]).encode())
+    return {word: int(10000 / (i+1) ** 1.2) + 1 for i, word in enumerate(sorted(words))}
+
+
+@pytest.mark.parametrize('limit', [3000, 100000])
+@pytest.mark.parametrize('mutators', [
+    {'leet': True, 'capswap': True, 'pend': True},
+    {'leet': True, 'pend': True},
+    {'pend': True},
+])
+def test_weighted_output_stays_within_limit(limit, mutators):
+
+    counts = skewed_counts(200)
+    mangler = Mangler(list(counts), output_size=limit, weights=counts, **mutators)
+    assert len(list(mangler)) <= limit
+
+
+def test_weighted_multipliers_average_out():
+
+    # the product of each word's multipliers averages out to 1
+    counts = skewed_counts(200)
+    mangler = Mangler(list(counts), output_size=100000, leet=True, capswap=True, pend=True, weights=counts)
+    products = []
+    for word in counts:
+        products.append(mangler.weights[word] ** len(mangler.mutators[1:]))
+    assert sum(products) / len(products) == pytest.approx(1)
+
+
+def test_weighted_limit_with_many_rare_words():
+
+    # every word gets at least one mutation, however rare it is
+    counts = {b'rare%05d' % i: 1 for i in range(20000)}
+    counts[b'common'] = 10 ** 9
+    mangler = Mangler(list(counts), output_size=10000, leet=True, capswap=True, pend=True, weights=counts)
+    assert len(list(mangler)) <= 10000